@@ -0,0 +1,186 @@
+from __future__ import (  # pylint: disable=unused-variable
+    absolute_import,
+    division,
+    print_function,
+)
+
+__metaclass__ = type  # pylint: disable=unused-variable
+
+import io
+import json
+import os
+from os.path import dirname, abspath, join
+import sys
+
+from ansible.errors import AnsibleActionFail
+from ansible.module_utils import basic
+from ansible.plugins.action import ActionBase
+
+ROLE_PATH = dirname(dirname(abspath(__file__)))
+
+# Modules loaded into this worker, keyed by name. Every module shares the
+# same samson_utils and with it the connection pool and listing cache.
+_loaded = {}
+
+
+def load_source(name, path):
+    if sys.version_info.major == 3:
+        import importlib.util  # pylint: disable=import-outside-toplevel
+
+        spec = importlib.util.spec_from_file_location(name, path)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        return module
+
+    import imp  # pylint: disable=import-outside-toplevel, import-error
+
+    return imp.load_source(name, path)
+
+
+# Every module_util comes after the ones it imports
+MODULE_UTILS = (
+    "samson_connections",
+    "samson_cache",
+    "samson_listing",
+    "samson_utils",
+    "samson_profile",
+    "samson_html",
+    "samson_snapshot",
+    "samson_deploys",
+)
+
+
+def load_samson_utils():
+    for util in MODULE_UTILS:
+        name = "ansible.module_utils." + util
+        if name not in sys.modules:
+            path = join(ROLE_PATH, "module_utils", util + ".py")
+            sys.modules[name] = load_source(name, path)
+            setattr(sys.modules["ansible.module_utils"], util, sys.modules[name])
+    return sys.modules["ansible.module_utils.samson_utils"]
+
+
+def run_in_process(module, args):
+    """Runs a module's main() in this process and returns its result.
+
+    AnsibleModule reads its arguments from basic._ANSIBLE_ARGS, prints the
+    result as JSON and exits, so we feed it the arguments, capture stdout and
+    catch the exit.
+    """
+    basic._ANSIBLE_ARGS = json.dumps(  # pylint: disable=protected-access
+        {"ANSIBLE_MODULE_ARGS": args}
+    ).encode("utf-8")
+    if hasattr(basic, "_ANSIBLE_PROFILE"):
+        basic._ANSIBLE_PROFILE = "legacy"  # pylint: disable=protected-access
+
+    stdout = sys.stdout
+    sys.stdout = io.StringIO() if sys.version_info.major == 3 else io.BytesIO()
+    try:
+        module.main()
+    except SystemExit:
+        pass
+    finally:
+        output = sys.stdout.getvalue()
+        sys.stdout = stdout
+        basic._ANSIBLE_ARGS = None  # pylint: disable=protected-access
+
+    for line in reversed(output.strip().splitlines()):
+        if line.startswith("{"):
+            return json.loads(line)
+    return dict(failed=True, msg="Module produced no result", module_stdout=output)
+
+
+class ActionModule(ActionBase):
+    """Runs Samson modules on the controller, inside the worker process.
+
+    Shipping a module to a host means building an AnsiballZ payload, starting
+    a fresh Python and importing Ansible for every task. This plugin imports
+    the module once and calls it directly instead. A `batch` of modules runs
+    in a single task and shares one connection pool and listing cache.
+
+        - samson:
+            module: samson_stage
+            args: {...}
+
+        - samson:
+            defaults: {url: ..., token: ...}
+            batch:
+              - samson_project: {...}
+              - samson_stage: {...}
+    """
+
+    TRANSFERS_FILES = False
+    _VALID_ARGS = frozenset(("module", "args", "batch", "defaults"))
+
+    def run(self, tmp=None, task_vars=None):
+        result = super(ActionModule, self).run(tmp, task_vars)
+        del tmp
+
+        task_args = self._task.args
+        defaults = task_args.get("defaults") or {}
+        if task_args.get("module"):
+            calls = [(task_args["module"], task_args.get("args") or {})]
+        elif task_args.get("batch"):
+            calls = [self.parse_batch_item(item) for item in task_args["batch"]]
+        else:
+            raise AnsibleActionFail("samson requires either `module` or `batch`")
+
+        load_samson_utils()
+        results = []
+        for name, args in calls:
+            module_args = dict(defaults)
+            module_args.update(args)
+            module_args.update(self.internal_args(name))
+            module_result = run_in_process(self.load_module(name), module_args)
+            module_result["module"] = name
+            results.append(module_result)
+            if module_result.get("failed"):
+                break
+
+        if "batch" not in task_args:
+            result.update(results[0])
+            del result["module"]
+            return result
+
+        result["results"] = results
+        result["changed"] = any(r.get("changed") for r in results)
+        failed = [r for r in results if r.get("failed")]
+        if failed:
+            result["failed"] = True
+            result["msg"] = "{} failed: {}".format(
+                failed[0]["module"], failed[0].get("msg")
+            )
+        return result
+
+    @staticmethod
+    def parse_batch_item(item):
+        if "module" in item:
+            return item["module"], item.get("args") or {}
+        if len(item) != 1:
+            raise AnsibleActionFail(
+                "Batch items take the form `{module_name: {args}}`, got %s" % list(item)
+            )
+        name = list(item)[0]
+        return name, item[name] or {}
+
+    def internal_args(self, name):
+        return {
+            "_ansible_check_mode": bool(self._play_context.check_mode),
+            "_ansible_diff": bool(self._play_context.diff),
+            "_ansible_no_log": bool(self._play_context.no_log),
+            "_ansible_verbosity": self._display.verbosity,
+            "_ansible_module_name": name,
+        }
+
+    def load_module(self, name):
+        if not name.startswith("samson_"):
+            raise AnsibleActionFail("samson only runs samson_* modules, got %s" % name)
+
+        if name not in _loaded:
+            path = self._shared_loader_obj.module_loader.find_plugin(name)
+            if not path or not path.endswith(".py"):
+                path = join(ROLE_PATH, "library", name + ".py")
+            if not os.path.exists(path):
+                raise AnsibleActionFail("Couldn't find module %s" % name)
+            _loaded[name] = load_source("ansible_samson_" + name, path)
+        return _loaded[name]
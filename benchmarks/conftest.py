@@ -0,0 +1,51 @@
+import importlib.util
+from os.path import dirname, abspath, join
+
+import pytest
+
+from fake_samson import FakeSamson
+
+ROLE_PATH = dirname(dirname(abspath(__file__)))
+
+
+def load_source(name, path):
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+# The action plugin already knows how to run a module in this process, which
+# keeps Ansible's start-up cost out of the measurements
+action_plugin = load_source(
+    "ansible_samson_action_plugin", join(ROLE_PATH, "action_plugins", "samson.py")
+)
+samson_utils = action_plugin.load_samson_utils()
+
+
+@pytest.fixture(scope="session")
+def samson():
+    server = FakeSamson().start()
+    yield server
+    server.stop()
+
+
+@pytest.fixture
+def run_module(samson):
+    """Runs a module against the fake Samson as a fresh process would."""
+    modules = {}
+
+    def run(module_name, **args):
+        if module_name not in modules:
+            path = join(ROLE_PATH, "library", module_name + ".py")
+            modules[module_name] = load_source("ansible_samson_" + module_name, path)
+
+        # Nothing carries over between runs of separate tasks. samson_client
+        # resets the rest, only the idle connections are kept for a batch.
+        samson_utils._connections.clear()  # pylint: disable=protected-access
+
+        args = dict(dict(url=samson.url, token="token"), **args)
+        args["_ansible_module_name"] = module_name
+        return action_plugin.run_in_process(modules[module_name], args)
+
+    return run
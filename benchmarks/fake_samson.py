@@ -0,0 +1,610 @@
+"""An in-process stand-in for the parts of the Samson API the modules use.
+
+It serves the JSON endpoints for projects, stages, commands, webhooks and
+deploys and the HTML form endpoints environments and deploy groups are
+written through.
+Every request is counted, along with the bytes and connections it used.
+
+    samson = FakeSamson().start()
+    samson.store.add_project("dotfiles")
+    ...
+    samson.stop()
+"""
+
+import hashlib
+import itertools
+import json
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+ERROR_PAGE = """<html><body>
+<div class="alert alert-danger">
+<p>There was an error saving your changes</p>
+<ul>{}</ul>
+</div>
+</body></html>
+"""
+
+FORM_PAGE = "<html><body><form>{}</form></body></html>"
+
+
+def slugify(name):
+    return re.sub(r"[\s_]+", "-", name.strip()).lower()
+
+
+class Store:
+    """The entities the fake server holds."""
+
+    def __init__(self):
+        self.ids = itertools.count(1)
+        self.projects = {}
+        # Stages and webhooks are keyed by project id
+        self.stages = {}
+        self.webhooks = {}
+        self.outbound_webhooks = {}
+        self.commands = {}
+        self.environments = {}
+        self.deploy_groups = {}
+        # Deploys are pending for a quarter of `deploy_duration` seconds and
+        # then run until it's up. References starting with `broken` fail.
+        self.deploys = {}
+        self.deploy_duration = 0.2
+        # Lines of output a deploy writes while it runs
+        self.deploy_output_lines = 100
+        self.lock = threading.RLock()
+
+    def next_id(self):
+        return next(self.ids)
+
+    def add_project(self, permalink, **fields):
+        project = dict(
+            id=self.next_id(),
+            permalink=permalink,
+            name=permalink,
+            repository_url="https://github.com/samson/{}".format(permalink),
+            created_at="2020-01-01",
+            updated_at="2020-01-01",
+        )
+        project.update(fields)
+        self.projects[permalink] = project
+        return project
+
+    def add_stage(self, project, permalink, **fields):
+        stage = dict(
+            id=self.next_id(),
+            project_id=project["id"],
+            permalink=permalink,
+            name=permalink,
+            command_ids=[],
+            deploy_group_ids=[],
+        )
+        stage.update(fields)
+        self.stages.setdefault(project["id"], {})[permalink] = stage
+        return stage
+
+    def add_command(self, command, **fields):
+        item = dict(id=self.next_id(), command=command, project_id=None)
+        item.update(fields)
+        self.commands[item["id"]] = item
+        return item
+
+    def add_hook(self, kind, project, **fields):
+        hook = dict(id=self.next_id(), project_id=project["id"])
+        hook.update(fields)
+        getattr(self, kind).setdefault(project["id"], {})[hook["id"]] = hook
+        return hook
+
+    def add_deploy(self, project, stage, reference):
+        deploy = dict(
+            id=self.next_id(),
+            project_id=project["id"],
+            stage_id=stage["id"],
+            reference=reference,
+            status="pending",
+        )
+        self.deploys[deploy["id"]] = dict(deploy=deploy, started_at=time.time())
+        return deploy
+
+    def deploy_status(self, deploy_id):
+        entry = self.deploys[deploy_id]
+        elapsed = time.time() - entry["started_at"]
+        deploy = entry["deploy"]
+        if elapsed >= self.deploy_duration:
+            failed = deploy["reference"].startswith("broken")
+            deploy["status"] = "failed" if failed else "succeeded"
+        elif elapsed >= self.deploy_duration / 4:
+            deploy["status"] = "running"
+        return deploy
+
+    def deploy_output(self, deploy_id):
+        """The output written so far, growing with the deploy's progress."""
+        entry = self.deploys[deploy_id]
+        elapsed = time.time() - entry["started_at"]
+        progress = min(elapsed / self.deploy_duration, 1) if self.deploy_duration else 1
+        lines = int(self.deploy_output_lines * progress)
+        return "".join(
+            "deploy {} step {}\n".format(deploy_id, i) for i in range(lines)
+        ).encode()
+
+    def add_html_item(self, kind, permalink, **fields):
+        item = dict(id=self.next_id(), permalink=permalink, name=permalink)
+        item.update(fields)
+        getattr(self, kind)[permalink] = item
+        return item
+
+
+class FakeSamson:
+    def __init__(self, page_size=None):
+        self.store = Store()
+        # Paginate listings with Link headers when set
+        self.page_size = page_size
+        # Send the Link targets as paths instead of full URLs
+        self.relative_links = False
+        self.requests = []
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.connections = 0
+        self.faults = []
+        handler = type("BoundHandler", (Handler,), {"samson": self})
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        return "http://127.0.0.1:{}".format(self.server.server_port)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def fail_next(self, method, status, headers=None, processed=False):
+        """Answers the next `method` request with `status` instead.
+
+        With `processed` the request still takes effect, like a write whose
+        response got lost on its way back.
+        """
+        self.faults.append(
+            dict(method=method, status=status, headers=headers, processed=processed)
+        )
+
+    def take_fault(self, method):
+        for fault in self.faults:
+            if fault["method"] == method:
+                self.faults.remove(fault)
+                return fault
+        return None
+
+    def reset_counters(self):
+        self.requests = []
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.connections = 0
+
+    def counters(self):
+        return dict(
+            requests=len(self.requests),
+            writes=len([r for r in self.requests if r[0] != "GET"]),
+            bytes_sent=self.bytes_sent,
+            bytes_received=self.bytes_received,
+            connections=self.connections,
+        )
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Send headers and body without waiting for the client's delayed ACK
+    disable_nagle_algorithm = True
+    samson = None
+
+    def log_message(self, *args):  # pylint: disable=arguments-differ
+        pass
+
+    def setup(self):
+        super().setup()
+        self.samson.connections += 1
+
+    def do_GET(self):
+        self.dispatch("GET")
+
+    def do_POST(self):
+        self.dispatch("POST")
+
+    def do_PATCH(self):
+        self.dispatch("PATCH")
+
+    def do_DELETE(self):
+        self.dispatch("DELETE")
+
+    @property
+    def store(self):
+        return self.samson.store
+
+    def dispatch(self, method):
+        length = int(self.headers.get("Content-Length") or 0)
+        raw = self.rfile.read(length) if length else b""
+        self.samson.bytes_received += len(raw)
+        self.samson.requests.append((method, self.path))
+        body = json.loads(raw) if raw else {}
+        path = urlsplit(self.path).path
+        with self.store.lock:
+            fault = self.samson.take_fault(method)
+            if fault is None:
+                return self.route(method, path, body)
+            if fault["processed"]:
+                # Apply the request but drop its response
+                self.send = lambda *args, **kwargs: None
+                self.route(method, path, body)
+                del self.send
+            return self.send(fault["status"], headers=fault["headers"])
+
+    def route(self, method, path, body):
+        for pattern, handlers in ROUTES:
+            match = re.match(pattern + "$", path)
+            if match and method in handlers:
+                return handlers[method](self, body, *match.groups())
+        return self.send(404, {"status": 404, "error": "Not Found"})
+
+    def send(self, status, payload=None, headers=None, html=None, text=None):
+        if html is not None:
+            data = html.encode()
+            content_type = "text/html"
+        elif text is not None:
+            data = text
+            content_type = "text/plain"
+        elif payload is not None:
+            data = json.dumps(payload).encode()
+            content_type = "application/json"
+        else:
+            data = b""
+            content_type = "text/plain"
+
+        headers = dict(headers or {})
+        if self.command == "GET" and status == 200 and payload is not None:
+            etag = '"{}"'.format(hashlib.sha1(data).hexdigest())
+            headers["ETag"] = etag
+            if self.headers.get("If-None-Match") == etag:
+                status, data = 304, b""
+
+        self.samson.bytes_sent += len(data)
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        if status != 304:
+            self.send_header("Content-Length", str(len(data)))
+        for key, value in headers.items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def send_list(self, key, items):
+        page_size = self.samson.page_size
+        if not page_size:
+            return self.send(200, {key: items})
+
+        query = parse_qs(urlsplit(self.path).query)
+        page = int(query.get("page", ["1"])[0])
+        start = (page - 1) * page_size
+        headers = {}
+        if start + page_size < len(items):
+            path = urlsplit(self.path).path
+            base = "" if self.samson.relative_links else self.samson.url
+            link = '<{}{}?page={}>; rel="next"'.format(base, path, page + 1)
+            headers["Link"] = link
+        return self.send(200, {key: items[start : start + page_size]}, headers=headers)
+
+    def redirect(self, location):
+        self.send(302, headers={"Location": self.samson.url + location})
+
+    def not_found(self):
+        return self.send(404, {"status": 404})
+
+    # Projects
+
+    def list_projects(self, _body):
+        return self.send_list("projects", list(self.store.projects.values()))
+
+    def create_project(self, body):
+        if not body.get("name"):
+            return self.send(422, {"errors": {"name": ["can't be blank"]}})
+        fields = dict((k, v) for k, v in body.items() if k != "permalink")
+        project = self.store.add_project(slugify(body["name"]), **fields)
+        return self.send(201, {"project": project})
+
+    def find_project(self, permalink):
+        project = self.store.projects.get(permalink)
+        if project is None and permalink.isdigit():
+            for candidate in self.store.projects.values():
+                if candidate["id"] == int(permalink):
+                    return candidate
+        return project
+
+    def show_project(self, _body, permalink):
+        project = self.find_project(permalink)
+        if not project:
+            return self.not_found()
+        return self.send(200, {"project": project})
+
+    def update_project(self, body, permalink):
+        project = self.store.projects.pop(permalink, None)
+        if not project:
+            return self.not_found()
+        project.update((k, v) for k, v in body.items() if k not in ("id", "created_at"))
+        self.store.projects[project["permalink"]] = project
+        return self.send(200, {"project": project})
+
+    def delete_project(self, _body, permalink):
+        if not self.store.projects.pop(permalink, None):
+            return self.not_found()
+        return self.send(200, {})
+
+    # Stages
+
+    def stages_of(self, project_permalink):
+        project = self.store.projects.get(project_permalink)
+        if not project:
+            return None
+        return self.store.stages.setdefault(project["id"], {})
+
+    def list_stages(self, _body, project_permalink):
+        stages = self.stages_of(project_permalink)
+        if stages is None:
+            return self.not_found()
+        return self.send_list("stages", list(stages.values()))
+
+    def create_stage(self, body, project_permalink):
+        project = self.store.projects.get(project_permalink)
+        if not project:
+            return self.not_found()
+        params = dict(body["stage"])
+        params.pop("permalink", None)
+        stage = self.store.add_stage(project, slugify(params["name"]), **params)
+        return self.send(201, {"stage": stage})
+
+    def show_stage(self, _body, project_permalink, permalink):
+        stage = (self.stages_of(project_permalink) or {}).get(permalink)
+        if not stage:
+            return self.not_found()
+        return self.send(200, {"stage": stage})
+
+    def update_stage(self, body, project_permalink, permalink):
+        stages = self.stages_of(project_permalink) or {}
+        stage = stages.pop(permalink, None)
+        if not stage:
+            return self.not_found()
+        stage.update(body)
+        stages[stage["permalink"]] = stage
+        return self.send(200, {"stage": stage})
+
+    def delete_stage(self, _body, project_permalink, permalink):
+        if not (self.stages_of(project_permalink) or {}).pop(permalink, None):
+            return self.not_found()
+        return self.send(200, {})
+
+    # Deploys
+
+    def create_deploy(self, body, project_permalink, stage_permalink):
+        project = self.store.projects.get(project_permalink)
+        stage = (self.stages_of(project_permalink) or {}).get(stage_permalink)
+        if not stage:
+            return self.not_found()
+        deploy = self.store.add_deploy(project, stage, body["deploy"]["reference"])
+        return self.send(201, {"deploy": deploy})
+
+    def show_deploy(self, _body, project_permalink, deploy_id):
+        project = self.store.projects.get(project_permalink)
+        entry = self.store.deploys.get(int(deploy_id))
+        if not project or not entry or entry["deploy"]["project_id"] != project["id"]:
+            return self.not_found()
+        return self.send(200, {"deploy": self.store.deploy_status(int(deploy_id))})
+
+    def show_deploy_output(self, _body, project_permalink, deploy_id):
+        project = self.store.projects.get(project_permalink)
+        entry = self.store.deploys.get(int(deploy_id))
+        if not project or not entry or entry["deploy"]["project_id"] != project["id"]:
+            return self.not_found()
+        output = self.store.deploy_output(int(deploy_id))
+        match = re.match(r"bytes=(\d+)-$", self.headers.get("Range") or "")
+        if not match:
+            return self.send(200, text=output)
+        start = int(match.group(1))
+        if start >= len(output):
+            return self.send(416, text=b"")
+        return self.send(206, text=output[start:])
+
+    # Commands
+
+    def list_commands(self, _body):
+        return self.send_list("commands", list(self.store.commands.values()))
+
+    def create_command(self, body):
+        params = dict(body["command"])
+        command = self.store.add_command(params.pop("command"), **params)
+        return self.send(200, {"command": command})
+
+    def delete_command(self, _body, command_id):
+        if not self.store.commands.pop(int(command_id), None):
+            return self.not_found()
+        return self.send(200, {})
+
+
+# Environments and deploy groups are read through JSON listings but written
+# through Samson's HTML forms, which redirect on success.
+
+
+def html_list(kind):
+    def list_(handler, _body):
+        return handler.send_list(kind, list(getattr(handler.store, kind).values()))
+
+    return list_
+
+
+def html_index(kind):
+    def index(handler, _body):
+        items = getattr(handler.store, kind)
+        return handler.send(200, html=FORM_PAGE.format(len(items)))
+
+    return index
+
+
+def html_create(kind):
+    def create(handler, body):
+        if not body.get("name"):
+            error = "<li>Name can&#39;t be blank</li>"
+            return handler.send(200, html=ERROR_PAGE.format(error))
+        fields = dict((k, v) for k, v in body.items() if k != "permalink")
+        item = handler.store.add_html_item(kind, slugify(body["name"]), **fields)
+        return handler.redirect("/{}/{}".format(kind, item["permalink"]))
+
+    return create
+
+
+def html_show(kind):
+    def show(handler, _body, permalink):
+        item = getattr(handler.store, kind).get(permalink)
+        if not item:
+            return handler.send(404, html="Not found")
+        return handler.send(200, html=FORM_PAGE.format(json.dumps(item)))
+
+    return show
+
+
+def html_update(kind, key):
+    def update(handler, body, permalink):
+        items = getattr(handler.store, kind)
+        item = items.pop(permalink, None)
+        if not item:
+            return handler.send(404, html="Not found")
+        fields = body.get(key, body)
+        if "name" in fields and not fields["name"]:
+            items[permalink] = item
+            error = "<li>Name can&#39;t be blank</li>"
+            return handler.send(200, html=ERROR_PAGE.format(error))
+        item.update((k, v) for k, v in fields.items() if k != "id")
+        items[item["permalink"]] = item
+        return handler.redirect("/{}/{}".format(kind, item["permalink"]))
+
+    return update
+
+
+def html_delete(kind):
+    def delete(handler, _body, permalink):
+        if not getattr(handler.store, kind).pop(permalink, None):
+            return handler.send(404, html="Not found")
+        return handler.redirect("/{}".format(kind))
+
+    return delete
+
+
+# Inbound and outbound webhooks are both listed under the `webhooks` key
+
+
+def list_hooks(kind):
+    def list_(handler, _body, project_permalink):
+        project = handler.store.projects.get(project_permalink)
+        if not project:
+            return handler.not_found()
+        hooks = getattr(handler.store, kind).get(project["id"], {})
+        return handler.send_list("webhooks", list(hooks.values()))
+
+    return list_
+
+
+def create_hook(kind, key, wrapped):
+    def create(handler, body, project_permalink):
+        project = handler.store.projects.get(project_permalink)
+        if not project:
+            return handler.not_found()
+        params = body[key] if wrapped else body
+        hook = handler.store.add_hook(kind, project, **params)
+        return handler.send(200, {key: hook})
+
+    return create
+
+
+def delete_hook(kind):
+    def delete(handler, _body, project_permalink, hook_id):
+        project = handler.store.projects.get(project_permalink) or {}
+        hooks = getattr(handler.store, kind).get(project.get("id"), {})
+        if not hooks.pop(int(hook_id), None):
+            return handler.not_found()
+        return handler.send(200, {})
+
+    return delete
+
+
+ROUTES = [
+    (
+        r"/projects\.json",
+        {"GET": Handler.list_projects, "POST": Handler.create_project},
+    ),
+    (
+        r"/projects/([^/]+)/stages\.json",
+        {"GET": Handler.list_stages, "POST": Handler.create_stage},
+    ),
+    (
+        r"/projects/([^/]+)/stages/([^/]+)\.json",
+        {
+            "GET": Handler.show_stage,
+            "PATCH": Handler.update_stage,
+            "DELETE": Handler.delete_stage,
+        },
+    ),
+    (
+        r"/projects/([^/]+)/stages/([^/]+)/deploys\.json",
+        {"POST": Handler.create_deploy},
+    ),
+    (r"/projects/([^/]+)/deploys/(\d+)\.json", {"GET": Handler.show_deploy}),
+    (r"/projects/([^/]+)/deploys/(\d+)\.text", {"GET": Handler.show_deploy_output}),
+    (
+        r"/projects/([^/]+)/webhooks\.json",
+        {
+            "GET": list_hooks("webhooks"),
+            "POST": create_hook("webhooks", "webhook", True),
+        },
+    ),
+    (r"/projects/([^/]+)/webhooks/(\d+)\.json", {"DELETE": delete_hook("webhooks")}),
+    (
+        r"/projects/([^/]+)/outbound_webhooks\.json",
+        {
+            "GET": list_hooks("outbound_webhooks"),
+            "POST": create_hook("outbound_webhooks", "outbound_webhook", False),
+        },
+    ),
+    (
+        r"/projects/([^/]+)/outbound_webhooks/(\d+)\.json",
+        {"DELETE": delete_hook("outbound_webhooks")},
+    ),
+    (
+        r"/projects/([^/.]+)\.json",
+        {
+            "GET": Handler.show_project,
+            "PATCH": Handler.update_project,
+            "DELETE": Handler.delete_project,
+        },
+    ),
+    (
+        r"/commands\.json",
+        {"GET": Handler.list_commands, "POST": Handler.create_command},
+    ),
+    (r"/commands/(\d+)\.json", {"DELETE": Handler.delete_command}),
+]
+for _kind, _key in (("environments", "environment"), ("deploy_groups", "deploy_group")):
+    ROUTES += [
+        (r"/{}\.json".format(_kind), {"GET": html_list(_kind)}),
+        (r"/{}".format(_kind), {"GET": html_index(_kind), "POST": html_create(_kind)}),
+        (
+            r"/{}/([^/.]+)".format(_kind),
+            {
+                "GET": html_show(_kind),
+                "PATCH": html_update(_kind, _key),
+                "DELETE": html_delete(_kind),
+            },
+        ),
+    ]
@@ -0,0 +1,98 @@
+"""Compares extract_html_errors with the line based scraper it replaced.
+
+    python benchmarks/html_errors.py [page.html ...]
+
+Without arguments it runs against generated Samson form pages. Pass pages
+saved from a Samson instance to measure those instead.
+"""
+
+from __future__ import print_function
+
+import io
+import re
+import sys
+import timeit
+from os.path import dirname, abspath, basename, join
+
+sys.path.append(join(dirname(dirname(abspath(__file__))), "module_utils"))
+import samson_html  # pylint: disable=import-error, wrong-import-position
+
+ERRORS = ["Name can't be blank", "Permalink has already been taken"]
+
+
+def legacy_extract_html_errors(res):
+    html = res.read().decode("utf-8")
+    lines = html.split("\n")
+    err_line_idx = None
+    for idx, line in enumerate(lines):
+        if re.search("There was an error", line):
+            err_line_idx = idx
+
+    if not err_line_idx:
+        return []
+
+    err_line = lines[err_line_idx + 1]
+    errors = (
+        err_line.strip()
+        .replace("<ul>", "")
+        .replace("</ul>", "")
+        .replace("<li>", "")
+        .split("</li>")
+    )
+    return [e for e in errors if e != ""]
+
+
+def form_page(options, errors=None):
+    """Renders a page shaped like Samson's deploy group form."""
+    head = ["<html><head><title>Samson</title></head><body>"]
+    if errors:
+        head.append('<div class="alert alert-danger">')
+        head.append("<p>There was an error saving your changes</p>")
+        head.append("<ul>{}</ul>".format("".join("<li>%s</li>" % e for e in errors)))
+        head.append("</div>")
+    head.append('<form action="/deploy_groups" method="post">')
+    head.append('<select name="deploy_group[environment_id]">')
+    body = [
+        '<option value="{0}">environment {0} &amp; friends</option>'.format(i)
+        for i in range(options)
+    ]
+    tail = ["</select>", "</form></body></html>"]
+    return "\n".join(head + body + tail).encode("utf-8")
+
+
+def pages():
+    if len(sys.argv) > 1:
+        for path in sys.argv[1:]:
+            with open(path, "rb") as page:
+                yield basename(path), page.read()
+        return
+
+    for options in (100, 10000, 100000):
+        yield "errors, {} options".format(options), form_page(options, ERRORS)
+        yield "no errors, {} options".format(options), form_page(options)
+
+
+def main():
+    print("{:<28} {:>10} {:>12} {:>12}".format("page", "size", "legacy", "streaming"))
+    for name, html in pages():
+        legacy = legacy_extract_html_errors(io.BytesIO(html))
+        streaming = samson_html.extract_html_errors(io.BytesIO(html))
+        if legacy != streaming:
+            print("{}: results differ, {} != {}".format(name, legacy, streaming))
+
+        number = max(1, int(2e6 // len(html)))
+        timings = []
+        for extract in (legacy_extract_html_errors, samson_html.extract_html_errors):
+            seconds = min(
+                timeit.repeat(
+                    lambda: extract(io.BytesIO(html)), number=number, repeat=5
+                )
+            )
+            timings.append("{:.3f} ms".format(seconds / number * 1000))
+
+        size = "{} KiB".format(len(html) // 1024)
+        print("{:<28} {:>10} {:>12} {:>12}".format(name, size, *timings))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""Many environments or deploy groups converged by a single task."""
+
+import pytest
+
+from fake_samson import Store
+from test_modules import populate
+
+ITEMS = 200
+
+
+def deploy_groups(prefix):
+    return [
+        dict(permalink="{}-{}".format(prefix, i), name="{} {}".format(prefix, i))
+        for i in range(ITEMS)
+    ]
+
+
+@pytest.mark.parametrize("concurrency", [1, 8])
+def test_create_deploy_groups(benchmark, samson, run_module, concurrency):
+    calls = {}
+
+    def setup():
+        samson.store = Store()
+        calls["ctx"] = populate(samson.store, 1000)
+        samson.reset_counters()
+        return (), {}
+
+    def run():
+        return run_module(
+            "samson_deploy_group",
+            environment_id=calls["ctx"]["environment"]["id"],
+            items=deploy_groups("batch"),
+            concurrency=concurrency,
+        )
+
+    result = benchmark.pedantic(run, setup=setup, rounds=3)
+
+    assert not result.get("failed"), result
+    assert [r["action"] for r in result["results"]] == ["created"] * ITEMS
+    listings = [r for r in samson.requests if r == ("GET", "/deploy_groups.json")]
+    # Once to plan the writes and once to return the results
+    assert len(listings) == 2
+    benchmark.extra_info.update(samson.counters())
+
+
+def test_rejected_items_dont_stop_the_batch(samson, run_module):
+    samson.store = Store()
+    populate(samson.store, 10)
+    items = deploy_groups("batch")[:3]
+    items[1]["name"] = ""
+
+    result = run_module("samson_environment", items=items)
+
+    assert result["failed"], result
+    assert [r["changed"] for r in result["results"]] == [True, False, True]
+    assert result["results"][1]["msg"] == dict(errors=["Name can't be blank"])
+    assert set(["batch-0", "batch-2"]) <= set(samson.store.environments)
+
+
+def test_empty_batches_send_nothing(samson, run_module):
+    samson.store = Store()
+    samson.reset_counters()
+
+    result = run_module("samson_environment", items=[])
+
+    assert not result.get("failed"), result
+    assert result["results"] == []
+    assert samson.requests == []
+
+
+def test_concurrency_must_be_positive(samson, run_module):
+    result = run_module(
+        "samson_environment", items=deploy_groups("batch")[:1], concurrency=0
+    )
+
+    assert result["failed"], result
+    assert result["msg"] == "concurrency must be at least 1"
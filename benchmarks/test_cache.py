@@ -0,0 +1,141 @@
+"""The on-disk caches that let unchanged runs skip Samson or its responses."""
+
+import json
+import os
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from conftest import action_plugin
+from fake_samson import Store
+from test_modules import populate
+
+STAGE = dict(project_permalink="bench", permalink="target", name="Target stage")
+
+
+def run_batch(samson, batch):
+    """Runs the modules of `batch` through the action plugin, in one task."""
+    task = SimpleNamespace(
+        args=dict(defaults=dict(url=samson.url, token="token"), batch=batch),
+        action="samson",
+        async_val=0,
+        check_mode=False,
+    )
+    connection = SimpleNamespace(_shell=SimpleNamespace(tmpdir="/tmp"))
+    play_context = SimpleNamespace(check_mode=False, diff=False, no_log=False)
+    action = action_plugin.ActionModule(task, connection, play_context, None, None)
+    # Without a plugin loader the modules come from the role's library
+    action._shared_loader_obj = SimpleNamespace(  # pylint: disable=protected-access
+        module_loader=SimpleNamespace(find_plugin=lambda name: None)
+    )
+    return action.run(task_vars={})
+
+
+@pytest.fixture
+def cache_path(samson, tmp_path):
+    samson.store = Store()
+    populate(samson.store, 10)
+    return str(tmp_path / "state.json")
+
+
+def test_unchanged_runs_are_answered_from_the_cache(samson, run_module, cache_path):
+    assert run_module("samson_stage", cache_path=cache_path, **STAGE)["changed"]
+    samson.reset_counters()
+
+    result = run_module("samson_stage", cache_path=cache_path, **STAGE)
+
+    assert not result["changed"], result
+    assert result["stage"]["permalink"] == "target"
+    assert samson.requests == []
+
+
+def test_cache_entries_expire(samson, run_module, cache_path):
+    run_module("samson_stage", cache_path=cache_path, cache_ttl=60, **STAGE)
+    with open(cache_path) as cache_file:
+        entries = json.load(cache_file)
+    for entry in entries.values():
+        entry["stored_at"] = time.time() - 120
+    with open(cache_path, "w") as cache_file:
+        json.dump(entries, cache_file)
+    samson.reset_counters()
+
+    result = run_module("samson_stage", cache_path=cache_path, cache_ttl=60, **STAGE)
+
+    assert not result["changed"], result
+    assert samson.requests
+
+
+def test_writes_replace_cached_state(samson, run_module, cache_path):
+    run_module("samson_stage", cache_path=cache_path, **STAGE)
+    renamed = dict(STAGE, name="Renamed stage")
+    assert run_module("samson_stage", cache_path=cache_path, **renamed)["changed"]
+
+    # The cached state is the renamed stage now, not the one first created
+    result = run_module("samson_stage", cache_path=cache_path, **STAGE)
+    assert result["changed"], result
+    assert samson.store.stages[1]["target"]["name"] == "Target stage"
+
+
+def test_deletes_forget_cached_state(samson, run_module, cache_path):
+    run_module("samson_stage", cache_path=cache_path, **STAGE)
+    assert run_module("samson_stage", cache_path=cache_path, state="absent", **STAGE)[
+        "changed"
+    ]
+    samson.reset_counters()
+
+    result = run_module("samson_stage", cache_path=cache_path, **STAGE)
+
+    assert result["changed"], result
+    assert "target" in samson.store.stages[1]
+
+
+def test_unchanged_responses_are_revalidated(samson, run_module, cache_path):
+    # Without a ttl only the conditional requests remain
+    run_module("samson_stage", cache_path=cache_path, cache_ttl=0, **STAGE)
+    run_module("samson_stage", cache_path=cache_path, cache_ttl=0, **STAGE)
+    samson.reset_counters()
+
+    result = run_module("samson_stage", cache_path=cache_path, cache_ttl=0, **STAGE)
+
+    assert not result["changed"], result
+    assert result["stage"]["name"] == "Target stage"
+    assert samson.requests == [("GET", "/projects/bench/stages/target.json")]
+    # Samson answered 304 without a body
+    assert samson.bytes_sent == 0
+
+
+def test_responses_are_evicted_between_runs(samson, run_module, cache_path):
+    for permalink in ("stage-1", "stage-2", "stage-3"):
+        run_module(
+            "samson_stage",
+            cache_path=cache_path,
+            cache_ttl=0,
+            cache_max_entries=1,
+            project_permalink="bench",
+            permalink=permalink,
+            name=permalink,
+        )
+        time.sleep(0.01)
+
+    # Each run starts by evicting down to cache_max_entries
+    assert len(os.listdir(cache_path + ".responses")) == 2
+
+
+def test_batches_only_use_the_cache_where_asked(samson, run_module, cache_path):
+    batch = [
+        dict(samson_stage=dict(STAGE, cache_path=cache_path)),
+        dict(samson_stage=dict(STAGE)),
+    ]
+    run_batch(samson, batch)
+    # Deleted behind the cache's back
+    del samson.store.stages[1]["target"]
+    samson.reset_counters()
+
+    result = run_batch(samson, batch)
+
+    assert not result.get("failed"), result
+    cached, uncached = result["results"]
+    assert not cached["changed"]
+    assert uncached["changed"]
+    assert "target" in samson.store.stages[1]
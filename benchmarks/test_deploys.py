@@ -0,0 +1,221 @@
+"""Deploys started and followed by samson_deploy."""
+
+import pytest
+
+from fake_samson import Store
+from test_modules import populate
+
+DURATION = 1.0
+POLL_INTERVAL = 0.05
+
+
+def deploys(count, reference="v1"):
+    return [
+        dict(
+            project_permalink="bench",
+            stage_permalink="stage-{}".format(i),
+            reference=reference,
+        )
+        for i in range(count)
+    ]
+
+
+@pytest.mark.parametrize("count", [1, 10, 50])
+def test_wait_for_deploys(benchmark, samson, run_module, count):
+    def setup():
+        samson.store = Store()
+        populate(samson.store, count)
+        samson.store.deploy_duration = DURATION
+        samson.reset_counters()
+        return (), {}
+
+    def run():
+        return run_module(
+            "samson_deploy",
+            deploys=deploys(count),
+            poll_interval=POLL_INTERVAL,
+            max_poll_interval=0.4,
+        )
+
+    result = benchmark.pedantic(run, setup=setup, rounds=1)
+
+    assert not result.get("failed"), result
+    assert [d["status"] for d in result["deploys"]] == ["succeeded"] * count
+    for deploy in result["deploys"]:
+        # Polling at a fixed interval would take DURATION / POLL_INTERVAL polls
+        assert deploy["polls"] < DURATION / POLL_INTERVAL / 2
+    polls = [r for r in samson.requests if r[0] == "GET"]
+    assert len(polls) == sum(d["polls"] for d in result["deploys"])
+    benchmark.extra_info.update(samson.counters())
+
+
+def test_failed_deploys_fail_the_task(samson, run_module):
+    samson.store = Store()
+    populate(samson.store, 3)
+    samson.store.deploy_duration = 0.1
+    declared = deploys(2) + deploys(1, reference="broken")
+
+    result = run_module("samson_deploy", deploys=declared, poll_interval=0.02)
+
+    assert result["failed"], result
+    assert result["msg"] == "1 deploy(s) failed"
+    assert [d["status"] for d in result["deploys"]] == [
+        "succeeded",
+        "succeeded",
+        "failed",
+    ]
+
+
+def test_follow_deploys_started_earlier(samson, run_module):
+    samson.store = Store()
+    populate(samson.store, 2)
+    samson.store.deploy_duration = 0.1
+
+    started = run_module("samson_deploy", deploys=deploys(2), wait=False)
+    samson.reset_counters()
+    result = run_module("samson_deploy", deploys=started["deploys"], poll_interval=0.02)
+
+    assert started["changed"] and not result["changed"]
+    assert [d["status"] for d in started["deploys"]] == ["pending", "pending"]
+    assert [d["status"] for d in result["deploys"]] == ["succeeded", "succeeded"]
+    assert all(r[0] == "GET" for r in samson.requests)
+
+
+def add_rollout(store, regions, parallel):
+    """Staging, then every region, then a verification stage."""
+    project = store.add_project("rollout")
+    staging = store.add_stage(project, "staging")
+    verify = store.add_stage(project, "verify")
+    region_ids = []
+    for i in range(regions):
+        region = store.add_stage(
+            project,
+            "region-{}".format(i),
+            run_in_parallel=parallel,
+            prerequisite_stage_ids=[str(staging["id"])],
+            next_stage_ids=[str(verify["id"])],
+        )
+        region_ids.append(str(region["id"]))
+    staging["next_stage_ids"] = region_ids
+    verify["prerequisite_stage_ids"] = region_ids
+
+
+@pytest.mark.parametrize("parallel", [True, False])
+def test_pipeline(benchmark, samson, run_module, parallel):
+    regions = 4
+
+    def setup():
+        samson.store = Store()
+        samson.store.deploy_duration = 0.2
+        add_rollout(samson.store, regions, parallel)
+        samson.reset_counters()
+        return (), {}
+
+    def run():
+        return run_module(
+            "samson_pipeline",
+            project_permalink="rollout",
+            reference="v1",
+            stages=["staging"],
+            poll_interval=POLL_INTERVAL,
+        )
+
+    result = benchmark.pedantic(run, setup=setup, rounds=1)
+
+    assert not result.get("failed"), result
+    assert [s["permalink"] for s in result["stages"]] == ["staging"] + [
+        "region-{}".format(i) for i in range(regions)
+    ] + ["verify"]
+    listings = [r for r in samson.requests if r[1].endswith("/stages.json")]
+    assert len(listings) == 1
+    benchmark.extra_info.update(samson.counters())
+
+
+def test_pipeline_skips_stages_after_a_failure(samson, run_module):
+    samson.store = Store()
+    samson.store.deploy_duration = 0.1
+    add_rollout(samson.store, 2, parallel=True)
+    samson.reset_counters()
+
+    result = run_module(
+        "samson_pipeline",
+        project_permalink="rollout",
+        reference="broken",
+        stages=["region-0"],
+        poll_interval=0.02,
+    )
+
+    assert result["failed"], result
+    assert [(s["permalink"], s["action"]) for s in result["stages"]] == [
+        ("region-0", "started"),
+        ("verify", "skipped"),
+    ]
+    assert [r[0] for r in samson.requests].count("POST") == 1
+
+
+@pytest.mark.parametrize("lines", [100, 10000])
+def test_follow_deploy_output(benchmark, samson, run_module, tmp_path, lines):
+    dest = tmp_path / "deploy.log"
+    calls = {}
+
+    def setup():
+        samson.store = Store()
+        populate(samson.store, 1)
+        samson.store.deploy_duration = DURATION
+        samson.store.deploy_output_lines = lines
+        started = run_module("samson_deploy", deploys=deploys(1), wait=False)
+        calls["id"] = started["deploys"][0]["id"]
+        samson.reset_counters()
+        return (), {}
+
+    def run():
+        return run_module(
+            "samson_deploy_log",
+            project_permalink="bench",
+            deploy_id=calls["id"],
+            dest=str(dest),
+            poll_interval=POLL_INTERVAL,
+            tail_lines=10,
+        )
+
+    result = benchmark.pedantic(run, setup=setup, rounds=1)
+
+    output = samson.store.deploy_output(calls["id"])
+    assert result["status"] == "succeeded"
+    assert (result["offset"], result["line"]) == (len(output), lines)
+    assert len(result["lines"]) == 10
+    assert dest.read_bytes() == output
+    # Every byte of the output is sent once
+    assert samson.bytes_sent < len(output) + 100 * len(samson.requests)
+    benchmark.extra_info.update(samson.counters())
+
+
+def test_resume_deploy_output(samson, run_module, tmp_path):
+    samson.store = Store()
+    populate(samson.store, 1)
+    samson.store.deploy_duration = 0.1
+    started = run_module("samson_deploy", deploys=deploys(1), wait=False)
+    deploy_id = started["deploys"][0]["id"]
+    dest = tmp_path / "deploy.log"
+
+    def read(**args):
+        return run_module(
+            "samson_deploy_log",
+            project_permalink="bench",
+            deploy_id=deploy_id,
+            dest=str(dest),
+            poll_interval=0.02,
+            **args
+        )
+
+    by_line = read(line=90)
+    # Read the last line again
+    last_line = len(by_line["lines"][-1]) + 1
+    by_offset = read(offset=by_line["offset"] - last_line, line=by_line["line"] - 1)
+    nothing_new = read(offset=by_line["offset"])
+
+    output = samson.store.deploy_output(deploy_id)
+    assert by_line["lines"][0] == "deploy {} step 90".format(deploy_id)
+    assert by_line["line"] == by_offset["line"] == 100
+    assert dest.read_bytes() == output[-by_line["bytes"] :] + output[-last_line:]
+    assert not nothing_new["changed"] and nothing_new["bytes"] == 0
@@ -0,0 +1,151 @@
+"""Snapshots of a whole Samson instance taken by samson_facts."""
+
+import pytest
+
+from fake_samson import Store
+from test_modules import MODULES, entity_fields, populate
+
+
+@pytest.mark.parametrize(
+    "size", [10, 100, 1000], ids=lambda size: "{}-items".format(size)
+)
+def test_snapshot(benchmark, samson, run_module, tmpdir, size):
+    dest = str(tmpdir.join("snapshot.jsonl"))
+
+    def setup():
+        samson.store = Store()
+        populate(samson.store, size)
+        samson.reset_counters()
+        return (), {}
+
+    def run():
+        return run_module("samson_facts", dest=dest)
+
+    result = benchmark.pedantic(run, setup=setup, rounds=3)
+
+    assert not result.get("failed"), result
+    assert result["counts"]["project"] == size + 1
+    assert result["counts"]["webhook"] == size
+    benchmark.extra_info.update(samson.counters())
+    benchmark.extra_info["snapshot_bytes"] = tmpdir.join("snapshot.jsonl").size()
+
+
+def test_command_texts_are_written_once(samson, run_module):
+    samson.store = Store()
+    ctx = populate(samson.store, 10)
+    for _ in range(3):
+        samson.store.add_command("make deploy", project_id=ctx["project"]["id"])
+
+    result = run_module("samson_facts", collections=["commands"])
+
+    records = result["snapshot"]
+    assert records[0][0] == "snapshot"
+    texts = [r[1] for r in records if r[0] == "command_text"]
+    assert [t["text"] for t in texts].count("make deploy") == 1
+    digest = [t["hash"] for t in texts if t["text"] == "make deploy"][0]
+    commands = [r[1] for r in records if r[0] == "command"]
+    assert len([c for c in commands if c["hash"] == digest]) == 3
+    assert all("command" not in c for c in commands)
+
+
+@pytest.fixture
+def snapshot(samson, run_module, tmpdir):
+    samson.store = Store()
+    ctx = populate(samson.store, 100)
+    path = str(tmpdir.join("snapshot.jsonl"))
+
+    def take():
+        run_module("samson_facts", dest=path)
+        samson.reset_counters()
+        return path
+
+    return ctx, take
+
+
+@pytest.mark.parametrize("name", sorted(MODULES))
+def test_noop_reads_nothing_from_samson(samson, run_module, snapshot, name):
+    ctx, take = snapshot
+    module = MODULES[name]
+    args = module["args"](ctx)
+    module["add"](samson.store, ctx, entity_fields(args))
+    path = take()
+
+    result = run_module(name, samson_snapshot=path, **args)
+
+    assert not result.get("failed"), result
+    assert not result["changed"], result
+    assert samson.requests == []
+
+
+def test_writes_are_checked_against_samson(samson, run_module, snapshot):
+    ctx, take = snapshot
+    args = MODULES["samson_project"]["args"](ctx)
+    samson.store.add_project("target", name="Old name")
+    path = take()
+    samson.store.projects["target"]["repository_url"] = "https://elsewhere"
+
+    result = run_module("samson_project", samson_snapshot=path, **args)
+
+    assert result["failed"], result
+    assert "changed since the snapshot" in result["msg"]
+    assert samson.counters()["writes"] == 0
+
+
+def test_creates_are_checked_against_samson(samson, run_module, snapshot):
+    ctx, take = snapshot
+    args = MODULES["samson_command"]["args"](ctx)
+    path = take()
+    run_module("samson_command", **args)
+
+    result = run_module("samson_command", samson_snapshot=path, **args)
+
+    assert result["failed"], result
+    commands = [
+        c for c in samson.store.commands.values() if c["command"] == args["command"]
+    ]
+    assert len(commands) == 1
+
+
+def test_unchanged_snapshots_are_kept(samson, run_module, tmpdir):
+    samson.store = Store()
+    populate(samson.store, 10)
+    dest = str(tmpdir.join("snapshot.jsonl"))
+    assert run_module("samson_facts", dest=dest)["changed"]
+    written = tmpdir.join("snapshot.jsonl").read()
+
+    # Taken again at another time, with the records listed in another order
+    samson.store.projects = dict(reversed(list(samson.store.projects.items())))
+    result = run_module("samson_facts", dest=dest)
+    check = run_module("samson_facts", dest=dest, _ansible_check_mode=True)
+
+    assert not result["changed"], result
+    assert not check["changed"], check
+    assert tmpdir.join("snapshot.jsonl").read() == written
+
+
+def test_check_mode_reports_changed_snapshots(samson, run_module, tmpdir):
+    samson.store = Store()
+    populate(samson.store, 10)
+    dest = str(tmpdir.join("snapshot.jsonl"))
+    run_module("samson_facts", dest=dest)
+    written = tmpdir.join("snapshot.jsonl").read()
+    samson.store.add_project("target", name="New project")
+
+    result = run_module("samson_facts", dest=dest, _ansible_check_mode=True)
+
+    assert result["changed"], result
+    assert tmpdir.join("snapshot.jsonl").read() == written
+    assert run_module("samson_facts", dest=dest)["changed"]
+
+
+def test_unwritable_snapshots_fail_the_task(samson, run_module, tmpdir):
+    samson.store = Store()
+    populate(samson.store, 10)
+    # Nothing can be renamed over a directory
+    dest = str(tmpdir.mkdir("snapshot.jsonl"))
+
+    result = run_module("samson_facts", dest=dest)
+
+    assert result["failed"], result
+    assert "Can't write snapshot" in result["msg"]
+    assert tmpdir.listdir() == [tmpdir.join("snapshot.jsonl")]
@@ -0,0 +1,244 @@
+"""Requests, bytes and wall time per module operation.
+
+    pip install pytest-benchmark
+    python -m pytest benchmarks
+
+Every operation runs against a fake Samson whose collections hold 10 to 10k
+entities. The request and byte counts of each operation end up in the
+benchmark's `extra_info`, use `--benchmark-json` to keep them around and
+compare runs.
+"""
+
+import json
+
+import pytest
+
+from fake_samson import Store
+
+SIZES = [10, 100, 1000, 10000]
+
+
+def populate(store, size):
+    """Fills every collection like a long lived Samson would."""
+    bench = store.add_project("bench")
+    stage = store.add_stage(bench, "bench-stage")
+    environment = store.add_html_item("environments", "bench-environment")
+    for i in range(size):
+        store.add_project("project-{}".format(i))
+        store.add_stage(bench, "stage-{}".format(i))
+        store.add_command("echo {}".format(i), project_id=bench["id"])
+        store.add_html_item("environments", "environment-{}".format(i))
+        store.add_html_item(
+            "deploy_groups", "deploy-group-{}".format(i), environment_id=1
+        )
+        store.add_hook(
+            "webhooks", bench, stage_id=stage["id"], source="github", branch=str(i)
+        )
+        store.add_hook(
+            "outbound_webhooks", bench, stage_id=stage["id"], url="https://{}".format(i)
+        )
+    return dict(project=bench, stage=stage, environment=environment)
+
+
+# Each module describes the entity the operations work on. `args` are the
+# module's parameters, `add` puts the entity in the store with the given
+# fields and `stale` are fields an update would change.
+MODULES = dict(
+    samson_project=dict(
+        args=lambda ctx: dict(
+            permalink="target",
+            name="Target project",
+            repository_url="https://github.com/samson/target",
+        ),
+        add=lambda store, ctx, fields: store.add_project("target", **fields),
+        stale=dict(name="Old name"),
+    ),
+    samson_stage=dict(
+        args=lambda ctx: dict(
+            project_permalink="bench", permalink="target", name="Target stage"
+        ),
+        add=lambda store, ctx, fields: store.add_stage(
+            ctx["project"], "target", **fields
+        ),
+        stale=dict(name="Old name"),
+    ),
+    samson_environment=dict(
+        args=lambda ctx: dict(
+            permalink="target", name="Target environment", production=False
+        ),
+        add=lambda store, ctx, fields: store.add_html_item(
+            "environments", "target", **fields
+        ),
+        stale=dict(name="Old name"),
+    ),
+    samson_deploy_group=dict(
+        args=lambda ctx: dict(
+            permalink="target",
+            name="Target deploy group",
+            environment_id=ctx["environment"]["id"],
+        ),
+        add=lambda store, ctx, fields: store.add_html_item(
+            "deploy_groups", "target", **fields
+        ),
+        stale=dict(name="Old name"),
+    ),
+    samson_command=dict(
+        args=lambda ctx: dict(command="make target", project_id=ctx["project"]["id"]),
+        add=lambda store, ctx, fields: store.add_command(
+            "make target", project_id=ctx["project"]["id"]
+        ),
+    ),
+    samson_inbound_webhook=dict(
+        args=lambda ctx: dict(
+            project_id=ctx["project"]["id"],
+            stage_id=ctx["stage"]["id"],
+            source="github",
+            branch="target",
+        ),
+        add=lambda store, ctx, fields: store.add_hook(
+            "webhooks",
+            ctx["project"],
+            stage_id=ctx["stage"]["id"],
+            source="github",
+            branch="target",
+        ),
+    ),
+    samson_outbound_webhook=dict(
+        args=lambda ctx: dict(
+            project_id=ctx["project"]["id"],
+            stage_id=ctx["stage"]["id"],
+            webhook_url="https://target",
+        ),
+        add=lambda store, ctx, fields: store.add_hook(
+            "outbound_webhooks",
+            ctx["project"],
+            stage_id=ctx["stage"]["id"],
+            url="https://target",
+        ),
+    ),
+)
+
+
+def entity_fields(args):
+    # The fields the entity has once the module's arguments are applied
+    fields = dict(args)
+    for key in ("permalink", "project_permalink", "project_id", "stage_id"):
+        fields.pop(key, None)
+    return fields
+
+
+def operations():
+    for name, module in sorted(MODULES.items()):
+        yield name, "create"
+        if "stale" in module:
+            yield name, "update"
+        yield name, "noop"
+        yield name, "delete"
+
+
+@pytest.mark.parametrize("size", SIZES, ids=lambda size: "{}-items".format(size))
+@pytest.mark.parametrize(
+    "name,operation", list(operations()), ids=lambda v: v if isinstance(v, str) else ""
+)
+def test_operation(benchmark, samson, run_module, name, operation, size):
+    module = MODULES[name]
+    calls = {}
+
+    def setup():
+        samson.store = Store()
+        ctx = populate(samson.store, size)
+        args = module["args"](ctx)
+        fields = entity_fields(args)
+        if operation == "update":
+            module["add"](samson.store, ctx, dict(fields, **module["stale"]))
+        elif operation in ("noop", "delete"):
+            module["add"](samson.store, ctx, fields)
+        if operation == "delete":
+            args["state"] = "absent"
+        calls["args"] = args
+        samson.reset_counters()
+        return (), {}
+
+    def run():
+        return run_module(name, **calls["args"])
+
+    result = benchmark.pedantic(run, setup=setup, rounds=3)
+
+    assert not result.get("failed"), result
+    assert result["changed"] == (operation != "noop"), result
+    if operation == "noop":
+        assert samson.counters()["writes"] == 0
+    benchmark.extra_info.update(samson.counters())
+
+
+@pytest.mark.parametrize("name", ["samson_project", "samson_stage"])
+def test_updates_send_only_the_changed_fields(samson, run_module, name):
+    module = MODULES[name]
+    samson.store = Store()
+    ctx = populate(samson.store, 10)
+    args = module["args"](ctx)
+    module["add"](samson.store, ctx, dict(entity_fields(args), **module["stale"]))
+    samson.reset_counters()
+
+    result = run_module(name, **args)
+
+    assert result["changed"], result
+    assert samson.bytes_received == len(json.dumps(dict(name=args["name"])))
+
+
+def test_stage_fields_are_compared_by_value(samson, run_module):
+    samson.store = Store()
+    ctx = populate(samson.store, 10)
+    samson.store.add_stage(
+        ctx["project"],
+        "target",
+        name="Target stage",
+        command_ids=[1, 2],
+        deploy_group_ids=[3, 4],
+        next_stage_ids=[],
+        production=True,
+        dashboard="",
+    )
+    samson.reset_counters()
+
+    result = run_module(
+        "samson_stage",
+        project_permalink="bench",
+        permalink="target",
+        name="Target stage",
+        command_ids=["1", "2"],
+        deploy_group_ids=["4", "3"],
+        next_stage_ids=[""],
+        production="yes",
+        dashboard="",
+    )
+
+    assert not result["changed"], result
+    assert samson.counters()["writes"] == 0
+
+
+@pytest.mark.parametrize("relative", [False, True], ids=["absolute", "relative"])
+def test_listings_follow_every_page(samson, run_module, relative):
+    samson.store = Store()
+    populate(samson.store, 10)
+    samson.page_size = 4
+    samson.relative_links = relative
+    samson.reset_counters()
+
+    try:
+        result = run_module(
+            "samson_stages",
+            project_permalink="bench",
+            stages=[dict(permalink="stage-9", name="stage-9")],
+        )
+    finally:
+        samson.page_size = None
+        samson.relative_links = False
+
+    # 11 stages, the one on the last page is already there
+    assert not result["changed"], result
+    assert samson.requests == [
+        ("GET", "/projects/bench/stages.json"),
+        ("GET", "/projects/bench/stages.json?page=2"),
+        ("GET", "/projects/bench/stages.json?page=3"),
+    ]
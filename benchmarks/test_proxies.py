@@ -0,0 +1,77 @@
+"""How requests reach Samson: through proxies or pooled connections."""
+
+import socket
+
+import pytest
+
+from conftest import samson_utils
+from fake_samson import Store
+from test_modules import populate
+
+
+@pytest.fixture
+def proxy_env(monkeypatch):
+    for key in ("http_proxy", "https_proxy", "no_proxy"):
+        monkeypatch.delenv(key, raising=False)
+        monkeypatch.delenv(key.upper(), raising=False)
+    monkeypatch.setenv("http_proxy", "http://proxy.invalid:3128")
+    monkeypatch.setenv("no_proxy", "127.0.0.1,.internal")
+
+
+@pytest.mark.parametrize(
+    "url, proxied",
+    [
+        ("http://samson.example.com/projects.json", True),
+        ("http://127.0.0.1:9080/projects.json", False),
+        ("http://samson.internal/projects.json", False),
+        # Only schemes with a proxy are proxied
+        ("https://samson.example.com/projects.json", False),
+    ],
+)
+def test_no_proxy_hosts_bypass_the_proxy(proxy_env, url, proxied):
+    http_client = samson_utils.SamsonRequest()
+    assert http_client.needs_urllib(url) == proxied
+
+    http_client = samson_utils.SamsonRequest(use_proxy=False)
+    assert not http_client.needs_urllib(url)
+
+
+def test_no_proxy_hosts_use_pooled_connections(proxy_env, samson, run_module):
+    samson.store = Store()
+    populate(samson.store, 10)
+    samson.reset_counters()
+
+    # The proxy doesn't resolve, so this only passes without it
+    result = run_module(
+        "samson_stage", project_permalink="bench", permalink="stage-1", name="stage-1"
+    )
+
+    assert not result.get("failed"), result
+    assert samson.connections == 1
+
+
+def test_hosts_are_looked_up_once(samson, run_module, monkeypatch):
+    samson.store = Store()
+    populate(samson.store, 10)
+    addresses = (
+        samson_utils.samson_connections._addresses
+    )  # pylint: disable=protected-access
+    addresses.clear()
+    lookups = []
+    getaddrinfo = socket.getaddrinfo
+
+    def counting_getaddrinfo(host, *args, **kwargs):
+        lookups.append(host)
+        return getaddrinfo(host, *args, **kwargs)
+
+    monkeypatch.setattr(socket, "getaddrinfo", counting_getaddrinfo)
+    url = samson.url.replace("127.0.0.1", "localhost")
+    stage = dict(project_permalink="bench", permalink="stage-1", name="stage-1")
+
+    # Each run starts without pooled connections
+    for _ in range(2):
+        result = run_module("samson_stage", url=url, samson_profile=True, **stage)
+        assert not result.get("failed"), result
+
+    assert lookups.count("localhost") == 1
+    assert result["timings"][0]["dns"] == 0
@@ -0,0 +1,154 @@
+"""Requests made while Samson is busy or loses responses."""
+
+import json
+import socket
+import threading
+
+import pytest
+
+from fake_samson import Store
+from test_modules import populate
+
+FAST_RETRIES = dict(samson_retries=3, samson_retry_delay=0.01)
+
+
+@pytest.fixture
+def ctx(samson):
+    samson.store = Store()
+    samson.faults = []
+    ctx = populate(samson.store, 10)
+    samson.reset_counters()
+    return ctx
+
+
+def test_busy_lookup_is_retried(samson, run_module, ctx):
+    samson.fail_next("GET", 503)
+    samson.fail_next("GET", 429, headers={"Retry-After": "0"})
+
+    result = run_module(
+        "samson_project",
+        permalink="bench",
+        name="bench",
+        repository_url="https://github.com/samson/bench",
+        **FAST_RETRIES
+    )
+
+    assert not result.get("failed"), result
+    assert not result["changed"]
+    assert samson.counters()["requests"] == 3
+
+
+def test_retries_give_up(samson, run_module, ctx):
+    for _ in range(3):
+        samson.fail_next("GET", 503)
+
+    result = run_module(
+        "samson_project",
+        permalink="bench",
+        name="bench",
+        repository_url="https://github.com/samson/bench",
+        samson_retries=2,
+        samson_retry_delay=0.01,
+    )
+
+    assert result["failed"], result
+    assert samson.counters()["requests"] == 3
+
+
+@pytest.mark.parametrize("processed", [False, True], ids=["lost", "processed"])
+def test_create_is_retried_after_relookup(samson, run_module, ctx, processed):
+    samson.fail_next("POST", 504, processed=processed)
+
+    result = run_module(
+        "samson_command",
+        command="make retry",
+        project_id=ctx["project"]["id"],
+        **FAST_RETRIES
+    )
+
+    assert not result.get("failed"), result
+    assert result["changed"]
+    commands = [
+        c for c in samson.store.commands.values() if c["command"] == "make retry"
+    ]
+    assert len(commands) == 1
+    writes = samson.counters()["writes"]
+    assert writes == (1 if processed else 2)
+
+
+def test_rate_limit_spaces_requests(samson, run_module, ctx):
+    result = run_module(
+        "samson_stage",
+        project_permalink="bench",
+        permalink="rated",
+        name="Rated stage",
+        samson_rate_limit=20,
+        samson_rate_burst=1,
+        samson_profile=True,
+    )
+
+    assert not result.get("failed"), result
+    starts = [timing["start"] for timing in result["timings"]]
+    gaps = [b - a for a, b in zip(starts, starts[1:])]
+    assert len(starts) == 3
+    assert min(gaps) >= 0.04
+
+
+def test_html_create_is_retried_after_relookup(samson, run_module, ctx):
+    samson.fail_next("POST", 502, processed=True)
+
+    result = run_module(
+        "samson_environment",
+        permalink="retried",
+        name="Retried environment",
+        **FAST_RETRIES
+    )
+
+    assert not result.get("failed"), result
+    assert result["environment"]["permalink"] == "retried"
+    assert "retried-environment" not in samson.store.environments
+    assert samson.counters()["writes"] == 2
+
+
+UNREACHABLE_TASKS = dict(
+    samson_sync=dict(projects=[dict(permalink="p", name="p", repository_url="r")]),
+    samson_stages=dict(
+        project_permalink="bench", stages=[dict(permalink="s", name="s")]
+    ),
+    samson_commands=dict(project_id=1, commands=[dict(command="make")]),
+    samson_webhooks=dict(
+        project_permalink="bench",
+        inbound=[dict(stage_id=1, source="github", branch="master")],
+    ),
+    samson_environment=dict(items=[dict(permalink="e", name="e")]),
+    samson_facts=dict(),
+    samson_deploy=dict(
+        project_permalink="bench", stage_permalink="s", reference="master"
+    ),
+    samson_pipeline=dict(project_permalink="bench", reference="master", stages=["s"]),
+)
+
+
+@pytest.fixture
+def unreachable_url():
+    # Nothing listens on a port that was just released
+    sock = socket.socket()
+    sock.bind(("127.0.0.1", 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    return "http://127.0.0.1:{}".format(port)
+
+
+@pytest.mark.parametrize("name", sorted(UNREACHABLE_TASKS))
+def test_unreachable_samson_fails_the_task(run_module, unreachable_url, name):
+    results = []
+    args = dict(UNREACHABLE_TASKS[name], url=unreachable_url, samson_retries=0)
+    thread = threading.Thread(target=lambda: results.append(run_module(name, **args)))
+    thread.daemon = True
+    thread.start()
+    thread.join(30)
+
+    assert results, "{} didn't finish".format(name)
+    assert results[0]["failed"], results[0]
+    # Batch modules report the error with the item that failed
+    assert "refused" in json.dumps(results[0]), results[0]
@@ -0,0 +1,87 @@
+"""How long a module takes to import, as Ansible runs it on the host.
+
+AnsiballZ ships the module and its module_utils in a zip, where Python finds
+no bytecode and compiles every imported file on every run. Each module runs
+in a fresh interpreter with the module_utils zipped up the same way.
+"""
+
+import glob
+import json
+import os
+import subprocess
+import sys
+import zipfile
+from os.path import basename, join
+
+import pytest
+
+from conftest import ROLE_PATH
+
+LIBRARY = sorted(
+    basename(path)[: -len(".py")]
+    for path in glob.glob(join(ROLE_PATH, "library", "samson_*.py"))
+)
+
+# Loaded by every module, samson_utils imports the others
+SHARED_MODULE_UTILS = [
+    "samson_cache",
+    "samson_connections",
+    "samson_listing",
+    "samson_utils",
+]
+# The rest are only loaded by the modules that need them
+MODULE_UTILS = dict(
+    samson_deploy=["samson_deploys"],
+    samson_deploy_group=["samson_html"],
+    samson_deploy_log=["samson_deploys"],
+    samson_environment=["samson_html"],
+    samson_facts=["samson_snapshot"],
+    samson_pipeline=["samson_deploys"],
+    samson_sync=["samson_html"],
+)
+
+IMPORT_MODULE = """
+import importlib.util, json, sys, time
+sys.path.insert(0, sys.argv[1])
+from ansible.module_utils.basic import AnsibleModule
+start = time.perf_counter()
+spec = importlib.util.spec_from_file_location("module", sys.argv[2])
+spec.loader.exec_module(importlib.util.module_from_spec(spec))
+print(json.dumps(dict(seconds=time.perf_counter() - start, modules=list(sys.modules))))
+"""
+
+
+@pytest.fixture(scope="module")
+def module_utils_zip(tmp_path_factory):
+    path = str(tmp_path_factory.mktemp("startup") / "module_utils.zip")
+    with zipfile.ZipFile(path, "w") as archive:
+        for source in glob.glob(join(ROLE_PATH, "module_utils", "*.py")):
+            archive.write(source, basename(source))
+    return path
+
+
+@pytest.mark.parametrize("name", LIBRARY)
+def test_import(benchmark, module_utils_zip, name):
+    env = dict(os.environ, ENV="dev")
+    args = [
+        sys.executable,
+        "-c",
+        IMPORT_MODULE,
+        module_utils_zip,
+        join(ROLE_PATH, "library", name + ".py"),
+    ]
+
+    def run():
+        return json.loads(subprocess.check_output(args, env=env))
+
+    result = benchmark.pedantic(run, rounds=3)
+
+    loaded = sorted(m for m in result["modules"] if m.startswith("samson_"))
+    assert loaded == sorted(SHARED_MODULE_UTILS + MODULE_UTILS.get(name, []))
+    # Only needed when a connection can't be pooled
+    assert "ansible.module_utils.urls" not in result["modules"]
+    benchmark.extra_info["import_seconds"] = result["seconds"]
+    benchmark.extra_info["module_utils"] = loaded
+    benchmark.extra_info["module_utils_bytes"] = sum(
+        os.path.getsize(join(ROLE_PATH, "module_utils", m + ".py")) for m in loaded
+    )
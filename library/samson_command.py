@@ -12,7 +12,6 @@ from os.path import dirname, abspath, join
 import sys
 
 from ansible.module_utils.basic import AnsibleModule
-from ansible.module_utils.urls import Request
 
 if os.environ.get("ENV") == "dev":
     module_utils_path = join(dirname(dirname(abspath(__file__))), "module_utils")
@@ -25,18 +24,37 @@ else:
 
 HTTPError = samson_utils.HTTPError
 entity_url = samson_utils.entity_url
+iter_items = samson_utils.iter_items
+entity_diff = samson_utils.entity_diff
+diff_result = samson_utils.diff_result
+load_json = samson_utils.load_json
+CLIENT_ARGUMENT_SPEC = samson_utils.CLIENT_ARGUMENT_SPEC
+create_with_relookup = samson_utils.create_with_relookup
+samson_client = samson_utils.samson_client
 
 
 def create(module, http_client, base_url, params):
-    ids = find_commands(http_client, base_url, params)
-    if ids:
-        module.exit_json(changed=False, command=ids[0])
+    command = next(find_commands(http_client, base_url, params), None)
+    if command:
+        module.exit_json(changed=False, command=command)
+
+    if module.check_mode:
+        module.exit_json(
+            changed=True, command=params, **diff_result(module, None, params)
+        )
 
     url = entity_url(base_url)
     try:
-        res = http_client.post(url, data=json.dumps(dict(command=params)))
-        command = json.load(res)["command"]
-        module.exit_json(changed=True, command=command)
+        command = create_with_relookup(
+            http_client,
+            lambda: load_json(
+                http_client.post(url, data=json.dumps(dict(command=params)))
+            )["command"],
+            lambda: next(find_commands(http_client, base_url, params), None),
+        )
+        module.exit_json(
+            changed=True, command=command, **diff_result(module, None, command)
+        )
     except HTTPError as err:
         msg = err.msg
         if err.code == 400:
@@ -45,17 +63,23 @@ def create(module, http_client, base_url, params):
 
 
 def delete(module, http_client, base_url, params):
-    commands = find_commands(http_client, base_url, params)
+    commands = list(find_commands(http_client, base_url, params))
     if not commands:
         module.exit_json(changed=False)
 
+    result = dict(changed=True)
+    if module._diff:  # pylint: disable=protected-access
+        result["diff"] = [entity_diff(command, None) for command in commands]
+    if module.check_mode:
+        module.exit_json(**result)
+
     try:
         for command in commands:
             url = entity_url(base_url, identifier=str(command["id"]))
             print("url", url)
             http_client.delete(url)
 
-        module.exit_json(changed=True)
+        module.exit_json(**result)
     except HTTPError as err:
         if err.code == 404:
             module.exit_json(changed=False)
@@ -64,19 +88,12 @@ def delete(module, http_client, base_url, params):
 
 
 def find_commands(http_client, base_url, params):
-    url = entity_url(base_url)
-    res = http_client.get(url)
-    body = json.load(res)
-
-    commands = []
-    for command in body["commands"]:
+    for command in iter_items(http_client, base_url, "commands"):
         if (
             params["command"] == command["command"]
             and params["project_id"] == command["project_id"]
         ):
-            commands.append(command)
-
-    return commands
+            yield command
 
 
 def main():
@@ -87,23 +104,20 @@ def main():
         command=dict(required=True, type="str"),
         project_id=dict(type="int"),
     )
+    argument_spec.update(CLIENT_ARGUMENT_SPEC)
 
-    module = AnsibleModule(argument_spec=argument_spec)
+    module = AnsibleModule(argument_spec=argument_spec, supports_check_mode=True)
 
     base_url = "/".join([module.params["url"], "commands"])
     state = module.params["state"]
-    token = module.params["token"]
     params = module.params.copy()
     del params["url"]
     del params["state"]
     del params["token"]
+    for key in CLIENT_ARGUMENT_SPEC:
+        del params[key]
 
-    http_client = Request(
-        headers={
-            "Authorization": "Bearer {}".format(token),
-            "Content-Type": "application/json",
-        }
-    )
+    http_client = samson_client(module)
 
     if state == "present":
         create(module, http_client, base_url, params)
@@ -0,0 +1,201 @@
+from __future__ import (  # pylint: disable=unused-variable
+    absolute_import,
+    division,
+    print_function,
+)
+
+__metaclass__ = type  # pylint: disable=unused-variable
+
+import hashlib
+import json
+import os
+from os.path import dirname, abspath, join
+import sys
+
+from ansible.module_utils.basic import AnsibleModule
+
+if os.environ.get("ENV") == "dev":
+    module_utils_path = join(dirname(dirname(abspath(__file__))), "module_utils")
+    sys.path.append(module_utils_path)
+    import samson_utils  # pylint: disable=no-name-in-module, import-error
+else:
+    from ansible.module_utils import (  # pylint: disable=no-name-in-module, ungrouped-imports
+        samson_utils,
+    )
+
+HTTPError = samson_utils.HTTPError
+entity_url = samson_utils.entity_url
+iter_items = samson_utils.iter_items
+entities_diff = samson_utils.entities_diff
+delete_entities = samson_utils.delete_entities
+error_message = samson_utils.error_message
+load_json = samson_utils.load_json
+create_with_relookup = samson_utils.create_with_relookup
+CLIENT_ARGUMENT_SPEC = samson_utils.CLIENT_ARGUMENT_SPEC
+samson_client = samson_utils.samson_client
+
+
+def normalize_command(command):
+    # Samson stores commands submitted through its forms with CRLF line
+    # endings, and trailing whitespace doesn't change what a command does
+    lines = command.strip().splitlines()
+    return "\n".join(line.rstrip() for line in lines)
+
+
+def command_key(command, project_id):
+    """Identifies a command by a digest of its text and project."""
+    text = "{}\0{}".format(project_id, normalize_command(command))
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def index_commands(http_client, base_url, keys, purge_projects):
+    """Streams the commands listing into an index of the ones we care about.
+
+    Returns the existing commands by key for the `keys` that are declared,
+    along with the commands of `purge_projects` that aren't. Everything else
+    is dropped as soon as it's decoded.
+    """
+    existing = {}
+    undeclared = []
+    for command in iter_items(http_client, base_url, "commands"):
+        key = command_key(command["command"], command.get("project_id"))
+        if key in keys:
+            existing.setdefault(key, []).append(command)
+        elif command.get("project_id") in purge_projects:
+            undeclared.append(command)
+    return existing, undeclared
+
+
+def create(http_client, base_url, params, key, check_mode):
+    if check_mode:
+        return dict(action="created", changed=True, command=params)
+
+    def post():
+        url = entity_url(base_url)
+        res = http_client.post(url, data=json.dumps(dict(command=params)))
+        return load_json(res)["command"]
+
+    def lookup():
+        existing, _ = index_commands(http_client, base_url, set([key]), set())
+        return existing.get(key, [None])[0]
+
+    command = create_with_relookup(http_client, post, lookup)
+    return dict(action="created", changed=True, command=command)
+
+
+def reconcile(http_client, base_url, commands, purge, check_mode=False):
+    keys = [command_key(c["command"], c["project_id"]) for c in commands]
+    # Global commands are shared by every project and never purged
+    purge_projects = set()
+    if purge:
+        purge_projects = set(c["project_id"] for c in commands) - set([None])
+    existing, undeclared = index_commands(
+        http_client, base_url, set(keys), purge_projects
+    )
+
+    results = []
+    # The result of each key, so a command that's declared twice is only
+    # created once
+    done = {}
+    for command, key in zip(commands, keys):
+        state = command["state"]
+        params = dict(command=command["command"], project_id=command["project_id"])
+        current = existing.get(key, [])
+
+        if (key, state) in done:
+            result = dict(done[(key, state)], action="unchanged", changed=False)
+        else:
+            try:
+                if state == "absent":
+                    result = (
+                        delete_entities(
+                            http_client, base_url, current, "id", check_mode
+                        )
+                        if current
+                        else dict(action="unchanged", changed=False)
+                    )
+                elif current:
+                    result = dict(action="unchanged", changed=False, command=current[0])
+                else:
+                    result = create(http_client, base_url, params, key, check_mode)
+            except HTTPError as err:
+                result = dict(failed=True, changed=False, msg=error_message(err))
+            done[(key, state)] = result
+
+        result = dict(result, key=key, before=current[0] if current else None)
+        results.append(result)
+
+    for command in undeclared:
+        try:
+            result = delete_entities(http_client, base_url, [command], "id", check_mode)
+        except HTTPError as err:
+            result = dict(failed=True, changed=False, msg=error_message(err))
+        key = command_key(command["command"], command.get("project_id"))
+        results.append(dict(result, key=key, before=command))
+
+    return results
+
+
+def declared_commands(module):
+    commands = []
+    for item in module.params["commands"]:
+        if not item.get("command"):
+            module.fail_json(changed=False, msg="Every item needs a `command`")
+        project_id = item.get("project_id", module.params["project_id"])
+        commands.append(
+            dict(
+                command=item["command"],
+                project_id=None if project_id is None else int(project_id),
+                state=item.get("state", "present"),
+            )
+        )
+    return commands
+
+
+def main():
+    argument_spec = dict(
+        url=dict(required=True, type="str"),
+        token=dict(required=True, type="str"),
+        # Commands without a project_id of their own belong to this project
+        project_id=dict(type="int"),
+        # Each item takes `command` and optionally `project_id` and `state`
+        commands=dict(required=True, type="list", elements="dict"),
+        # Delete commands of the declared projects that aren't declared
+        # themselves
+        purge=dict(type="bool", default=False),
+    )
+    argument_spec.update(CLIENT_ARGUMENT_SPEC)
+
+    module = AnsibleModule(argument_spec=argument_spec, supports_check_mode=True)
+
+    commands = declared_commands(module)
+    base_url = "/".join([module.params["url"], "commands"])
+
+    http_client = samson_client(module)
+
+    try:
+        results = reconcile(
+            http_client, base_url, commands, module.params["purge"], module.check_mode
+        )
+    except HTTPError as err:
+        module.fail_json(changed=False, msg=error_message(err))
+
+    diff = entities_diff(
+        results, "command", lambda result, _: "command " + result["key"][:12]
+    )
+    extra = dict(diff=diff) if module._diff else {}  # pylint: disable=protected-access
+
+    # The id of each declared command, in the order they were declared
+    ids = [r.get("command", {}).get("id") for r in results[: len(commands)]]
+
+    changed = any(result["changed"] for result in results)
+    failed = [result for result in results if result.get("failed")]
+    if failed:
+        msg = "Failed to reconcile {} command(s)".format(len(failed))
+        module.fail_json(changed=changed, msg=msg, commands=results, ids=ids, **extra)
+
+    module.exit_json(changed=changed, commands=results, ids=ids, **extra)
+
+
+if __name__ == "__main__":
+    main()
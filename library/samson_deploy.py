@@ -0,0 +1,172 @@
+from __future__ import (  # pylint: disable=unused-variable
+    absolute_import,
+    division,
+    print_function,
+)
+
+__metaclass__ = type  # pylint: disable=unused-variable
+
+import os
+from os.path import dirname, abspath, join
+import sys
+
+from ansible.module_utils.basic import AnsibleModule
+
+if os.environ.get("ENV") == "dev":
+    module_utils_path = join(dirname(dirname(abspath(__file__))), "module_utils")
+    sys.path.append(module_utils_path)
+    import samson_utils  # pylint: disable=no-name-in-module, import-error
+    import samson_deploys  # pylint: disable=no-name-in-module, import-error
+else:
+    from ansible.module_utils import (  # pylint: disable=no-name-in-module, ungrouped-imports
+        samson_utils,
+        samson_deploys,
+    )
+
+HTTPError = samson_utils.HTTPError
+error_message = samson_utils.error_message
+start_deploy = samson_deploys.start_deploy
+deploy_url = samson_deploys.deploy_url
+DeployWatch = samson_deploys.DeployWatch
+wait_for_deploys = samson_deploys.wait_for_deploys
+DEPLOY_TIMEOUT = samson_deploys.DEPLOY_TIMEOUT
+CLIENT_ARGUMENT_SPEC = samson_utils.CLIENT_ARGUMENT_SPEC
+samson_client = samson_utils.samson_client
+
+
+def declared_deploys(module):
+    """Returns what to deploy, or which deploys to follow when `id` is given.
+
+    Items may carry other keys, so the results of a task that didn't wait can
+    be passed on to one that does.
+    """
+    if module.params["deploys"] is None:
+        items = [
+            dict(
+                project_permalink=module.params["project_permalink"],
+                stage_permalink=module.params["stage_permalink"],
+                reference=module.params["reference"],
+                id=module.params["deploy_id"],
+            )
+        ]
+    else:
+        items = module.params["deploys"]
+
+    deploys = []
+    for item in items:
+        deploy = dict(
+            (key, item.get(key))
+            for key in ("project_permalink", "stage_permalink", "reference", "id")
+        )
+        if not deploy["project_permalink"]:
+            module.fail_json(
+                changed=False, msg="Every deploy needs a project_permalink"
+            )
+        if deploy["id"] is None and not (
+            deploy["stage_permalink"] and deploy["reference"]
+        ):
+            msg = "Deploys need an id or a stage_permalink and a reference"
+            module.fail_json(changed=False, msg=msg)
+        deploys.append(deploy)
+    return deploys
+
+
+def deploy_result(spec, watch):
+    result = dict(spec, id=watch.deploy["id"], status=watch.deploy.get("status"))
+    result.update(deploy=watch.deploy, polls=watch.polls, duration=watch.duration)
+    if watch.duration is not None and result["status"] != "succeeded":
+        result.update(failed=True, msg="Deploy {}".format(result["status"]))
+    return result
+
+
+def main():
+    argument_spec = dict(
+        url=dict(required=True, type="str"),
+        token=dict(required=True, type="str"),
+        project_permalink=dict(type="str"),
+        stage_permalink=dict(type="str"),
+        # A branch, tag or commit
+        reference=dict(type="str"),
+        # Follows a deploy that was already started instead
+        deploy_id=dict(type="int"),
+        # Many deploys at once instead of the one above, each with the same
+        # keys, `id` taking the place of `deploy_id`
+        deploys=dict(type="list", elements="dict"),
+        # Wait for the deploys to finish
+        wait=dict(type="bool", default=True),
+        timeout=dict(type="int", default=DEPLOY_TIMEOUT),
+        # Seconds between polls, doubling while nothing changes
+        poll_interval=dict(type="float", default=2.0),
+        max_poll_interval=dict(type="float", default=30.0),
+    )
+    argument_spec.update(CLIENT_ARGUMENT_SPEC)
+
+    module = AnsibleModule(
+        argument_spec=argument_spec,
+        required_one_of=[["project_permalink", "deploys"]],
+        mutually_exclusive=[["project_permalink", "deploys"]],
+        supports_check_mode=True,
+    )
+
+    deploys = declared_deploys(module)
+    started = [deploy for deploy in deploys if deploy["id"] is None]
+    if module.check_mode:
+        module.exit_json(changed=bool(started), deploys=deploys)
+
+    url = module.params["url"]
+    http_client = samson_client(module)
+
+    # Start every deploy before waiting for any of them
+    results = [None] * len(deploys)
+    watches = []
+    for index, spec in enumerate(deploys):
+        if spec["id"] is not None:
+            deploy = dict(id=spec["id"])
+        else:
+            try:
+                deploy = start_deploy(
+                    http_client,
+                    url,
+                    spec["project_permalink"],
+                    spec["stage_permalink"],
+                    spec["reference"],
+                )
+            except HTTPError as err:
+                results[index] = dict(spec, failed=True, msg=error_message(err))
+                continue
+        watch = DeployWatch(
+            deploy_url(url, spec["project_permalink"], deploy["id"]),
+            deploy,
+            module.params["poll_interval"],
+            module.params["max_poll_interval"],
+        )
+        watches.append((index, spec, watch))
+
+    finished = True
+    if module.params["wait"]:
+        try:
+            finished = wait_for_deploys(
+                http_client,
+                [watch for _, _, watch in watches],
+                module.params["timeout"],
+            )
+        except HTTPError as err:
+            module.fail_json(changed=bool(started), msg=error_message(err))
+
+    for index, spec, watch in watches:
+        results[index] = deploy_result(spec, watch)
+
+    result = dict(changed=bool(started), deploys=results)
+    if module.params["deploys"] is None:
+        result["deploy"] = results[0].get("deploy")
+
+    failed = [r for r in results if r.get("failed")]
+    if not finished:
+        module.fail_json(msg="Timed out waiting for the deploys", **result)
+    if failed:
+        module.fail_json(msg="{} deploy(s) failed".format(len(failed)), **result)
+    module.exit_json(**result)
+
+
+if __name__ == "__main__":
+    main()
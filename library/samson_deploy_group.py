@@ -11,20 +11,37 @@ from os.path import dirname, abspath, join
 import sys
 
 from ansible.module_utils.basic import AnsibleModule
-from ansible.module_utils.urls import Request
 
 if os.environ.get("ENV") == "dev":
     module_utils_path = join(dirname(dirname(abspath(__file__))), "module_utils")
     sys.path.append(module_utils_path)
     import samson_utils  # pylint: disable=no-name-in-module, import-error
+    import samson_html  # pylint: disable=no-name-in-module, import-error
 else:
     from ansible.module_utils import (  # pylint: disable=no-name-in-module, ungrouped-imports
         samson_utils,
+        samson_html,
     )
 
 delete_entity = samson_utils.delete_entity
 validate_permalink = samson_utils.validate_permalink
-upsert_using_html = samson_utils.upsert_using_html
+upsert_using_html = samson_html.upsert_using_html
+upsert_many_using_html = samson_html.upsert_many_using_html
+CACHE_ARGUMENT_SPEC = samson_utils.CACHE_ARGUMENT_SPEC
+CLIENT_ARGUMENT_SPEC = samson_utils.CLIENT_ARGUMENT_SPEC
+samson_client = samson_utils.samson_client
+
+
+def declared_items(module):
+    items = []
+    for item in module.params["items"]:
+        if item["environment_id"] is None:
+            item = dict(item, environment_id=module.params["environment_id"])
+        if item["state"] == "present" and item["environment_id"] is None:
+            msg = "Deploy group `{}` needs an environment_id".format(item["permalink"])
+            module.fail_json(changed=False, msg=msg)
+        items.append(dict((k, v) for k, v in item.items() if v is not None))
+    return items
 
 
 def main():
@@ -32,19 +49,50 @@ def main():
         state=dict(default="present", type="str", choices=["absent", "present"]),
         url=dict(required=True, type="str"),
         token=dict(required=True, type="str"),
-        permalink=dict(required=True, type="str"),
+        permalink=dict(type="str"),
         name=dict(type="str"),
         env_value=dict(required=False, type="str"),
-        environment_id=dict(required=True, type="int"),
+        # The environment of the `items` that don't name their own
+        environment_id=dict(type="int"),
+        # Converges many deploy groups at once instead of the one above
+        items=dict(
+            type="list",
+            elements="dict",
+            options=dict(
+                permalink=dict(required=True, type="str"),
+                name=dict(type="str"),
+                env_value=dict(type="str"),
+                environment_id=dict(type="int"),
+                state=dict(
+                    default="present", type="str", choices=["absent", "present"]
+                ),
+            ),
+            required_if=[["state", "present", ["name"]]],
+        ),
+        # Writes of `items` that run at the same time
+        concurrency=dict(type="int", default=8),
     )
+    argument_spec.update(CACHE_ARGUMENT_SPEC)
+    argument_spec.update(CLIENT_ARGUMENT_SPEC)
 
     module = AnsibleModule(
-        argument_spec=argument_spec, required_if=[["state", "present", ["name"]]]
+        argument_spec=argument_spec,
+        required_one_of=[["permalink", "items"], ["environment_id", "items"]],
+        mutually_exclusive=[["permalink", "items"]],
+        required_if=[["state", "present", ["name", "items"], True]],
+        supports_check_mode=True,
     )
 
+    base_url = "/".join([module.params["url"], "deploy_groups"])
+    http_client = samson_client(module)
+
+    if module.params["items"] is not None:
+        upsert_many_using_html(
+            module, http_client, base_url, declared_items(module), "deploy_group"
+        )
+
     validate_permalink(module)
 
-    base_url = "/".join([module.params["url"], "deploy_groups"])
     state = module.params["state"]
     params = dict(
         (k, module.params[k])
@@ -52,13 +100,6 @@ def main():
     )
     params = dict((k, v) for k, v in params.items() if v)
 
-    http_client = Request(
-        headers={
-            "Authorization": "Bearer {}".format(module.params["token"]),
-            "Content-Type": "application/json",
-        }
-    )
-
     if state == "present":
         upsert_using_html(module, http_client, base_url, params, "deploy_group")
 
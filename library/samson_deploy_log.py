@@ -0,0 +1,138 @@
+from __future__ import (  # pylint: disable=unused-variable
+    absolute_import,
+    division,
+    print_function,
+)
+
+__metaclass__ = type  # pylint: disable=unused-variable
+
+import os
+from os.path import dirname, abspath, join
+import sys
+import time
+
+from ansible.module_utils.basic import AnsibleModule
+
+if os.environ.get("ENV") == "dev":
+    module_utils_path = join(dirname(dirname(abspath(__file__))), "module_utils")
+    sys.path.append(module_utils_path)
+    import samson_utils  # pylint: disable=no-name-in-module, import-error
+    import samson_deploys  # pylint: disable=no-name-in-module, import-error
+else:
+    from ansible.module_utils import (  # pylint: disable=no-name-in-module, ungrouped-imports
+        samson_utils,
+        samson_deploys,
+    )
+
+HTTPError = samson_utils.HTTPError
+error_message = samson_utils.error_message
+deploy_url = samson_deploys.deploy_url
+deploy_output_url = samson_deploys.deploy_output_url
+DeployWatch = samson_deploys.DeployWatch
+LogTail = samson_deploys.LogTail
+timer = samson_utils.timer
+DEPLOY_TIMEOUT = samson_deploys.DEPLOY_TIMEOUT
+CLIENT_ARGUMENT_SPEC = samson_utils.CLIENT_ARGUMENT_SPEC
+samson_client = samson_utils.samson_client
+
+
+def follow(module, http_client, watch, tail):
+    """Reads the output until the deploy finished.
+
+    The interval between reads doubles while nothing is written and starts
+    over once output arrives. Returns False on timeout.
+    """
+    interval = module.params["poll_interval"]
+    deadline = timer() + module.params["timeout"]
+    while True:
+        # The output read after the deploy finished is complete
+        watch.poll(http_client)
+        received = tail.read(http_client)
+        if watch.finished or not module.params["follow"]:
+            return True
+        now = timer()
+        if now >= deadline:
+            return False
+        if received:
+            interval = module.params["poll_interval"]
+        else:
+            interval = min(interval * 2, module.params["max_poll_interval"])
+        time.sleep(min(interval, deadline - now))
+
+
+def main():
+    argument_spec = dict(
+        url=dict(required=True, type="str"),
+        token=dict(required=True, type="str"),
+        project_permalink=dict(required=True, type="str"),
+        deploy_id=dict(required=True, type="int"),
+        # Where an earlier task stopped reading, in bytes or lines
+        offset=dict(type="int", default=0),
+        line=dict(type="int", default=0),
+        # Appended to when resuming, overwritten otherwise
+        dest=dict(type="path"),
+        # Keep reading until the deploy finished
+        follow=dict(type="bool", default=True),
+        timeout=dict(type="int", default=DEPLOY_TIMEOUT),
+        # Seconds between reads, doubling while nothing is written
+        poll_interval=dict(type="float", default=2.0),
+        max_poll_interval=dict(type="float", default=30.0),
+        # The last lines that are returned
+        tail_lines=dict(type="int", default=100),
+    )
+    argument_spec.update(CLIENT_ARGUMENT_SPEC)
+
+    module = AnsibleModule(argument_spec=argument_spec, supports_check_mode=True)
+
+    url = module.params["url"]
+    project_permalink = module.params["project_permalink"]
+    deploy_id = module.params["deploy_id"]
+    offset = module.params["offset"]
+    line = module.params["line"]
+    http_client = samson_client(module)
+
+    dest = module.params["dest"]
+    log_file = None
+    if dest and not module.check_mode:
+        # Unbuffered, so the output can be followed as it arrives
+        log_file = open(dest, "ab" if offset or line else "wb", 0)
+
+    tail = LogTail(
+        deploy_output_url(url, project_permalink, deploy_id),
+        offset=offset,
+        line=line,
+        keep=module.params["tail_lines"],
+        sink=log_file.write if log_file else None,
+    )
+    watch = DeployWatch(
+        deploy_url(url, project_permalink, deploy_id),
+        dict(id=deploy_id),
+        module.params["poll_interval"],
+        module.params["max_poll_interval"],
+    )
+
+    try:
+        finished = follow(module, http_client, watch, tail)
+    except HTTPError as err:
+        module.fail_json(changed=False, msg=error_message(err))
+    finally:
+        if log_file:
+            log_file.close()
+
+    result = dict(
+        changed=bool(dest and tail.received),
+        deploy=watch.deploy,
+        status=watch.deploy.get("status"),
+        finished=watch.finished,
+        offset=tail.offset,
+        line=tail.line,
+        lines=tail.tail(),
+        bytes=tail.received,
+    )
+    if not finished:
+        module.fail_json(msg="Timed out waiting for the deploy", **result)
+    module.exit_json(**result)
+
+
+if __name__ == "__main__":
+    main()
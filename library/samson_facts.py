@@ -0,0 +1,269 @@
+from __future__ import (  # pylint: disable=unused-variable
+    absolute_import,
+    division,
+    print_function,
+)
+
+__metaclass__ = type  # pylint: disable=unused-variable
+
+import os
+from os.path import dirname, abspath, join
+import sys
+import tempfile
+from multiprocessing.pool import ThreadPool
+
+from ansible.module_utils.basic import AnsibleModule, missing_required_lib
+
+try:
+    import queue  # pylint: disable=import-error
+except ImportError:
+    import Queue as queue  # pylint: disable=import-error
+
+if os.environ.get("ENV") == "dev":
+    module_utils_path = join(dirname(dirname(abspath(__file__))), "module_utils")
+    sys.path.append(module_utils_path)
+    import samson_utils  # pylint: disable=no-name-in-module, import-error
+    import samson_snapshot  # pylint: disable=no-name-in-module, import-error
+else:
+    from ansible.module_utils import (  # pylint: disable=no-name-in-module, ungrouped-imports
+        samson_utils,
+        samson_snapshot,
+    )
+
+HTTPError = samson_utils.HTTPError
+SamsonError = samson_utils.SamsonError
+iter_items = samson_utils.iter_items
+error_message = samson_utils.error_message
+Snapshot = samson_snapshot.Snapshot
+SnapshotDigest = samson_snapshot.SnapshotDigest
+SnapshotWriter = samson_snapshot.SnapshotWriter
+snapshot_encoder = samson_snapshot.snapshot_encoder
+SNAPSHOT_FORMATS = samson_snapshot.SNAPSHOT_FORMATS
+CLIENT_ARGUMENT_SPEC = samson_utils.CLIENT_ARGUMENT_SPEC
+samson_client = samson_utils.samson_client
+
+COLLECTIONS = [
+    "projects",
+    "stages",
+    "commands",
+    "environments",
+    "deploy_groups",
+    "webhooks",
+]
+
+# The listings of each project and the kind of their records
+PROJECT_LISTINGS = dict(
+    stages=[("stages", "stages", "stage")],
+    webhooks=[
+        ("webhooks", "webhooks", "webhook"),
+        ("outbound_webhooks", "webhooks", "outbound_webhook"),
+    ],
+)
+
+# Marks the end of a listing in the queue of crawled items
+DONE = object()
+
+
+class Crawler(object):
+    """Lists collections at most `concurrency` at a time.
+
+    The items of every listing end up in one bounded queue as they're decoded,
+    so only the items that weren't written yet are held in memory.
+    """
+
+    def __init__(self, http_client, writer, concurrency):
+        self.http_client = http_client
+        self.writer = writer
+        self.pool = ThreadPool(concurrency)
+        self.crawled = queue.Queue(concurrency * 100)
+        self.running = 0
+
+    def submit(self, base_url, json_key, kind, fields=None):
+        self.running += 1
+        self.pool.apply_async(self.fetch, (base_url, json_key, kind, fields or {}))
+
+    def fetch(self, base_url, json_key, kind, fields):
+        try:
+            for item in iter_items(self.http_client, base_url, json_key):
+                # Nested listings leave out what they're nested in
+                for key, value in fields.items():
+                    item.setdefault(key, value)
+                self.crawled.put((kind, item))
+        except Exception as err:  # pylint: disable=broad-except
+            self.crawled.put((DONE, err))
+        else:
+            self.crawled.put((DONE, None))
+
+    def drain(self, block):
+        while self.running:
+            try:
+                kind, item = self.crawled.get(block)
+            except queue.Empty:
+                return
+            if kind is DONE:
+                self.running -= 1
+                if item is not None:
+                    raise item
+            else:
+                self.writer.write(kind, item)
+
+    def close(self):
+        self.pool.close()
+        self.pool.join()
+
+
+def crawl(http_client, url, collections, writer, concurrency):
+    crawler = Crawler(http_client, writer, concurrency)
+    try:
+        for collection in ("commands", "environments", "deploy_groups"):
+            if collection in collections:
+                base_url = "/".join([url, collection])
+                crawler.submit(base_url, collection, collection[:-1])
+
+        nested = [
+            listing
+            for collection in collections
+            for listing in PROJECT_LISTINGS.get(collection, [])
+        ]
+        if "projects" in collections or nested:
+            for project in iter_items(http_client, url + "/projects", "projects"):
+                if "projects" in collections:
+                    writer.write("project", project)
+                project_url = "/".join([url, "projects", project["permalink"]])
+                for collection, json_key, kind in nested:
+                    base_url = "/".join([project_url, collection])
+                    crawler.submit(
+                        base_url, json_key, kind, dict(project_id=project["id"])
+                    )
+                crawler.drain(block=False)
+
+        crawler.drain(block=True)
+    finally:
+        # Unblock the listings that are still running after a failure
+        while crawler.running:
+            kind, _ = crawler.crawled.get()
+            if kind is DONE:
+                crawler.running -= 1
+        crawler.close()
+
+
+def same_snapshot(dest, snapshot_format, digest):
+    """Tells whether `dest` already holds the snapshot with this digest."""
+    if not os.path.exists(dest):
+        return False
+    try:
+        existing = Snapshot(dest)
+    except (SamsonError, IOError, OSError, ValueError):
+        # Whatever's there is replaced
+        return False
+    return existing.msgpack == (snapshot_format == "msgpack") and (
+        existing.digest() == digest
+    )
+
+
+def write_snapshot(dest, snapshot_format, fill):
+    """Streams the snapshot into a temporary file and renames it to `dest`.
+
+    An existing `dest` is kept when it holds the same snapshot. Returns the
+    writer and whether `dest` changed.
+    """
+    directory = os.path.dirname(os.path.abspath(dest))
+    encode = snapshot_encoder(snapshot_format)
+    digest = SnapshotDigest()
+    try:
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".samson-snapshot")
+    except (IOError, OSError) as err:
+        raise SamsonError("Can't write snapshot {}: {}".format(dest, err))
+    try:
+        with os.fdopen(fd, "wb") as tmp_file:
+
+            def emit(record):
+                digest.add(record)
+                tmp_file.write(encode(record))
+
+            writer = fill(emit)
+        changed = not same_snapshot(dest, snapshot_format, digest.hexdigest())
+        if changed:
+            try:
+                os.rename(tmp_path, dest)
+            except OSError as err:
+                raise SamsonError("Can't write snapshot {}: {}".format(dest, err))
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+    if not changed:
+        os.remove(tmp_path)
+    return writer, changed
+
+
+def main():
+    argument_spec = dict(
+        url=dict(required=True, type="str"),
+        token=dict(required=True, type="str"),
+        collections=dict(
+            type="list", elements="str", default=COLLECTIONS, choices=COLLECTIONS
+        ),
+        # Without a dest the snapshot is returned
+        dest=dict(type="path"),
+        format=dict(type="str", default="jsonl", choices=list(SNAPSHOT_FORMATS)),
+        concurrency=dict(type="int", default=8),
+    )
+    argument_spec.update(CLIENT_ARGUMENT_SPEC)
+
+    module = AnsibleModule(argument_spec=argument_spec, supports_check_mode=True)
+
+    dest = module.params["dest"]
+    if (
+        dest
+        and module.params["format"] == "msgpack"
+        and samson_snapshot.msgpack is None
+    ):
+        module.fail_json(msg=missing_required_lib("msgpack"))
+
+    if module.params["concurrency"] < 1:
+        module.fail_json(msg="concurrency must be at least 1")
+
+    collections = set(module.params["collections"])
+    if collections & set(PROJECT_LISTINGS):
+        # Lookups find nested collections through their project
+        collections.add("projects")
+
+    http_client = samson_client(module)
+
+    def fill(emit):
+        writer = SnapshotWriter(emit, module.params["url"], collections)
+        crawl(
+            http_client,
+            module.params["url"],
+            collections,
+            writer,
+            module.params["concurrency"],
+        )
+        return writer
+
+    result = dict(changed=False)
+    try:
+        if dest and not module.check_mode:
+            writer, changed = write_snapshot(dest, module.params["format"], fill)
+            result.update(changed=changed, dest=dest)
+        elif dest:
+            # Crawl anyway to report whether it would have changed
+            digest = SnapshotDigest()
+            writer = fill(digest.add)
+            result["changed"] = not same_snapshot(
+                dest, module.params["format"], digest.hexdigest()
+            )
+        else:
+            result["snapshot"] = []
+            writer = fill(result["snapshot"].append)
+    except (HTTPError, SamsonError) as err:
+        module.fail_json(msg=error_message(err))
+
+    result["counts"] = writer.counts
+    module.exit_json(**result)
+
+
+if __name__ == "__main__":
+    main()
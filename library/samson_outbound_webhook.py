@@ -12,7 +12,6 @@ from os.path import dirname, abspath, join
 import sys
 
 from ansible.module_utils.basic import AnsibleModule
-from ansible.module_utils.urls import Request
 
 if os.environ.get("ENV") == "dev":
     module_utils_path = join(dirname(dirname(abspath(__file__))), "module_utils")
@@ -27,7 +26,12 @@ else:
 HTTPError = samson_utils.HTTPError
 entity_url = samson_utils.entity_url
 find_item = samson_utils.find_item
-find_project_by_id = samson_utils.find_project_by_id
+project_permalink_param = samson_utils.project_permalink_param
+diff_result = samson_utils.diff_result
+load_json = samson_utils.load_json
+CLIENT_ARGUMENT_SPEC = samson_utils.CLIENT_ARGUMENT_SPEC
+create_with_relookup = samson_utils.create_with_relookup
+samson_client = samson_utils.samson_client
 
 
 def find_outbound_webhook(http_client, base_url, params):
@@ -42,13 +46,27 @@ def create(module, http_client, base_url, params):
     if webhook:
         module.exit_json(changed=False, outbound_webhook=webhook)
 
+    if module.check_mode:
+        planned = dict((k, v) for k, v in params.items() if k != "password")
+        planned["webhook_url"] = planned.pop("url")
+        module.exit_json(
+            changed=True, outbound_webhook=planned, **diff_result(module, None, planned)
+        )
+
     url = entity_url(base_url)
     try:
-        res = http_client.post(url, data=json.dumps(params))
-        webhook = json.load(res)["outbound_webhook"]
+        webhook = create_with_relookup(
+            http_client,
+            lambda: load_json(http_client.post(url, data=json.dumps(params)))[
+                "outbound_webhook"
+            ],
+            lambda: find_outbound_webhook(http_client, base_url, params),
+        )
         webhook["webhook_url"] = webhook["url"]
         del webhook["url"]
-        module.exit_json(changed=True, outbound_webhook=webhook)
+        module.exit_json(
+            changed=True, outbound_webhook=webhook, **diff_result(module, None, webhook)
+        )
     except HTTPError as err:
         msg = err.msg
         if err.code == 422:
@@ -61,11 +79,14 @@ def delete(module, http_client, base_url, params):
     if not webhook:
         module.exit_json(changed=False)
 
+    if module.check_mode:
+        module.exit_json(changed=True, **diff_result(module, webhook, None))
+
     try:
         url = entity_url(base_url, identifier=str(webhook["id"]))
         http_client.delete(url)
 
-        module.exit_json(changed=True)
+        module.exit_json(changed=True, **diff_result(module, webhook, None))
     except HTTPError as err:
         if err.code == 404:
             module.exit_json(changed=False)
@@ -78,41 +99,42 @@ def main():
         state=dict(default="present", type="str", choices=["absent", "present"]),
         url=dict(required=True, type="str"),
         token=dict(required=True, type="str"),
-        project_id=dict(required=True, type="int"),
+        # The project is named by either of these
+        project_id=dict(type="int"),
+        project_permalink=dict(type="str"),
         stage_id=dict(required=True, type="int"),
         webhook_url=dict(type="str", default=""),
         username=dict(type="str"),
         password=dict(type="str", no_log=True),
     )
+    argument_spec.update(CLIENT_ARGUMENT_SPEC)
 
     module = AnsibleModule(
         argument_spec=argument_spec,
+        supports_check_mode=True,
+        required_one_of=[["project_id", "project_permalink"]],
+        mutually_exclusive=[["project_id", "project_permalink"]],
         required_if=[["state", "present", ["stage_id", "webhook_url"]]],
     )
 
     state = module.params["state"]
-    token = module.params["token"]
     params = module.params.copy()
     del params["url"]
     del params["state"]
     del params["token"]
+    for key in CLIENT_ARGUMENT_SPEC:
+        del params[key]
     del params["project_id"]
+    del params["project_permalink"]
     params["url"] = module.params["webhook_url"]
     del params["webhook_url"]
 
-    http_client = Request(
-        headers={
-            "Authorization": "Bearer {}".format(token),
-            "Content-Type": "application/json",
-        }
-    )
+    http_client = samson_client(module)
 
-    project = find_project_by_id(
-        http_client, module.params["url"], module.params["project_id"]
-    )
+    project_permalink = project_permalink_param(module, http_client)
 
     base_url = "/".join(
-        [module.params["url"], "projects", project["permalink"], "outbound_webhooks"]
+        [module.params["url"], "projects", project_permalink, "outbound_webhooks"]
     )
 
     if state == "present":
@@ -0,0 +1,284 @@
+from __future__ import (  # pylint: disable=unused-variable
+    absolute_import,
+    division,
+    print_function,
+)
+
+__metaclass__ = type  # pylint: disable=unused-variable
+
+import os
+from os.path import dirname, abspath, join
+import sys
+
+from ansible.module_utils.basic import AnsibleModule
+
+if os.environ.get("ENV") == "dev":
+    module_utils_path = join(dirname(dirname(abspath(__file__))), "module_utils")
+    sys.path.append(module_utils_path)
+    import samson_utils  # pylint: disable=no-name-in-module, import-error
+    import samson_deploys  # pylint: disable=no-name-in-module, import-error
+else:
+    from ansible.module_utils import (  # pylint: disable=no-name-in-module, ungrouped-imports
+        samson_utils,
+        samson_deploys,
+    )
+
+HTTPError = samson_utils.HTTPError
+error_message = samson_utils.error_message
+fetch_listing = samson_utils.fetch_listing
+start_deploy = samson_deploys.start_deploy
+deploy_url = samson_deploys.deploy_url
+DeployWatch = samson_deploys.DeployWatch
+poll_due = samson_deploys.poll_due
+timer = samson_utils.timer
+DEPLOY_TIMEOUT = samson_deploys.DEPLOY_TIMEOUT
+project_permalink_param = samson_utils.project_permalink_param
+CLIENT_ARGUMENT_SPEC = samson_utils.CLIENT_ARGUMENT_SPEC
+samson_client = samson_utils.samson_client
+
+
+def stage_ids(stage, key):
+    # Samson keeps these as lists of strings, blank ones included
+    return set(int(i) for i in stage.get(key) or [] if str(i).strip())
+
+
+def build_pipeline(module, stages, roots):
+    """Returns the stages to deploy in topological order.
+
+    The pipeline holds the `roots` and every stage their `next_stage_ids` lead
+    to. A stage waits for the stages of the pipeline it's a next stage of and
+    for its prerequisites in the pipeline. Prerequisites outside of it are
+    left to Samson, which refuses deploys they haven't deployed yet.
+    """
+    by_permalink = dict((stage["permalink"], stage) for stage in stages)
+    by_id = dict((stage["id"], stage) for stage in stages)
+    missing = [permalink for permalink in roots if permalink not in by_permalink]
+    if missing:
+        msg = "Stage(s) {} don't exist".format(", ".join(missing))
+        module.fail_json(changed=False, msg=msg)
+
+    included = {}
+    todo = [by_permalink[permalink] for permalink in roots]
+    while todo:
+        stage = todo.pop()
+        if stage["id"] in included:
+            continue
+        included[stage["id"]] = stage
+        todo.extend(by_id[i] for i in stage_ids(stage, "next_stage_ids") if i in by_id)
+
+    waits = dict((stage_id, set()) for stage_id in included)
+    for stage_id, stage in included.items():
+        for next_id in stage_ids(stage, "next_stage_ids"):
+            if next_id in waits and next_id != stage_id:
+                waits[next_id].add(stage_id)
+        waits[stage_id].update(
+            i
+            for i in stage_ids(stage, "prerequisite_stage_ids")
+            if i in included and i != stage_id
+        )
+
+    # Kahn's algorithm, keeping the order of the listing among equals
+    ordered = []
+    done = set()
+    remaining = [stage for stage in stages if stage["id"] in included]
+    while remaining:
+        ready = [stage for stage in remaining if waits[stage["id"]] <= done]
+        if not ready:
+            msg = "Circular reference between the stages {}".format(
+                ", ".join(stage["permalink"] for stage in remaining)
+            )
+            module.fail_json(changed=False, msg=msg)
+        ordered.extend(ready)
+        done.update(stage["id"] for stage in ready)
+        remaining = [stage for stage in remaining if stage["id"] not in done]
+
+    return [
+        dict(
+            stage=stage,
+            waits=waits[stage["id"]],
+            waits_for=[by_id[i]["permalink"] for i in sorted(waits[stage["id"]])],
+        )
+        for stage in ordered
+    ]
+
+
+class Pipeline(object):
+    """Deploys every stage as soon as the stages it waits for succeeded.
+
+    The deploys of all stages are polled from one loop. Stages that
+    `run_in_parallel` start next to whatever else is deploying, any other
+    stage deploys on its own.
+    """
+
+    def __init__(self, http_client, url, project_permalink, params):
+        self.http_client = http_client
+        self.url = url
+        self.project_permalink = project_permalink
+        self.params = params
+        self.watches = {}
+        self.parallel = set()
+        # Stages that failed to start or were skipped
+        self.results = {}
+
+    def status(self, stage_id):
+        if stage_id in self.results:
+            return "failed"
+        watch = self.watches.get(stage_id)
+        if watch is None:
+            return None
+        return watch.deploy.get("status") if watch.finished else "running"
+
+    def running(self):
+        return [watch for watch in self.watches.values() if not watch.finished]
+
+    def run(self, nodes):
+        deadline = timer() + self.params["timeout"]
+        pending = list(nodes)
+        while True:
+            pending = self.schedule(pending)
+            running = self.running()
+            if not running:
+                return True
+            if timer() >= deadline:
+                return False
+            poll_due(self.http_client, running, deadline)
+
+    def schedule(self, pending):
+        """Starts the stages that are ready, returns the rest."""
+        waiting = []
+        serial = [
+            stage_id
+            for stage_id, watch in self.watches.items()
+            if not watch.finished and stage_id not in self.parallel
+        ]
+        for node in pending:
+            stage = node["stage"]
+            statuses = [self.status(i) for i in node["waits"]]
+            if any(s not in (None, "running", "succeeded") for s in statuses):
+                # Nodes are ordered, so the ones waiting for this one see the
+                # skip later in the loop
+                self.results[stage["id"]] = dict(
+                    action="skipped", failed=True, msg="A stage it waits for failed"
+                )
+            elif any(s != "succeeded" for s in statuses):
+                waiting.append(node)
+            elif serial or (not stage.get("run_in_parallel") and self.running()):
+                # Later stages don't overtake a stage that waits its turn
+                serial = serial or [stage["id"]]
+                waiting.append(node)
+            else:
+                self.start(stage)
+                if not stage.get("run_in_parallel"):
+                    serial = [stage["id"]]
+        return waiting
+
+    def start(self, stage):
+        try:
+            deploy = start_deploy(
+                self.http_client,
+                self.url,
+                self.project_permalink,
+                stage["permalink"],
+                self.params["reference"],
+            )
+        except HTTPError as err:
+            self.results[stage["id"]] = dict(
+                action="started", failed=True, msg=error_message(err)
+            )
+            return
+        watch = DeployWatch(
+            deploy_url(self.url, self.project_permalink, deploy["id"]),
+            deploy,
+            self.params["poll_interval"],
+            self.params["max_poll_interval"],
+        )
+        if stage.get("run_in_parallel"):
+            self.parallel.add(stage["id"])
+        self.watches[stage["id"]] = watch
+
+    def result(self, node):
+        stage = node["stage"]
+        result = dict(
+            permalink=stage["permalink"], id=stage["id"], waits_for=node["waits_for"]
+        )
+        if stage["id"] in self.results:
+            result.update(self.results[stage["id"]])
+            return result
+        watch = self.watches.get(stage["id"])
+        if watch is None:
+            result["action"] = "pending"
+            return result
+        result.update(
+            action="started",
+            deploy=watch.deploy,
+            status=watch.deploy.get("status"),
+            polls=watch.polls,
+            duration=watch.duration,
+        )
+        if watch.finished and result["status"] != "succeeded":
+            result.update(failed=True, msg="Deploy {}".format(result["status"]))
+        return result
+
+
+def main():
+    argument_spec = dict(
+        url=dict(required=True, type="str"),
+        token=dict(required=True, type="str"),
+        # The project is named by either of these
+        project_id=dict(type="int"),
+        project_permalink=dict(type="str"),
+        # A branch, tag or commit
+        reference=dict(required=True, type="str"),
+        # Where the pipeline starts, it follows their next stages from there
+        stages=dict(required=True, type="list", elements="str"),
+        timeout=dict(type="int", default=DEPLOY_TIMEOUT),
+        # Seconds between polls, doubling while nothing changes
+        poll_interval=dict(type="float", default=2.0),
+        max_poll_interval=dict(type="float", default=30.0),
+    )
+    argument_spec.update(CLIENT_ARGUMENT_SPEC)
+
+    module = AnsibleModule(
+        argument_spec=argument_spec,
+        supports_check_mode=True,
+        required_one_of=[["project_id", "project_permalink"]],
+        mutually_exclusive=[["project_id", "project_permalink"]],
+    )
+
+    url = module.params["url"]
+    http_client = samson_client(module)
+    project_permalink = project_permalink_param(module, http_client)
+    stages_url = "/".join([url, "projects", project_permalink, "stages"])
+
+    try:
+        stages = fetch_listing(http_client, stages_url, "stages")
+    except HTTPError as err:
+        module.fail_json(changed=False, msg=error_message(err))
+
+    nodes = build_pipeline(module, stages.items, module.params["stages"])
+    pipeline = Pipeline(http_client, url, project_permalink, module.params)
+
+    if module.check_mode:
+        results = [dict(pipeline.result(node), action="planned") for node in nodes]
+        module.exit_json(changed=bool(nodes), stages=results)
+
+    try:
+        finished = pipeline.run(nodes)
+    except HTTPError as err:
+        results = [pipeline.result(node) for node in nodes]
+        module.fail_json(
+            changed=bool(pipeline.watches), msg=error_message(err), stages=results
+        )
+
+    results = [pipeline.result(node) for node in nodes]
+    result = dict(changed=bool(pipeline.watches), stages=results)
+    failed = [r for r in results if r.get("failed")]
+    if not finished:
+        module.fail_json(msg="Timed out waiting for the deploys", **result)
+    if failed:
+        module.fail_json(msg="{} stage(s) failed".format(len(failed)), **result)
+    module.exit_json(**result)
+
+
+if __name__ == "__main__":
+    main()
@@ -12,7 +12,6 @@ from os.path import dirname, abspath, join
 import sys
 
 from ansible.module_utils.basic import AnsibleModule
-from ansible.module_utils.urls import Request
 
 if os.environ.get("ENV") == "dev":
     module_utils_path = join(dirname(dirname(abspath(__file__))), "module_utils")
@@ -24,37 +23,42 @@ else:
     )
 
 HTTPError = samson_utils.HTTPError
+SamsonError = samson_utils.SamsonError
 entity_url = samson_utils.entity_url
 delete_entity = samson_utils.delete_entity
 validate_permalink = samson_utils.validate_permalink
-strip_disallowed_props = samson_utils.strip_disallowed_props
-
-
-PROJECT_DISALLOWED_PROPS = [
-    "id",
-    "created_at",
-    "updated_at",
-    "build_command_id",
-    "docker_image_building_disabled",
-    "build_with_gcb",
-    "kubernetes_allow_writing_to_root_filesystem",
-]
+exit_if_cached = samson_utils.exit_if_cached
+exit_with_state = samson_utils.exit_with_state
+planned_entity = samson_utils.planned_entity
+changed_fields = samson_utils.changed_fields
+find_item_by = samson_utils.find_item_by
+create_entity = samson_utils.create_entity
+rename_entity = samson_utils.rename_entity
+CACHE_ARGUMENT_SPEC = samson_utils.CACHE_ARGUMENT_SPEC
+load_json = samson_utils.load_json
+CLIENT_ARGUMENT_SPEC = samson_utils.CLIENT_ARGUMENT_SPEC
+samson_client = samson_utils.samson_client
 
 
 def create(module, http_client, base_url, ansible_params):
-    url = entity_url(base_url)
-    res = http_client.post(url, data=json.dumps(ansible_params))
-    project = json.load(res)["project"]
+    if module.check_mode:
+        exit_with_state(
+            module, base_url, ansible_params, "project", dict(ansible_params), True
+        )
 
     try:
         # Samson doesn't use the permalink we give to it, so we have to update
         # the project post-creation to ensure the permalink is the one the user
         # provided
-        url = entity_url(base_url, project["permalink"])
-        data = {"permalink": ansible_params["permalink"]}
-        res = http_client.patch(url, data=json.dumps(data))
-        project = json.load(res)["project"]
-        module.exit_json(changed=True, project=project)
+        created = create_entity(
+            http_client, base_url, "project", ansible_params, ansible_params["name"]
+        )
+        project = rename_entity(
+            http_client, base_url, created, ansible_params["permalink"], "project"
+        )
+        exit_with_state(module, base_url, ansible_params, "project", project, True)
+    except SamsonError as err:
+        module.fail_json(changed=False, msg=err.msg)
     except HTTPError as err:
         msg = err.msg
         if err.code == 422:
@@ -63,19 +67,25 @@ def create(module, http_client, base_url, ansible_params):
 
 
 def update(module, http_client, base_url, project, ansible_params):
-    updated_project = project.copy()
-    updated_project.update(ansible_params)
-    updated_project = strip_disallowed_props(updated_project, PROJECT_DISALLOWED_PROPS)
-    project_copy = strip_disallowed_props(project, PROJECT_DISALLOWED_PROPS)
-
-    if project_copy == updated_project:
-        module.exit_json(changed=False, project=project)
+    changes = changed_fields(project, ansible_params)
+    if not changes:
+        exit_with_state(
+            module, base_url, ansible_params, "project", project, False, project
+        )
+
+    if module.check_mode:
+        planned = planned_entity(project, ansible_params)
+        exit_with_state(
+            module, base_url, ansible_params, "project", planned, True, project
+        )
 
     try:
         url = entity_url(base_url, project["permalink"])
-        res = http_client.patch(url, data=json.dumps(updated_project))
-        project = json.load(res)["project"]
-        module.exit_json(changed=True, project=project)
+        res = http_client.patch(url, data=json.dumps(changes))
+        updated = load_json(res)["project"]
+        exit_with_state(
+            module, base_url, ansible_params, "project", updated, True, project
+        )
     except HTTPError as err:
         msg = err.msg
         if err.code == 422:
@@ -84,10 +94,21 @@ def update(module, http_client, base_url, project, ansible_params):
 
 
 def upsert(module, http_client, base_url, ansible_params):
+    exit_if_cached(module, base_url, ansible_params, "project")
+
+    if module.check_mode:
+        # Plan against the listing so a batch of tasks shares one snapshot
+        project = find_item_by(
+            http_client, base_url, "projects", "permalink", ansible_params["permalink"]
+        )
+        if project:
+            update(module, http_client, base_url, project, ansible_params)
+        create(module, http_client, base_url, ansible_params)
+
     try:
         url = entity_url(base_url, ansible_params["permalink"])
         res = http_client.get(url)
-        project = json.load(res)["project"]
+        project = load_json(res)["project"]
         update(module, http_client, base_url, project, ansible_params)
     # pylint: disable=W0703
     except HTTPError as err:
@@ -110,10 +131,13 @@ def main():
         name=dict(type="str"),
         repository_url=dict(type="str"),
     )
+    argument_spec.update(CACHE_ARGUMENT_SPEC)
+    argument_spec.update(CLIENT_ARGUMENT_SPEC)
 
     module = AnsibleModule(
         argument_spec=argument_spec,
         required_if=[["state", "present", ["name", "repository_url"]]],
+        supports_check_mode=True,
     )
 
     validate_permalink(module)
@@ -124,12 +148,7 @@ def main():
         (k, module.params[k]) for k in ("permalink", "repository_url", "name")
     )
 
-    http_client = Request(
-        headers={
-            "Authorization": "Bearer {}".format(module.params["token"]),
-            "Content-Type": "application/json",
-        }
-    )
+    http_client = samson_client(module)
 
     if state == "present":
         upsert(module, http_client, base_url, project_params)
@@ -12,7 +12,6 @@ import os
 from os.path import dirname, abspath, join
 
 from ansible.module_utils.basic import AnsibleModule
-from ansible.module_utils.urls import Request
 
 if os.environ.get("ENV") == "dev":
     module_utils_path = join(dirname(dirname(abspath(__file__))), "module_utils")
@@ -24,42 +23,44 @@ else:
     )
 
 HTTPError = samson_utils.HTTPError
+SamsonError = samson_utils.SamsonError
 entity_url = samson_utils.entity_url
 delete_entity = samson_utils.delete_entity
 validate_permalink = samson_utils.validate_permalink
-
-
-def strip_none_props(d):
-    return {k: v for k, v in d.items() if v is not None}
-
-
-def find_stage_by_name(http_client, base_url, name):
-    res = http_client.get(entity_url(base_url))
-    stages = json.load(res)["stages"]
-    for stage in stages:
-        if stage["name"] == name:
-            return stage
-    return None
+strip_none_props = samson_utils.strip_none_props
+find_item_by = samson_utils.find_item_by
+create_entity = samson_utils.create_entity
+rename_entity = samson_utils.rename_entity
+exit_if_cached = samson_utils.exit_if_cached
+exit_with_state = samson_utils.exit_with_state
+changed_fields = samson_utils.changed_fields
+planned_entity = samson_utils.planned_entity
+CACHE_ARGUMENT_SPEC = samson_utils.CACHE_ARGUMENT_SPEC
+load_json = samson_utils.load_json
+CLIENT_ARGUMENT_SPEC = samson_utils.CLIENT_ARGUMENT_SPEC
+samson_client = samson_utils.samson_client
 
 
 def create(module, http_client, base_url, ansible_params):
-    try:
-        url = entity_url(base_url)
+    if module.check_mode:
         stage = strip_none_props(ansible_params)
-        res = http_client.post(url, data=json.dumps({"stage": stage}))
+        exit_with_state(module, base_url, ansible_params, "stage", stage, True)
 
+    try:
         # The Samson API doesn't actually use the permalink we provided on
         # creation. Instead it uses the name with whitespace replaced by dashes.
         # We need to perform a creation post-update to ensure the permalink is
         # the one the user provided.
-        stage = find_stage_by_name(http_client, base_url, ansible_params["name"])
-        url = entity_url(base_url, stage["permalink"])
-        res = http_client.patch(
-            url, data=json.dumps({"permalink": ansible_params["permalink"]})
+        stage = strip_none_props(ansible_params)
+        created = create_entity(
+            http_client, base_url, "stage", {"stage": stage}, stage["name"]
         )
-
-        stage = json.load(res)["stage"]
-        module.exit_json(changed=True, stage=stage)
+        stage = rename_entity(
+            http_client, base_url, created, ansible_params["permalink"], "stage"
+        )
+        exit_with_state(module, base_url, ansible_params, "stage", stage, True)
+    except SamsonError as err:
+        module.fail_json(changed=False, msg=err.msg)
     except HTTPError as err:
         msg = err.msg
         if err.code == 422:
@@ -68,14 +69,21 @@ def create(module, http_client, base_url, ansible_params):
 
 
 def update(module, http_client, base_url, stage, ansible_params):
-    ansible_params = strip_none_props(ansible_params)
+    params = strip_none_props(ansible_params)
+    changes = changed_fields(stage, params)
+    if not changes:
+        exit_with_state(module, base_url, ansible_params, "stage", stage, False, stage)
+
+    if module.check_mode:
+        planned = planned_entity(stage, params)
+        exit_with_state(module, base_url, ansible_params, "stage", planned, True, stage)
 
     try:
-        url = entity_url(base_url, identifier=ansible_params["permalink"])
-        res = http_client.patch(url, data=json.dumps(ansible_params))
+        url = entity_url(base_url, identifier=params["permalink"])
+        res = http_client.patch(url, data=json.dumps(changes))
 
-        stage = json.load(res)["stage"]
-        module.exit_json(changed=True, stage=stage)
+        updated = load_json(res)["stage"]
+        exit_with_state(module, base_url, ansible_params, "stage", updated, True, stage)
 
     except HTTPError as err:
         msg = err.msg
@@ -85,10 +93,21 @@ def update(module, http_client, base_url, stage, ansible_params):
 
 
 def upsert(module, http_client, base_url, ansible_params):
+    exit_if_cached(module, base_url, ansible_params, "stage")
+
+    if module.check_mode:
+        # Plan against the listing so a batch of tasks shares one snapshot
+        stage = find_item_by(
+            http_client, base_url, "stages", "permalink", ansible_params["permalink"]
+        )
+        if stage:
+            update(module, http_client, base_url, stage, ansible_params)
+        create(module, http_client, base_url, ansible_params)
+
     try:
         url = entity_url(base_url, ansible_params["permalink"])
         res = http_client.get(url)
-        stage = json.load(res)["stage"]
+        stage = load_json(res)["stage"]
         update(module, http_client, base_url, stage, ansible_params)
     except HTTPError as err:
         if err.code != 404:
@@ -140,9 +159,13 @@ def main():
         update_github_pull_requests=dict(type="bool"),
         use_github_deployment_api=dict(type="bool"),
     )
+    argument_spec.update(CACHE_ARGUMENT_SPEC)
+    argument_spec.update(CLIENT_ARGUMENT_SPEC)
 
     module = AnsibleModule(
-        argument_spec=argument_spec, required_if=[["state", "present", ["name"]]]
+        argument_spec=argument_spec,
+        required_if=[["state", "present", ["name"]]],
+        supports_check_mode=True,
     )
 
     validate_permalink(module)
@@ -153,18 +176,14 @@ def main():
     del stage["state"]
     del stage["token"]
     del stage["project_permalink"]
+    for key in list(CACHE_ARGUMENT_SPEC) + list(CLIENT_ARGUMENT_SPEC):
+        del stage[key]
 
     base_url = "/".join(
         [module.params["url"], "projects", module.params["project_permalink"], "stages"]
     )
 
-    http_client = Request(
-        headers={
-            "Authorization": "Bearer {}".format(module.params["token"]),
-            "Content-Type": "application/json",
-        },
-        timeout=30,
-    )
+    http_client = samson_client(module)
 
     if state == "present":
         upsert(module, http_client, base_url, stage)
@@ -0,0 +1,212 @@
+from __future__ import (  # pylint: disable=unused-variable
+    absolute_import,
+    division,
+    print_function,
+)
+
+__metaclass__ = type  # pylint: disable=unused-variable
+
+import json
+import os
+from os.path import dirname, abspath, join
+import sys
+
+from ansible.module_utils.basic import AnsibleModule
+
+if os.environ.get("ENV") == "dev":
+    module_utils_path = join(dirname(dirname(abspath(__file__))), "module_utils")
+    sys.path.append(module_utils_path)
+    import samson_utils  # pylint: disable=no-name-in-module, import-error
+else:
+    from ansible.module_utils import (  # pylint: disable=no-name-in-module, ungrouped-imports
+        samson_utils,
+    )
+
+HTTPError = samson_utils.HTTPError
+entity_url = samson_utils.entity_url
+is_valid_permalink = samson_utils.is_valid_permalink
+strip_none_props = samson_utils.strip_none_props
+fetch_listing = samson_utils.fetch_listing
+changed_fields = samson_utils.changed_fields
+planned_entity = samson_utils.planned_entity
+entities_diff = samson_utils.entities_diff
+delete_entities = samson_utils.delete_entities
+error_message = samson_utils.error_message
+create_entity = samson_utils.create_entity
+rename_entity = samson_utils.rename_entity
+load_json = samson_utils.load_json
+CLIENT_ARGUMENT_SPEC = samson_utils.CLIENT_ARGUMENT_SPEC
+samson_client = samson_utils.samson_client
+
+
+def update(http_client, base_url, current, desired, check_mode):
+    changes = changed_fields(current, desired)
+    if not changes:
+        return dict(action="unchanged", changed=False, stage=current)
+
+    if check_mode:
+        planned = planned_entity(current, desired)
+        return dict(action="updated", changed=True, stage=planned)
+
+    url = entity_url(base_url, current["permalink"])
+    res = http_client.patch(url, data=json.dumps(changes))
+    return dict(action="updated", changed=True, stage=load_json(res)["stage"])
+
+
+def create(http_client, base_url, pending, check_mode):
+    if check_mode:
+        return dict(
+            (idx, dict(action="created", changed=True, stage=desired))
+            for idx, desired in pending.items()
+        )
+
+    # The Samson API ignores the permalink we provide on creation and derives
+    # one from the name instead. The created stage normally comes back with
+    # the response. Stages that don't are found with a single listing once
+    # all of them are posted.
+    results = {}
+    created = {}
+    for idx, desired in pending.items():
+        try:
+            created[idx] = create_entity(
+                http_client, base_url, "stage", {"stage": desired}
+            )
+        except HTTPError as err:
+            results[idx] = dict(failed=True, changed=False, msg=error_message(err))
+
+    if None in created.values():
+        by_name = fetch_listing(http_client, base_url, "stages").by_name
+        for idx, stage in created.items():
+            if stage is None:
+                created[idx] = by_name.get(pending[idx]["name"])
+
+    for idx, stage in created.items():
+        desired = pending[idx]
+        if not stage:
+            msg = "Created stage `{}` is missing from the listing".format(
+                desired["name"]
+            )
+            results[idx] = dict(failed=True, changed=True, msg=msg)
+            continue
+
+        try:
+            stage = rename_entity(
+                http_client, base_url, stage, desired["permalink"], "stage"
+            )
+            results[idx] = dict(action="created", changed=True, stage=stage)
+        except HTTPError as err:
+            results[idx] = dict(failed=True, changed=True, msg=error_message(err))
+
+    return results
+
+
+def reconcile(http_client, base_url, stages, purge, check_mode=False):
+    existing = fetch_listing(http_client, base_url, "stages").by_permalink
+    results = {}
+    pending = {}
+
+    for idx, stage in enumerate(stages):
+        desired = strip_none_props(stage)
+        state = desired.pop("state", "present")
+        current = existing.get(desired["permalink"])
+        try:
+            if state == "absent":
+                results[idx] = (
+                    delete_entities(
+                        http_client, base_url, [current], "permalink", check_mode
+                    )
+                    if current
+                    else dict(action="unchanged", changed=False)
+                )
+            elif current:
+                results[idx] = update(
+                    http_client, base_url, current, desired, check_mode
+                )
+            else:
+                pending[idx] = desired
+        except HTTPError as err:
+            results[idx] = dict(failed=True, changed=False, msg=error_message(err))
+
+    results.update(create(http_client, base_url, pending, check_mode))
+    ordered = []
+    for idx, stage in enumerate(stages):
+        results[idx]["permalink"] = stage["permalink"]
+        results[idx]["before"] = existing.get(stage["permalink"])
+        ordered.append(results[idx])
+
+    if purge:
+        declared = set(s["permalink"] for s in stages)
+        for permalink, current in existing.items():
+            if permalink in declared:
+                continue
+            try:
+                result = delete_entities(
+                    http_client, base_url, [current], "permalink", check_mode
+                )
+            except HTTPError as err:
+                result = dict(failed=True, changed=False, msg=error_message(err))
+            result["permalink"] = permalink
+            result["before"] = current
+            ordered.append(result)
+
+    return ordered
+
+
+def validate_stages(module, stages):
+    for stage in stages:
+        permalink = stage.get("permalink")
+        if not permalink or not is_valid_permalink(permalink):
+            msg = "Every stage needs a permalink matching `{}`, got `{}`".format(
+                samson_utils.VALID_PERMALINK_REGEX, permalink
+            )
+            module.fail_json(changed=False, msg=msg)
+        if stage.get("state", "present") == "present" and not stage.get("name"):
+            msg = "Stage `{}` is missing a name".format(permalink)
+            module.fail_json(changed=False, msg=msg)
+
+
+def main():
+    argument_spec = dict(
+        url=dict(required=True, type="str"),
+        token=dict(required=True, type="str"),
+        project_permalink=dict(required=True, type="str"),
+        # Each item takes the same options as samson_stage plus an optional
+        # per-stage `state`
+        stages=dict(required=True, type="list", elements="dict"),
+        # Delete stages of the project that aren't listed in `stages`
+        purge=dict(type="bool", default=False),
+    )
+    argument_spec.update(CLIENT_ARGUMENT_SPEC)
+
+    module = AnsibleModule(argument_spec=argument_spec, supports_check_mode=True)
+
+    stages = module.params["stages"]
+    validate_stages(module, stages)
+
+    base_url = "/".join(
+        [module.params["url"], "projects", module.params["project_permalink"], "stages"]
+    )
+
+    http_client = samson_client(module)
+
+    try:
+        results = reconcile(
+            http_client, base_url, stages, module.params["purge"], module.check_mode
+        )
+    except HTTPError as err:
+        module.fail_json(changed=False, msg=error_message(err))
+
+    diff = entities_diff(results, "stage")
+    extra = dict(diff=diff) if module._diff else {}  # pylint: disable=protected-access
+
+    changed = any(result["changed"] for result in results)
+    failed = [result for result in results if result.get("failed")]
+    if failed:
+        msg = "Failed to reconcile {} stage(s)".format(len(failed))
+        module.fail_json(changed=changed, msg=msg, stages=results, **extra)
+
+    module.exit_json(changed=changed, stages=results, **extra)
+
+
+if __name__ == "__main__":
+    main()
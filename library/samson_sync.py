@@ -0,0 +1,539 @@
+from __future__ import (  # pylint: disable=unused-variable
+    absolute_import,
+    division,
+    print_function,
+)
+
+__metaclass__ = type  # pylint: disable=unused-variable
+
+import json
+import os
+from os.path import dirname, abspath, join
+import sys
+from multiprocessing.pool import ThreadPool
+
+from ansible.module_utils.basic import AnsibleModule
+
+if sys.version_info.major == 3:
+    import queue  # pylint: disable=import-error
+else:
+    import Queue as queue  # pylint: disable=import-error
+
+if os.environ.get("ENV") == "dev":
+    module_utils_path = join(dirname(dirname(abspath(__file__))), "module_utils")
+    sys.path.append(module_utils_path)
+    import samson_utils  # pylint: disable=no-name-in-module, import-error
+    import samson_html  # pylint: disable=no-name-in-module, import-error
+else:
+    from ansible.module_utils import (  # pylint: disable=no-name-in-module, ungrouped-imports
+        samson_utils,
+        samson_html,
+    )
+
+HTTPError = samson_utils.HTTPError
+SamsonError = samson_utils.SamsonError
+entity_url = samson_utils.entity_url
+is_valid_permalink = samson_utils.is_valid_permalink
+strip_none_props = samson_utils.strip_none_props
+fetch_listing = samson_utils.fetch_listing
+find_item_by = samson_utils.find_item_by
+ensure_using_html = samson_html.ensure_using_html
+changed_fields = samson_utils.changed_fields
+planned_entity = samson_utils.planned_entity
+entity_diff = samson_utils.entity_diff
+error_message = samson_utils.error_message
+create_entity = samson_utils.create_entity
+rename_entity = samson_utils.rename_entity
+load_json = samson_utils.load_json
+CLIENT_ARGUMENT_SPEC = samson_utils.CLIENT_ARGUMENT_SPEC
+create_with_relookup = samson_utils.create_with_relookup
+samson_client = samson_utils.samson_client
+
+# The order nodes are declared and reported in. Every kind only refers to
+# kinds listed before it.
+KINDS = [
+    "environments",
+    "deploy_groups",
+    "projects",
+    "commands",
+    "stages",
+    "inbound_webhooks",
+    "outbound_webhooks",
+]
+
+REQUIRED_FIELDS = dict(
+    environments=["permalink", "name"],
+    deploy_groups=["permalink", "name", "environment"],
+    projects=["permalink", "name", "repository_url"],
+    commands=["command"],
+    stages=["permalink", "name", "project"],
+    inbound_webhooks=["project", "stage", "source"],
+    outbound_webhooks=["project", "stage", "url"],
+)
+
+
+def node_id(kind, spec):
+    if kind in ("environments", "deploy_groups", "projects"):
+        parts = [spec["permalink"]]
+    elif kind == "commands":
+        parts = [spec.get("key") or spec["command"]]
+    elif kind == "stages":
+        parts = [spec["project"], spec["permalink"]]
+    elif kind == "inbound_webhooks":
+        parts = [spec["project"], spec["stage"], spec["source"], spec.get("branch")]
+    else:
+        parts = [spec["project"], spec["stage"], spec["url"]]
+    return "/".join([kind[:-1]] + [str(p or "") for p in parts])
+
+
+def node_refs(kind, spec):
+    """Returns the ids of the nodes a spec refers to, declared or not."""
+    if kind == "deploy_groups":
+        return ["environment/" + spec["environment"]]
+    if kind == "commands":
+        return ["project/" + spec["project"]] if spec.get("project") else []
+    if kind == "stages":
+        return (
+            ["project/" + spec["project"]]
+            + ["command/{}".format(c) for c in spec.get("commands") or []]
+            + ["deploy_group/{}".format(d) for d in spec.get("deploy_groups") or []]
+        )
+    if kind in ("inbound_webhooks", "outbound_webhooks"):
+        return [
+            "project/" + spec["project"],
+            "stage/{}/{}".format(spec["project"], spec["stage"]),
+        ]
+    return []
+
+
+def build_graph(desired):
+    """Turns the declared entities into nodes ordered by declaration.
+
+    A node only depends on other declared nodes. References to anything else
+    are resolved against Samson when the node is applied.
+    """
+    nodes = []
+    for kind in KINDS:
+        for spec in desired[kind] or []:
+            nodes.append(dict(id=node_id(kind, spec), kind=kind, spec=spec))
+
+    declared = set(node["id"] for node in nodes)
+    for node in nodes:
+        node["deps"] = [
+            ref for ref in node_refs(node["kind"], node["spec"]) if ref in declared
+        ]
+    return nodes
+
+
+def validate_graph(module, nodes):
+    seen = set()
+    for node in nodes:
+        spec = node["spec"]
+        missing = [f for f in REQUIRED_FIELDS[node["kind"]] if not spec.get(f)]
+        if missing:
+            msg = "{} item {} is missing {}".format(
+                node["kind"], json.dumps(spec, sort_keys=True), ", ".join(missing)
+            )
+            module.fail_json(changed=False, msg=msg)
+
+        permalink = spec.get("permalink")
+        if permalink is not None and not is_valid_permalink(permalink):
+            msg = "Permalink of `{}` should match `{}`".format(
+                node["id"], samson_utils.VALID_PERMALINK_REGEX
+            )
+            module.fail_json(changed=False, msg=msg)
+
+        if node["id"] in seen:
+            module.fail_json(
+                changed=False, msg="`{}` is declared twice".format(node["id"])
+            )
+        seen.add(node["id"])
+
+
+class Sync(object):
+    """Applies a graph of Samson entities, running independent nodes at once."""
+
+    def __init__(self, http_client, url, check_mode=False):
+        self.http_client = http_client
+        self.url = url
+        # Plan the changes without writing. Entities that would be created
+        # have no id yet, and nothing exists below them.
+        self.check_mode = check_mode
+        self.results = {}
+
+    def run(self, nodes, concurrency):
+        pending = list(nodes)
+        running = set()
+        finished = queue.Queue()
+        pool = ThreadPool(concurrency)
+
+        try:
+            while pending or running:
+                pending = self.schedule(pending, running, pool, finished)
+                if not running:
+                    break
+                done_id, result = finished.get()
+                running.discard(done_id)
+                self.results[done_id] = result
+        finally:
+            pool.close()
+            pool.join()
+
+        # Whatever is left waits on itself
+        for node in pending:
+            self.results[node["id"]] = dict(
+                failed=True, changed=False, msg="Circular reference"
+            )
+
+        return [
+            dict(self.results[node["id"]], id=node["id"], kind=node["kind"][:-1])
+            for node in nodes
+        ]
+
+    def schedule(self, pending, running, pool, finished):
+        """Starts every node whose dependencies are done, returns the rest."""
+        waiting = []
+        for node in pending:
+            deps = [self.results.get(dep) for dep in node["deps"]]
+            if None in deps:
+                waiting.append(node)
+            elif any(dep.get("failed") for dep in deps):
+                # Dependencies are declared before their dependents, so the
+                # nodes depending on this one see the skip later in the loop
+                self.results[node["id"]] = dict(
+                    failed=True,
+                    changed=False,
+                    action="skipped",
+                    msg="A dependency failed",
+                )
+            else:
+                running.add(node["id"])
+                pool.apply_async(
+                    self.apply,
+                    (node,),
+                    callback=lambda result, i=node["id"]: finished.put((i, result)),
+                )
+        return waiting
+
+    def apply(self, node):
+        # The pool drops the callback of a call that raised, which would leave
+        # the scheduler waiting forever, so nothing may escape from here
+        try:
+            return self.apply_node(node)
+        except Exception as err:  # pylint: disable=broad-except
+            return dict(failed=True, changed=False, msg=str(err))
+
+    def apply_node(self, node):
+        apply_kind = getattr(self, "apply_" + node["kind"])
+        try:
+            action, before, entity = apply_kind(strip_none_props(node["spec"]))
+        except (HTTPError, SamsonError) as err:
+            return dict(failed=True, changed=False, msg=error_message(err))
+        return dict(
+            action=action, changed=action != "unchanged", entity=entity, before=before
+        )
+
+    def reference(self, ref, lookup):
+        result = self.results.get(ref)
+        if result is not None:
+            return result["entity"]
+        entity = lookup()
+        if entity is None:
+            raise SamsonError("Couldn't find `{}`".format(ref))
+        return entity
+
+    def collection_url(self, *parts):
+        return "/".join((self.url,) + parts)
+
+    def environment(self, permalink):
+        base_url = self.collection_url("environments")
+        return self.reference(
+            "environment/" + permalink,
+            lambda: find_item_by(
+                self.http_client, base_url, "environments", "permalink", permalink
+            ),
+        )
+
+    def deploy_group(self, permalink):
+        base_url = self.collection_url("deploy_groups")
+        return self.reference(
+            "deploy_group/" + permalink,
+            lambda: find_item_by(
+                self.http_client, base_url, "deploy_groups", "permalink", permalink
+            ),
+        )
+
+    def project(self, permalink):
+        return self.reference(
+            "project/" + permalink, lambda: self.get_project(permalink)
+        )
+
+    def command(self, key):
+        if isinstance(key, int) or str(key).isdigit():
+            return dict(id=int(key))
+        # Commands that aren't declared can only be found by their text
+        return self.reference(
+            "command/{}".format(key),
+            lambda: fetch_listing(
+                self.http_client, self.collection_url("commands"), "commands"
+            ).find(lambda command: command["command"] == key),
+        )
+
+    def stage(self, project, permalink):
+        base_url = self.collection_url("projects", project, "stages")
+        return self.reference(
+            "stage/{}/{}".format(project, permalink),
+            lambda: find_item_by(
+                self.http_client, base_url, "stages", "permalink", permalink
+            ),
+        )
+
+    def get_project(self, permalink):
+        try:
+            url = entity_url(self.collection_url("projects"), permalink)
+            return load_json(self.http_client.get(url))["project"]
+        except HTTPError as err:
+            if getattr(err, "code", None) == 404:
+                return None
+            raise
+
+    def ensure_html(self, spec, item_type):
+        base_url = self.collection_url(item_type + "s")
+        before = find_item_by(
+            self.http_client, base_url, item_type + "s", "permalink", spec["permalink"]
+        )
+        changed, item = ensure_using_html(
+            self.http_client, base_url, spec, item_type, self.check_mode
+        )
+        if not changed:
+            return "unchanged", before, item
+        return ("updated" if before else "created"), before, item
+
+    def apply_environments(self, spec):
+        spec.setdefault("production", False)
+        return self.ensure_html(spec, "environment")
+
+    def apply_deploy_groups(self, spec):
+        spec["environment_id"] = self.environment(spec.pop("environment")).get("id")
+        return self.ensure_html(spec, "deploy_group")
+
+    def apply_projects(self, spec):
+        base_url = self.collection_url("projects")
+        project = self.get_project(spec["permalink"])
+        if project:
+            changes = changed_fields(project, spec)
+            if not changes:
+                return "unchanged", project, project
+            if self.check_mode:
+                return "updated", project, planned_entity(project, spec)
+            url = entity_url(base_url, project["permalink"])
+            res = self.http_client.patch(url, data=json.dumps(changes))
+            return "updated", project, load_json(res)["project"]
+
+        if self.check_mode:
+            return "created", None, spec
+
+        created = create_entity(
+            self.http_client, base_url, "project", spec, spec["name"]
+        )
+        project = rename_entity(
+            self.http_client, base_url, created, spec["permalink"], "project"
+        )
+        return "created", None, project
+
+    def apply_commands(self, spec):
+        params = dict(command=spec["command"])
+        if spec.get("project"):
+            params["project_id"] = self.project(spec["project"]).get("id")
+
+        base_url = self.collection_url("commands")
+
+        def find():
+            return fetch_listing(self.http_client, base_url, "commands").find(
+                lambda c: c["command"] == params["command"]
+                and c.get("project_id") == params.get("project_id")
+            )
+
+        command = find()
+        if command:
+            return "unchanged", command, command
+
+        if self.check_mode:
+            return "created", None, params
+
+        url = entity_url(base_url)
+        data = json.dumps(dict(command=params))
+        command = create_with_relookup(
+            self.http_client,
+            lambda: load_json(self.http_client.post(url, data=data))["command"],
+            find,
+        )
+        return "created", None, command
+
+    def apply_stages(self, spec):
+        project = spec.pop("project")
+        if "commands" in spec:
+            spec["command_ids"] = [
+                self.command(c).get("id") for c in spec.pop("commands")
+            ]
+        if "deploy_groups" in spec:
+            spec["deploy_group_ids"] = [
+                self.deploy_group(d).get("id") for d in spec.pop("deploy_groups")
+            ]
+
+        if self.check_mode and self.project(project).get("id") is None:
+            return "created", None, spec
+
+        base_url = self.collection_url("projects", project, "stages")
+        listing = fetch_listing(self.http_client, base_url, "stages")
+        stage = listing.by_permalink.get(spec["permalink"])
+        if stage:
+            changes = changed_fields(stage, spec)
+            if not changes:
+                return "unchanged", stage, stage
+            if self.check_mode:
+                return "updated", stage, planned_entity(stage, spec)
+            url = entity_url(base_url, stage["permalink"])
+            res = self.http_client.patch(url, data=json.dumps(changes))
+            return "updated", stage, load_json(res)["stage"]
+
+        if self.check_mode:
+            return "created", None, spec
+
+        created = create_entity(
+            self.http_client, base_url, "stage", {"stage": spec}, spec["name"]
+        )
+        stage = rename_entity(
+            self.http_client, base_url, created, spec["permalink"], "stage"
+        )
+        return "created", None, stage
+
+    def apply_inbound_webhooks(self, spec):
+        project = self.project(spec["project"])
+        params = dict(
+            stage_id=self.stage(spec["project"], spec["stage"]).get("id"),
+            source=spec["source"],
+            branch=spec.get("branch", ""),
+        )
+        if self.check_mode and params["stage_id"] is None:
+            return "created", None, params
+
+        base_url = self.collection_url("projects", project["permalink"], "webhooks")
+
+        def find():
+            return fetch_listing(self.http_client, base_url, "webhooks").find(
+                lambda w: all(w[k] == v for k, v in params.items())
+            )
+
+        webhook = find()
+        if webhook:
+            return "unchanged", webhook, webhook
+
+        if self.check_mode:
+            return "created", None, params
+
+        url = entity_url(base_url)
+        data = json.dumps(dict(webhook=params))
+        webhook = create_with_relookup(
+            self.http_client,
+            lambda: load_json(self.http_client.post(url, data=data))["webhook"],
+            find,
+        )
+        return "created", None, webhook
+
+    def apply_outbound_webhooks(self, spec):
+        project = self.project(spec["project"])
+        params = dict(
+            stage_id=self.stage(spec["project"], spec["stage"]).get("id"),
+            url=spec["url"],
+        )
+        if self.check_mode and params["stage_id"] is None:
+            return "created", None, dict(params)
+        for key in ("username", "password"):
+            if key in spec:
+                params[key] = spec[key]
+
+        base_url = self.collection_url(
+            "projects", project["permalink"], "outbound_webhooks"
+        )
+
+        def find():
+            return fetch_listing(self.http_client, base_url, "webhooks").find(
+                lambda w: w["stage_id"] == params["stage_id"]
+                and w["url"] == params["url"]
+            )
+
+        webhook = find()
+        if webhook:
+            return "unchanged", webhook, webhook
+
+        if self.check_mode:
+            # Leave the password out of the planned entity
+            return "created", None, dict(stage_id=params["stage_id"], url=params["url"])
+
+        url = entity_url(base_url)
+        data = json.dumps(params)
+        webhook = create_with_relookup(
+            self.http_client,
+            lambda: load_json(self.http_client.post(url, data=data))[
+                "outbound_webhook"
+            ],
+            find,
+        )
+        return "created", None, webhook
+
+
+def main():
+    argument_spec = dict(
+        url=dict(required=True, type="str"),
+        token=dict(required=True, type="str"),
+        # How many entities to apply at the same time
+        concurrency=dict(type="int", default=8),
+        environments=dict(type="list", elements="dict", default=[]),
+        deploy_groups=dict(type="list", elements="dict", default=[]),
+        projects=dict(type="list", elements="dict", default=[]),
+        commands=dict(type="list", elements="dict", default=[]),
+        stages=dict(type="list", elements="dict", default=[]),
+        inbound_webhooks=dict(type="list", elements="dict", default=[]),
+        outbound_webhooks=dict(type="list", elements="dict", default=[]),
+    )
+    argument_spec.update(CLIENT_ARGUMENT_SPEC)
+
+    module = AnsibleModule(argument_spec=argument_spec, supports_check_mode=True)
+
+    nodes = build_graph(module.params)
+    validate_graph(module, nodes)
+
+    if module.params["concurrency"] < 1:
+        module.fail_json(changed=False, msg="concurrency must be at least 1")
+
+    http_client = samson_client(module)
+    sync = Sync(http_client, module.params["url"], module.check_mode)
+    results = sync.run(nodes, module.params["concurrency"])
+
+    diff = []
+    for result in results:
+        before = result.pop("before", None)
+        if result["changed"] and "entity" in result:
+            diff.append(
+                dict(
+                    entity_diff(before, result["entity"]),
+                    before_header=result["id"],
+                    after_header=result["id"],
+                )
+            )
+    extra = dict(diff=diff) if module._diff else {}  # pylint: disable=protected-access
+
+    changed = any(result["changed"] for result in results)
+    failed = [result for result in results if result.get("failed")]
+    if failed:
+        msg = "Failed to sync {} of {} entities, first error: {}".format(
+            len(failed), len(results), failed[0]["msg"]
+        )
+        module.fail_json(changed=changed, msg=msg, results=results, **extra)
+
+    module.exit_json(changed=changed, results=results, **extra)
+
+
+if __name__ == "__main__":
+    main()
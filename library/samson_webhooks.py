@@ -0,0 +1,239 @@
+from __future__ import (  # pylint: disable=unused-variable
+    absolute_import,
+    division,
+    print_function,
+)
+
+__metaclass__ = type  # pylint: disable=unused-variable
+
+import json
+import os
+from os.path import dirname, abspath, join
+import sys
+
+from ansible.module_utils.basic import AnsibleModule
+
+if os.environ.get("ENV") == "dev":
+    module_utils_path = join(dirname(dirname(abspath(__file__))), "module_utils")
+    sys.path.append(module_utils_path)
+    import samson_utils  # pylint: disable=no-name-in-module, import-error
+else:
+    from ansible.module_utils import (  # pylint: disable=no-name-in-module, ungrouped-imports
+        samson_utils,
+    )
+
+HTTPError = samson_utils.HTTPError
+entity_url = samson_utils.entity_url
+iter_items = samson_utils.iter_items
+entities_diff = samson_utils.entities_diff
+delete_entities = samson_utils.delete_entities
+error_message = samson_utils.error_message
+load_json = samson_utils.load_json
+create_with_relookup = samson_utils.create_with_relookup
+project_permalink_param = samson_utils.project_permalink_param
+CLIENT_ARGUMENT_SPEC = samson_utils.CLIENT_ARGUMENT_SPEC
+samson_client = samson_utils.samson_client
+
+SOURCES = [
+    "buildkite",
+    "circleci",
+    "github",
+    "travis",
+    "generic",
+    "tddium",
+    "semaphore",
+    "jenkins",
+]
+
+
+class Kind(object):
+    """How one kind of webhook is stored and identified in Samson."""
+
+    def __init__(self, name, collection, json_key, entity_key, fields):
+        self.name = name
+        self.collection = collection
+        # The key of the listing and the key of a single webhook in responses
+        self.json_key = json_key
+        self.entity_key = entity_key
+        # The fields that identify a webhook of a stage
+        self.fields = fields
+
+    def key(self, webhook):
+        return tuple(webhook.get(field) for field in self.fields)
+
+
+INBOUND = Kind(
+    "inbound", "webhooks", "webhooks", "webhook", ("stage_id", "source", "branch")
+)
+OUTBOUND = Kind(
+    "outbound", "outbound_webhooks", "webhooks", "outbound_webhook", ("stage_id", "url")
+)
+
+
+def index_webhooks(http_client, base_url, kind):
+    index = {}
+    for webhook in iter_items(http_client, base_url, kind.json_key):
+        index.setdefault(kind.key(webhook), []).append(webhook)
+    return index
+
+
+def create(http_client, base_url, kind, params, check_mode):
+    if check_mode:
+        # Leave the password out of the planned webhook
+        planned = dict((k, v) for k, v in params.items() if k != "password")
+        return dict(action="created", changed=True, webhook=planned)
+
+    def post():
+        data = {kind.entity_key: params} if kind is INBOUND else params
+        res = http_client.post(entity_url(base_url), data=json.dumps(data))
+        return load_json(res)[kind.entity_key]
+
+    def lookup():
+        found = index_webhooks(http_client, base_url, kind).get(kind.key(params))
+        return found[0] if found else None
+
+    webhook = create_with_relookup(http_client, post, lookup)
+    return dict(action="created", changed=True, webhook=webhook)
+
+
+def reconcile(http_client, base_url, kind, webhooks, purge, check_mode=False):
+    """Applies the declared webhooks of one kind with a single listing."""
+    existing = index_webhooks(http_client, base_url, kind)
+    declared = set()
+    results = []
+
+    for webhook in webhooks:
+        params = dict((k, v) for k, v in webhook.items() if v is not None)
+        state = params.pop("state")
+        key = kind.key(params)
+        declared.add(key)
+        current = existing.get(key, [])
+        try:
+            if state == "absent":
+                result = (
+                    delete_entities(http_client, base_url, current, "id", check_mode)
+                    if current
+                    else dict(action="unchanged", changed=False)
+                )
+                existing.pop(key, None)
+            elif current:
+                result = dict(action="unchanged", changed=False, webhook=current[0])
+            else:
+                result = create(http_client, base_url, kind, params, check_mode)
+                # A webhook that's declared twice is only created once
+                existing[key] = [result["webhook"]]
+        except HTTPError as err:
+            result = dict(failed=True, changed=False, msg=error_message(err))
+        result["before"] = current[0] if current else None
+        results.append(result)
+
+    if purge:
+        for key, current in existing.items():
+            if key in declared:
+                continue
+            try:
+                result = delete_entities(
+                    http_client, base_url, current, "id", check_mode
+                )
+            except HTTPError as err:
+                result = dict(failed=True, changed=False, msg=error_message(err))
+            result["before"] = current[0]
+            results.append(result)
+
+    return results
+
+
+def webhook_header(kind):
+    def header(_, webhook):
+        fields = " ".join(str(webhook.get(field)) for field in kind.fields)
+        return "{} webhook {}".format(kind.name, fields)
+
+    return header
+
+
+def main():
+    state = dict(default="present", type="str", choices=["absent", "present"])
+    argument_spec = dict(
+        url=dict(required=True, type="str"),
+        token=dict(required=True, type="str"),
+        # The project is named by either of these
+        project_id=dict(type="int"),
+        project_permalink=dict(type="str"),
+        inbound=dict(
+            type="list",
+            elements="dict",
+            default=[],
+            options=dict(
+                stage_id=dict(required=True, type="int"),
+                source=dict(required=True, type="str", choices=SOURCES),
+                # Blank = any
+                branch=dict(type="str", default=""),
+                state=state,
+            ),
+        ),
+        outbound=dict(
+            type="list",
+            elements="dict",
+            default=[],
+            options=dict(
+                stage_id=dict(required=True, type="int"),
+                url=dict(required=True, type="str"),
+                username=dict(type="str"),
+                password=dict(type="str", no_log=True),
+                state=state,
+            ),
+        ),
+        # Delete the project's webhooks that aren't declared
+        purge=dict(type="bool", default=False),
+    )
+    argument_spec.update(CLIENT_ARGUMENT_SPEC)
+
+    module = AnsibleModule(
+        argument_spec=argument_spec,
+        supports_check_mode=True,
+        required_one_of=[["project_id", "project_permalink"]],
+        mutually_exclusive=[["project_id", "project_permalink"]],
+    )
+
+    http_client = samson_client(module)
+    project_url = "/".join(
+        [module.params["url"], "projects", project_permalink_param(module, http_client)]
+    )
+
+    result = dict(changed=False)
+    diff = []
+    failed = []
+    for kind, webhooks in (
+        (INBOUND, module.params["inbound"]),
+        (OUTBOUND, module.params["outbound"]),
+    ):
+        base_url = "/".join([project_url, kind.collection])
+        try:
+            results = reconcile(
+                http_client,
+                base_url,
+                kind,
+                webhooks,
+                module.params["purge"],
+                module.check_mode,
+            )
+        except HTTPError as err:
+            module.fail_json(msg=error_message(err), **result)
+
+        diff.extend(entities_diff(results, "webhook", webhook_header(kind)))
+        result[kind.name] = results
+        result["changed"] = result["changed"] or any(r["changed"] for r in results)
+        failed.extend(r for r in results if r.get("failed"))
+
+    if module._diff:  # pylint: disable=protected-access
+        result["diff"] = diff
+
+    if failed:
+        msg = "Failed to reconcile {} webhook(s)".format(len(failed))
+        module.fail_json(msg=msg, **result)
+
+    module.exit_json(**result)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,189 @@
+# The on-disk caches of the modules given `cache_path`: the state of the
+# entities they converged and the validators of the responses they read.
+
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+
+
+def read_json_file(path, default=None):
+    try:
+        with open(path) as json_file:
+            return json.load(json_file)
+    except (IOError, OSError, ValueError):
+        return default
+
+
+def write_json_file(path, data):
+    # Write to a temporary file and rename it into place so concurrent tasks
+    # never read a partially written file
+    directory = os.path.dirname(os.path.abspath(path))
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".samson-cache")
+    with os.fdopen(fd, "w") as tmp_file:
+        json.dump(data, tmp_file)
+    os.rename(tmp_path, path)
+
+
+class FileCache(object):
+    """A small JSON file of entries that is replaced atomically on writes.
+
+    The oldest entries are evicted once there are more than `max_entries`.
+    """
+
+    def __init__(self):
+        self.path = None
+        self.max_entries = 0
+        # Batches write from a thread pool
+        self.lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return bool(self.path)
+
+    def load(self):
+        return read_json_file(self.path, {})
+
+    def save(self, entries):
+        if len(entries) > self.max_entries:
+            by_age = sorted(entries, key=lambda key: entries[key]["stored_at"])
+            for key in by_age[: len(entries) - self.max_entries]:
+                del entries[key]
+        write_json_file(self.path, entries)
+
+    def put(self, key, entry):
+        entry["stored_at"] = time.time()
+        with self.lock:
+            entries = self.load()
+            entries[key] = entry
+            self.save(entries)
+
+    def forget(self, key):
+        if not self.enabled:
+            return
+        with self.lock:
+            entries = self.load()
+            if entries.pop(key, None) is not None:
+                self.save(entries)
+
+
+class StateCache(FileCache):
+    """Entity state we last saw or wrote, persisted between module runs.
+
+    Entries are keyed by entity url and remember a digest of the parameters
+    the entity was converged with. A later run with the same parameters can
+    trust the recorded state for `ttl` seconds instead of asking Samson. The
+    whole file is ignored once its mtime is older than the ttl.
+    """
+
+    def __init__(self):
+        super(StateCache, self).__init__()
+        self.ttl = 0
+
+    def configure(self, path, ttl, max_entries):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+
+    @property
+    def enabled(self):
+        return bool(self.path) and self.ttl > 0
+
+    def load(self):
+        try:
+            if time.time() - os.path.getmtime(self.path) > self.ttl:
+                return {}
+        except OSError:
+            return {}
+        return super(StateCache, self).load()
+
+    def lookup(self, key, params):
+        if not self.enabled:
+            return None
+        entry = self.load().get(key)
+        if not entry or time.time() - entry["stored_at"] > self.ttl:
+            return None
+        if entry["params"] != params_digest(params):
+            return None
+        return entry["state"]
+
+    def store(self, key, params, state):
+        if self.enabled:
+            self.put(key, dict(params=params_digest(params), state=state))
+
+
+class ValidatorCache(object):  # pylint: disable=unused-variable
+    """ETag and Last-Modified validators of GET responses along with their body.
+
+    Unlike the state cache this never trusts an entry on its own. It turns
+    lookups into conditional requests and only reuses a body after Samson
+    answered 304 Not Modified. Every response is kept in a file of its own,
+    so a lookup reads and a store replaces only the entry it's about.
+    """
+
+    def __init__(self):
+        self.path = None
+        self.max_entries = 0
+
+    @property
+    def enabled(self):
+        return bool(self.path)
+
+    def configure(self, path, max_entries):
+        self.path = path
+        self.max_entries = max_entries
+        if path:
+            self.evict()
+
+    def entry_path(self, url):
+        digest = hashlib.sha256(url.encode("utf-8")).hexdigest()
+        return os.path.join(self.path, digest + ".json")
+
+    def lookup(self, url):
+        if not self.enabled:
+            return None
+        entry = read_json_file(self.entry_path(url))
+        if not entry or entry.get("url") != url:
+            return None
+        return entry
+
+    def store(self, url, res, body):
+        if not self.enabled:
+            return
+        headers = dict(
+            (key, res.headers.get(key))
+            for key in ("ETag", "Last-Modified", "Content-Type")
+            if res.headers.get(key)
+        )
+        entry = dict(url=url, headers=headers, body=body.decode("utf-8"))
+        write_json_file(self.entry_path(url), entry)
+
+    def evict(self):
+        # Once per run, dropping the entries that were stored the longest ago
+        try:
+            names = [name for name in os.listdir(self.path) if name.endswith(".json")]
+        except OSError:
+            return
+        if len(names) <= self.max_entries:
+            return
+        stored_at = {}
+        for name in names:
+            try:
+                stored_at[name] = os.path.getmtime(os.path.join(self.path, name))
+            except OSError:
+                pass
+        by_age = sorted(stored_at, key=stored_at.get)
+        for name in by_age[: len(by_age) - self.max_entries]:
+            try:
+                os.remove(os.path.join(self.path, name))
+            except OSError:
+                pass
+
+
+def params_digest(params):
+    encoded = json.dumps(params, sort_keys=True).encode("utf-8")
+    return hashlib.sha256(encoded).hexdigest()
@@ -0,0 +1,211 @@
+# Keep-alive connections to Samson, pooled for the rest of the process, and
+# the responses read from them.
+
+import io
+import socket
+import ssl
+import sys
+import threading
+import time
+
+if sys.version_info.major == 3:
+    import http.client as httplib  # pylint: disable=import-error
+else:
+    import httplib  # pylint: disable=import-error
+
+CHUNK_SIZE = 64 * 1024  # pylint: disable=unused-variable
+MAX_IDLE_CONNECTIONS = 8
+
+# The clock request timings are measured with
+timer = getattr(time, "perf_counter", time.time)
+
+
+class ConnectionPool(object):  # pylint: disable=unused-variable
+    """Idle keep-alive connections, grouped by scheme, host and TLS settings."""
+
+    def __init__(self):
+        self.idle = {}
+        self.lock = threading.Lock()
+
+    def acquire(self, key, timeout):
+        with self.lock:
+            idle = self.idle.get(key)
+            if idle:
+                return idle.pop(), True
+
+        scheme, netloc, validate_certs = key
+        if scheme == "https":
+            context = ssl.create_default_context()
+            if not validate_certs:
+                context.check_hostname = False
+                context.verify_mode = ssl.CERT_NONE
+            conn = httplib.HTTPSConnection(netloc, timeout=timeout, context=context)
+        else:
+            conn = httplib.HTTPConnection(netloc, timeout=timeout)
+        conn._create_connection = connect_resolved  # pylint: disable=protected-access
+        return conn, False
+
+    def release(self, key, conn):
+        with self.lock:
+            idle = self.idle.setdefault(key, [])
+            if len(idle) < MAX_IDLE_CONNECTIONS:
+                idle.append(conn)
+                return
+        conn.close()
+
+    def clear(self):
+        with self.lock:
+            for idle in self.idle.values():
+                for conn in idle:
+                    conn.close()
+            self.idle = {}
+
+
+class PooledResponse(object):  # pylint: disable=unused-variable
+    """A response that returns its connection to the pool once fully read.
+
+    It provides the parts of the urllib response interface the modules use.
+    """
+
+    def __init__(self, res, url, release, timing=None):
+        self.res = res
+        self.url = url
+        self.code = res.status
+        self.status = res.status
+        self.msg = res.reason
+        self.headers = res.msg
+        self.released = False
+        self.release_conn = release
+        self.timing = timing
+        self.fp = res
+        if res.isclosed():
+            self.release()
+
+    def buffer(self):
+        body = self.res.read()
+        if self.timing is not None:
+            self.timing.bytes_received += len(body)
+        self.fp = io.BytesIO(body)
+        self.release()
+
+    def release(self, reusable=None):
+        if self.released:
+            return
+        self.released = True
+        if self.timing is not None:
+            self.timing.finish()
+        if reusable is None:
+            reusable = not self.res.will_close
+        self.release_conn(reusable=reusable)
+
+    def read(self, amt=None):
+        data = self.fp.read() if amt is None else self.fp.read(amt)
+        if self.fp is self.res:
+            if self.timing is not None:
+                self.timing.bytes_received += len(data)
+            if not data or self.res.isclosed():
+                self.release()
+        return data
+
+    def info(self):
+        return self.headers
+
+    def getcode(self):
+        return self.code
+
+    def geturl(self):
+        return self.url
+
+    def close(self):
+        # A response closed before it was fully read leaves unread data on
+        # the connection, so it can't go back to the pool
+        self.release(reusable=False)
+        self.fp.close()
+
+
+class Headers(dict):
+    """Case insensitive response headers."""
+
+    def __init__(self, headers):
+        super(Headers, self).__init__(
+            (key.lower(), value) for key, value in headers.items()
+        )
+
+    def get(self, key, default=None):
+        return super(Headers, self).get(key.lower(), default)
+
+
+class BufferedResponse(object):  # pylint: disable=unused-variable
+    """A response whose body is already in memory."""
+
+    def __init__(self, url, code, headers, body, msg="OK", timing=None):
+        self.url = url
+        self.code = code
+        self.status = code
+        self.msg = msg
+        self.headers = Headers(headers)
+        self.timing = timing
+        self.fp = io.BytesIO(body)
+
+    def read(self, amt=None):
+        return self.fp.read() if amt is None else self.fp.read(amt)
+
+    def info(self):
+        return self.headers
+
+    def getcode(self):
+        return self.code
+
+    def geturl(self):
+        return self.url
+
+    def close(self):
+        self.fp.close()
+
+
+# The addresses of the hosts connected to, keyed by host and port. Each host
+# is looked up by the first connection to it in this process.
+_addresses = {}
+
+
+def resolve(host, port):
+    key = (host.lower(), port)
+    if key not in _addresses:
+        addresses = []
+        for info in socket.getaddrinfo(host, port, 0, socket.SOCK_STREAM):
+            if info[4][0] not in addresses:
+                addresses.append(info[4][0])
+        _addresses[key] = addresses
+    return _addresses[key]
+
+
+def connect_resolved(address, timeout, source_address=None):
+    """Opens a socket like socket.create_connection, without a lookup per call.
+
+    Connections keep their host name for the Host header and TLS, only the
+    socket is opened to the address the host was resolved to.
+    """
+    host, port = address
+    error = None
+    for ip in resolve(host, port):
+        try:
+            return socket.create_connection((ip, port), timeout, source_address)
+        except socket.error as err:
+            error = err
+    # The host may have moved, look it up again on the next connection
+    _addresses.pop((host.lower(), port), None)
+    raise error or socket.error("No addresses for {}".format(host))
+
+
+def timed_connect(conn, parts, timing):  # pylint: disable=unused-variable
+    # Resolve the host up front to tell the lookup apart from the TCP and TLS
+    # handshakes. connect() then opens the socket to the address found here.
+    port = parts.port or (443 if parts.scheme == "https" else 80)
+    if (parts.hostname, port) not in _addresses:
+        start = timer()
+        resolve(parts.hostname, port)
+        timing.dns += timer() - start
+
+    start = timer()
+    conn.connect()
+    timing.connect += timer() - start
@@ -0,0 +1,215 @@
+# Starting deploys and following their status and output.
+
+import collections
+import json
+import time
+
+try:
+    from ansible.module_utils import (  # pylint: disable=no-name-in-module
+        samson_utils,
+    )
+except ImportError:
+    # ENV=dev puts module_utils itself on the path
+    import samson_utils  # pylint: disable=import-error
+
+HTTPStatusError = samson_utils.HTTPStatusError
+CHUNK_SIZE = samson_utils.CHUNK_SIZE
+entity_url = samson_utils.entity_url
+load_json = samson_utils.load_json
+timer = samson_utils.timer
+
+# Samson cancels deploys that run longer than its DEPLOY_TIMEOUT, which
+# defaults to this many seconds
+DEPLOY_TIMEOUT = 1800  # pylint: disable=unused-variable
+DEPLOY_FINISHED = ("succeeded", "failed", "errored", "cancelled")
+# Longer lines of deploy output are cut off in the lines kept in memory
+MAX_LOG_LINE = 8 * 1024
+
+
+def start_deploy(
+    http_client, url, project_permalink, stage_permalink, reference
+):  # pylint: disable=unused-variable
+    """Starts deploying `reference` to a stage and returns the new deploy."""
+    base_url = "/".join(
+        [url, "projects", project_permalink, "stages", stage_permalink, "deploys"]
+    )
+    data = json.dumps(dict(deploy=dict(reference=reference)))
+    # Not repeated after failures, a second deploy is worse than none
+    res = http_client.post(entity_url(base_url), data=data)
+    return load_json(res)["deploy"]
+
+
+def deploy_url(url, project_permalink, deploy_id):  # pylint: disable=unused-variable
+    return entity_url(
+        "/".join([url, "projects", project_permalink, "deploys"]), str(deploy_id)
+    )
+
+
+class DeployWatch(object):  # pylint: disable=unused-variable
+    """Polls a deploy until it finished.
+
+    The interval between polls doubles up to `max_interval` while the deploy's
+    status stays the same and starts over from `interval` once it changes.
+    Polls are conditional requests, Samson answers `304 Not Modified` while
+    nothing changed.
+    """
+
+    def __init__(self, url, deploy, interval, max_interval):
+        self.url = url
+        self.deploy = deploy
+        self.min_interval = interval
+        self.interval = interval
+        self.max_interval = max_interval
+        self.validators = {}
+        self.started = timer()
+        # A deploy that was started elsewhere is polled right away
+        self.next_poll = self.started + (interval if "status" in deploy else 0)
+        self.duration = None
+        self.polls = 0
+
+    @property
+    def finished(self):
+        return self.deploy.get("status") in DEPLOY_FINISHED
+
+    def poll(self, http_client):
+        self.polls += 1
+        try:
+            res = http_client.open("GET", self.url, headers=self.validators)
+        except HTTPStatusError as err:
+            if err.code != 304:
+                raise
+            changed = False
+        else:
+            deploy = load_json(res)["deploy"]
+            changed = deploy.get("status") != self.deploy.get("status")
+            self.deploy = deploy
+            self.validators = {}
+            if res.headers.get("ETag"):
+                self.validators["If-None-Match"] = res.headers["ETag"]
+            if res.headers.get("Last-Modified"):
+                self.validators["If-Modified-Since"] = res.headers["Last-Modified"]
+
+        now = timer()
+        if self.finished:
+            self.duration = now - self.started
+            return
+        if changed:
+            self.interval = self.min_interval
+        else:
+            self.interval = min(self.interval * 2, self.max_interval)
+        self.next_poll = now + self.interval
+
+
+def poll_due(http_client, watches, deadline):
+    """Waits for the deploy whose interval is up first and polls it."""
+    watch = min(watches, key=lambda watch: watch.next_poll)
+    time.sleep(max(0, min(watch.next_poll, deadline) - timer()))
+    watch.poll(http_client)
+    return watch
+
+
+def wait_for_deploys(http_client, watches, timeout):  # pylint: disable=unused-variable
+    """Polls the deploys from one loop until they finished.
+
+    Each deploy is polled when its own interval is up. Returns False when
+    some were still running after `timeout` seconds.
+    """
+    deadline = timer() + timeout
+    while True:
+        running = [watch for watch in watches if not watch.finished]
+        if not running:
+            return True
+        if timer() >= deadline:
+            return False
+        poll_due(http_client, running, deadline)
+
+
+def deploy_output_url(
+    url, project_permalink, deploy_id
+):  # pylint: disable=unused-variable
+    return "/".join(
+        [url, "projects", project_permalink, "deploys", "{}.text".format(deploy_id)]
+    )
+
+
+class LogTail(object):  # pylint: disable=unused-variable
+    """Reads the output of a deploy from where the last read stopped.
+
+    Each read asks Samson for the bytes from `offset` on and streams them in
+    chunks to `sink` as they arrive. Only the last `keep` lines stay in
+    memory. A tail that starts at a `line` instead skips the lines before it
+    without keeping or passing them on.
+    """
+
+    def __init__(self, url, offset=0, line=0, keep=100, sink=None):
+        self.url = url
+        self.offset = offset
+        # Lines are counted from `line` when resuming from a byte offset
+        self.line = line if offset else 0
+        self.skip_to = 0 if offset else line
+        self.lines = collections.deque(maxlen=keep)
+        # The start of the line that's still being written
+        self.partial = b""
+        self.sink = sink
+        self.received = 0
+
+    def read(self, http_client):
+        """Reads the output written since the last read.
+
+        Returns the number of bytes passed to the sink.
+        """
+        headers = {"Range": "bytes={}-".format(self.offset)} if self.offset else {}
+        try:
+            res = http_client.open("GET", self.url, headers=headers)
+        except HTTPStatusError as err:
+            # Nothing was written past the offset yet
+            if err.code == 416:
+                return 0
+            raise
+
+        # Servers that ignore the range send everything
+        ignored = self.offset if res.code != 206 else 0
+        received = 0
+        while True:
+            chunk = res.read(CHUNK_SIZE)
+            if not chunk:
+                return received
+            if ignored:
+                dropped = min(ignored, len(chunk))
+                chunk, ignored = chunk[dropped:], ignored - dropped
+            chunk = self.skip_lines(chunk)
+            if not chunk:
+                continue
+            self.offset += len(chunk)
+            self.received += len(chunk)
+            received += len(chunk)
+            if self.sink is not None:
+                self.sink(chunk)
+            self.split(chunk)
+
+    def skip_lines(self, chunk):
+        while chunk and self.line < self.skip_to:
+            end = chunk.find(b"\n")
+            if end == -1:
+                self.offset += len(chunk)
+                return b""
+            self.offset += end + 1
+            self.line += 1
+            chunk = chunk[end + 1 :]
+        return chunk
+
+    def split(self, chunk):
+        parts = chunk.split(b"\n")
+        for part in parts[:-1]:
+            line = (self.partial + part)[:MAX_LOG_LINE]
+            self.lines.append(line.decode("utf-8", "replace"))
+            self.line += 1
+            self.partial = b""
+        self.partial = (self.partial + parts[-1])[:MAX_LOG_LINE]
+
+    def tail(self):
+        """Returns the lines in memory, the one being written included."""
+        lines = list(self.lines)
+        if self.partial:
+            lines.append(self.partial.decode("utf-8", "replace"))
+        return lines
@@ -0,0 +1,374 @@
+# Samson only offers HTML forms for environments and deploy groups, the modules
+# managing them write through these.
+
+import codecs
+import json
+import sys
+from multiprocessing.pool import ThreadPool
+
+if sys.version_info.major == 3:
+    from html.parser import HTMLParser  # pylint: disable=import-error
+    from urllib.parse import urljoin  # pylint: disable=import-error
+else:
+    from HTMLParser import HTMLParser  # pylint: disable=import-error
+    from urlparse import urljoin  # pylint: disable=import-error
+
+try:
+    from ansible.module_utils import (  # pylint: disable=no-name-in-module
+        samson_utils,
+    )
+except ImportError:
+    # ENV=dev puts module_utils itself on the path
+    import samson_utils  # pylint: disable=import-error
+
+HTTPError = samson_utils.HTTPError
+HTTPStatusError = samson_utils.HTTPStatusError
+SamsonError = samson_utils.SamsonError
+CHUNK_SIZE = samson_utils.CHUNK_SIZE
+DISALLOWED_PROPS = samson_utils.DISALLOWED_PROPS
+VALID_PERMALINK_REGEX = samson_utils.VALID_PERMALINK_REGEX
+create_with_relookup = samson_utils.create_with_relookup
+created_permalink = samson_utils.created_permalink
+redirect_location = samson_utils.redirect_location
+entity_url = samson_utils.entity_url
+entities_diff = samson_utils.entities_diff
+delete_entities = samson_utils.delete_entities
+error_message = samson_utils.error_message
+exit_if_cached = samson_utils.exit_if_cached
+exit_with_state = samson_utils.exit_with_state
+fetch_listing = samson_utils.fetch_listing
+find_item_by = samson_utils.find_item_by
+is_valid_permalink = samson_utils.is_valid_permalink
+planned_entity = samson_utils.planned_entity
+strip_disallowed_props = samson_utils.strip_disallowed_props
+
+HTML_ERROR_HEADING = "There was an error"
+
+
+def create_using_html(
+    http_client, base_url, ansible_params, item_type, check_mode=False
+):
+    if check_mode:
+        return dict(ansible_params)
+
+    permalink = ansible_params["permalink"]
+    submit_create_using_html(http_client, base_url, ansible_params, item_type)
+    return find_item_by(http_client, base_url, item_type + "s", "permalink", permalink)
+
+
+def submit_create_using_html(http_client, base_url, ansible_params, item_type):
+    """Creates an entity through Samson's HTML form without reading it back."""
+    url = entity_url(base_url, json_suffix=False)
+    name = ansible_params["name"]
+
+    def create():
+        location = submit_html_form(http_client, "POST", url, ansible_params)
+        return created_permalink(base_url, location)
+
+    def lookup():
+        item = find_item_by(http_client, base_url, item_type + "s", "name", name)
+        return item and item["permalink"]
+
+    # The Samson API doesn't actually use the permalink we provided on
+    # creation. Instead it uses the name with whitespace replaced by dashes
+    # and redirects to the new entity. Rename it unless the permalinks happen
+    # to match.
+    permalink = ansible_params["permalink"]
+    created = create_with_relookup(http_client, create, lookup)
+    if created is None:
+        created = lookup()
+        if created is None:
+            raise SamsonError("Created {} `{}` is missing".format(item_type, name))
+    if created != permalink:
+        url = entity_url(base_url, created, json_suffix=False)
+        submit_html_form(http_client, "PATCH", url, dict(permalink=permalink))
+
+
+def html_update(item, ansible_params):
+    """Returns the form to submit to update `item`, None if it's up to date."""
+    new = strip_disallowed_props(item, DISALLOWED_PROPS)
+    new.update(ansible_params)
+    old = strip_disallowed_props(item, DISALLOWED_PROPS)
+    return None if new == old else new
+
+
+def update_using_html(
+    http_client, base_url, item, ansible_params, item_type, check_mode=False
+):
+    new = html_update(item, ansible_params)
+
+    if new is None:
+        return False, item
+
+    if check_mode:
+        return True, planned_entity(item, ansible_params)
+
+    url = entity_url(base_url, ansible_params["permalink"], json_suffix=False)
+    submit_html_form(http_client, "PATCH", url, {item_type: new})
+
+    permalink = ansible_params["permalink"]
+    item = find_item_by(http_client, base_url, item_type + "s", "permalink", permalink)
+    return True, item
+
+
+def submit_html_form(http_client, method, url, params):
+    """Writes to one of Samson's HTML endpoints.
+
+    Samson redirects after a successful write and renders the form with the
+    errors otherwise. The redirect isn't followed, its location is returned.
+    """
+    try:
+        res = http_client.open(
+            method, url, data=json.dumps(params), follow_redirects=False
+        )
+    except HTTPStatusError as err:
+        location = redirect_location(err)
+        if location is None:
+            raise
+        return urljoin(url, location)
+
+    errors = extract_html_errors(res)
+    if errors:
+        raise SamsonError(dict(errors=errors))
+    return None
+
+
+def ensure_using_html(
+    http_client, base_url, ansible_params, item_type, check_mode=False
+):
+    """Creates or updates an entity through Samson's HTML forms.
+
+    Returns whether anything changed along with the resulting entity. In check
+    mode nothing is written and the entity is the one we would end up with.
+    """
+    permalink = ansible_params["permalink"]
+    item = find_item_by(http_client, base_url, item_type + "s", "permalink", permalink)
+
+    if item:
+        return update_using_html(
+            http_client, base_url, item, ansible_params, item_type, check_mode
+        )
+    return True, create_using_html(
+        http_client, base_url, ansible_params, item_type, check_mode
+    )
+
+
+def upsert_using_html(
+    module, http_client, base_url, ansible_params, item_type
+):  # pylint: disable=unused-variable
+    exit_if_cached(module, base_url, ansible_params, item_type)
+
+    try:
+        before = find_item_by(
+            http_client,
+            base_url,
+            item_type + "s",
+            "permalink",
+            ansible_params["permalink"],
+        )
+        changed, item = ensure_using_html(
+            http_client, base_url, ansible_params, item_type, module.check_mode
+        )
+    except (HTTPError, SamsonError) as err:
+        module.fail_json(changed=False, msg=error_message(err))
+
+    exit_with_state(module, base_url, ansible_params, item_type, item, changed, before)
+
+
+def ensure_many_using_html(
+    http_client, base_url, items, item_type, concurrency=8, check_mode=False
+):
+    """Converges many entities through Samson's HTML forms.
+
+    Every item holds the form fields along with its `state`. The collection is
+    listed once to plan the writes, which then run at most `concurrency` at a
+    time, and once more afterwards to return the resulting entities. An item
+    Samson rejects is reported as failed without stopping the others. Returns
+    a result per item, in order.
+    """
+    if not items:
+        return []
+
+    listing = fetch_listing(http_client, base_url, item_type + "s")
+    results = []
+    writes = []
+    for item in items:
+        params = dict(item)
+        state = params.pop("state", "present")
+        permalink = params["permalink"]
+        before = listing.by_permalink.get(permalink)
+        result = dict(permalink=permalink, changed=False, before=before)
+        results.append(result)
+
+        if not is_valid_permalink(permalink):
+            msg = "Permalink should match `{}`".format(VALID_PERMALINK_REGEX)
+            result.update(failed=True, msg=msg)
+            continue
+
+        if state == "absent":
+            action = "deleted" if before is not None else "unchanged"
+        elif before is None:
+            action = "created"
+            result[item_type] = dict(params)
+        elif html_update(before, params) is not None:
+            action = "updated"
+            result[item_type] = planned_entity(before, params)
+        else:
+            action = "unchanged"
+            result[item_type] = before
+
+        result.update(action=action, changed=action != "unchanged")
+        if result["changed"]:
+            writes.append((result, params))
+
+    if check_mode or not writes:
+        return results
+
+    def write(args):
+        result, params = args
+        try:
+            write_using_html(http_client, base_url, result, params, item_type)
+        except (HTTPError, SamsonError) as err:
+            result.update(failed=True, changed=False, msg=error_message(err))
+            result.pop(item_type, None)
+
+    for result, _ in writes:
+        samson_utils._state_cache.forget(  # pylint: disable=protected-access
+            entity_url(base_url, result["permalink"])
+        )
+
+    pool = ThreadPool(min(concurrency, len(writes)))
+    try:
+        pool.map(write, writes)
+    finally:
+        pool.close()
+        pool.join()
+
+    # The writes invalidated the listing, so this lists the collection again
+    listing = fetch_listing(http_client, base_url, item_type + "s")
+    for result, _ in writes:
+        if item_type in result:
+            result[item_type] = listing.by_permalink.get(result["permalink"])
+    return results
+
+
+def write_using_html(http_client, base_url, result, ansible_params, item_type):
+    """Applies the planned action of one item without reading it back."""
+    if result["action"] == "created":
+        submit_create_using_html(http_client, base_url, ansible_params, item_type)
+    elif result["action"] == "updated":
+        url = entity_url(base_url, result["permalink"], json_suffix=False)
+        new = html_update(result["before"], ansible_params)
+        submit_html_form(http_client, "PATCH", url, {item_type: new})
+    else:
+        delete_entities(http_client, base_url, [result], "permalink", json_suffix=False)
+
+
+def upsert_many_using_html(
+    module, http_client, base_url, items, item_type
+):  # pylint: disable=unused-variable
+    if module.params["concurrency"] < 1:
+        module.fail_json(changed=False, msg="concurrency must be at least 1")
+
+    try:
+        results = ensure_many_using_html(
+            http_client,
+            base_url,
+            items,
+            item_type,
+            module.params["concurrency"],
+            module.check_mode,
+        )
+    except HTTPError as err:
+        module.fail_json(changed=False, msg=error_message(err))
+
+    diff = entities_diff(results, item_type)
+    changed = any(result["changed"] for result in results)
+    extra = dict(diff=diff) if module._diff else {}  # pylint: disable=protected-access
+
+    failed = [result for result in results if result.get("failed")]
+    if failed:
+        msg = "Failed to converge {} {}(s)".format(len(failed), item_type)
+        module.fail_json(changed=changed, msg=msg, results=results, **extra)
+    module.exit_json(changed=changed, results=results, **extra)
+
+
+class HtmlErrorParser(HTMLParser):
+    """Collects the errors Samson renders on a form it rejected.
+
+    The errors follow a `There was an error ...` heading as the items of a
+    `<ul>`. The parser is fed the markup after the heading, `done` is set
+    once that list is closed.
+    """
+
+    def __init__(self):
+        HTMLParser.__init__(self)
+        self.errors = []
+        self.seen_heading = False
+        self.in_list = False
+        self.item = None
+        self.done = False
+
+    def handle_starttag(self, tag, _attrs):
+        if tag == "ul" and self.seen_heading:
+            self.in_list = True
+        elif tag == "li" and self.in_list:
+            self.item = []
+
+    def handle_endtag(self, tag):
+        if tag == "li" and self.item is not None:
+            error = "".join(self.item).strip()
+            if error:
+                self.errors.append(error)
+            self.item = None
+        elif tag == "ul" and self.in_list:
+            self.done = True
+
+    def handle_data(self, data):
+        if self.item is not None:
+            self.item.append(data)
+
+
+def extract_html_errors(res):
+    """Returns the errors on an HTML page, or an empty list if it has none.
+
+    The page is searched for the error heading as it's read. Only the markup
+    between the heading and the end of the error list goes through the
+    parser, and reading stops there.
+    """
+    heading = HTML_ERROR_HEADING.encode("utf-8")
+    parser = HtmlErrorParser()
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    tail = b""
+    while not parser.done:
+        chunk = res.read(CHUNK_SIZE)
+        if not chunk:
+            break
+
+        if parser.seen_heading:
+            feed_html_errors(parser, decoder, chunk)
+            continue
+
+        # Keep the end of the previous chunk in case the heading spans both
+        data = tail + chunk
+        idx = data.find(heading)
+        if idx == -1:
+            tail = data[-len(heading) + 1 :]
+            continue
+        parser.seen_heading = True
+        feed_html_errors(parser, decoder, data[idx + len(heading) :])
+
+    res.close()
+    return parser.errors
+
+
+def feed_html_errors(parser, decoder, data):
+    # Feed the parser up to each closing list tag so it never tokenizes
+    # markup past the errors
+    while data and not parser.done:
+        end = data.find(b"</ul>")
+        if end == -1:
+            piece, data = data, b""
+        else:
+            piece, data = data[: end + len(b"</ul>")], data[end + len(b"</ul>") :]
+        parser.feed(decoder.decode(piece))
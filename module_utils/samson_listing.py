@@ -0,0 +1,248 @@
+# Listings of Samson's collections: following their pagination links,
+# decoding them while they stream in and keeping them for the rest of a task.
+
+import codecs
+import json
+import re
+import sys
+import threading
+
+if sys.version_info.major == 3:
+    from urllib.parse import urljoin  # pylint: disable=import-error
+else:
+    from urlparse import urljoin  # pylint: disable=import-error
+
+try:
+    from ansible.module_utils import (  # pylint: disable=no-name-in-module
+        samson_connections,
+    )
+except ImportError:
+    # ENV=dev puts module_utils itself on the path
+    import samson_connections  # pylint: disable=import-error
+
+CHUNK_SIZE = samson_connections.CHUNK_SIZE
+timer = samson_connections.timer
+
+NEXT_PAGE_REGEX = re.compile(r'<([^>]+)>\s*;\s*rel="?next"?')
+
+
+def entity_url(base_url, identifier="", json_suffix=True):
+    parts = [base_url]
+    if identifier:
+        parts.append(identifier)
+
+    url = format("/".join(parts))
+
+    if json_suffix:
+        return url + ".json"
+
+    return url
+
+
+class Listing(object):
+    """A collection fetched from Samson, indexed by id, permalink and name."""
+
+    def __init__(self, items):
+        self.items = items
+        self.by_id = index_items(items, "id")
+        self.by_permalink = index_items(items, "permalink")
+        self.by_name = index_items(items, "name")
+
+    def find(self, condition):
+        for item in self.items:
+            if condition(item):
+                return item
+        return None
+
+
+def index_items(items, key):
+    index = {}
+    for item in items:
+        if key in item:
+            # Keep the first match to behave like a linear scan
+            index.setdefault(item[key], item)
+    return index
+
+
+# Collections fetched during this module run, keyed by listing url
+_listings = {}
+# Listings being fetched right now. A write that happens meanwhile marks the
+# fetch as stale so its result isn't cached.
+_fetching = {}
+_listings_lock = threading.Lock()
+
+
+def fetch_listing(http_client, base_url, json_key):
+    url = entity_url(base_url)
+    listing = _listings.get(url)
+    if listing is not None:
+        return listing
+
+    fetch = dict(url=url, stale=False)
+    with _listings_lock:
+        _fetching[id(fetch)] = fetch
+    try:
+        listing = Listing(list(iter_items(http_client, base_url, json_key)))
+    finally:
+        with _listings_lock:
+            del _fetching[id(fetch)]
+            if not fetch["stale"]:
+                _listings[url] = listing
+    return listing
+
+
+def listing_affected(listing_url, written_url):
+    # A write affects the collection it belongs to as well as every
+    # collection nested below the written entity.
+    written = (
+        written_url[: -len(".json")] if written_url.endswith(".json") else written_url
+    )
+    collection = listing_url[: -len(".json")]
+    return (
+        written == collection
+        or written.startswith(collection + "/")
+        or collection.startswith(written + "/")
+    )
+
+
+def invalidate_listings(url):  # pylint: disable=unused-variable
+    with _listings_lock:
+        for listing_url in list(_listings):
+            if listing_affected(listing_url, url):
+                del _listings[listing_url]
+        for fetch in _fetching.values():
+            if listing_affected(fetch["url"], url):
+                fetch["stale"] = True
+
+
+def reset_listings():  # pylint: disable=unused-variable
+    with _listings_lock:
+        _listings.clear()
+
+
+def cached_listing(base_url):  # pylint: disable=unused-variable
+    """Returns the listing fetched earlier in this task, if there is one."""
+    return _listings.get(entity_url(base_url))
+
+
+class JsonArrayStream(object):
+    """Decodes the items of a `{"<json_key>": [...]}` document one at a time.
+
+    The response is read in chunks and only the undecoded remainder is kept in
+    memory, so iterating a large listing doesn't hold all of it at once.
+    """
+
+    def __init__(self, res, json_key, chunk_size=CHUNK_SIZE):
+        self.res = res
+        self.json_key = json_key
+        self.chunk_size = chunk_size
+        self.decoder = json.JSONDecoder()
+        self.text_decoder = codecs.getincrementaldecoder("utf-8")()
+        self.buf = ""
+        self.pos = 0
+        self.eof = False
+
+    def fill(self):
+        if self.eof:
+            return False
+        chunk = self.res.read(self.chunk_size)
+        if not chunk:
+            self.eof = True
+        text = self.text_decoder.decode(chunk or b"", final=self.eof)
+        self.buf = self.buf[self.pos :] + text
+        self.pos = 0
+        return not self.eof or bool(text)
+
+    def peek(self):
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in " \t\r\n":
+                self.pos += 1
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self.fill():
+                return None
+
+    def seek_array(self):
+        key = re.compile(r'"{}"\s*:\s*\['.format(re.escape(self.json_key)))
+        while True:
+            match = key.search(self.buf, self.pos)
+            if match:
+                self.pos = match.end()
+                return
+            # Keep enough of the tail to match a key split across chunks
+            self.pos = max(self.pos, len(self.buf) - len(self.json_key) - 16)
+            if not self.fill():
+                raise KeyError(self.json_key)
+
+    def decode_item(self):
+        timing = getattr(self.res, "timing", None)
+        while True:
+            try:
+                start = timer()
+                try:
+                    item, end = self.decoder.raw_decode(self.buf, self.pos)
+                finally:
+                    if timing is not None:
+                        timing.json_decode += timer() - start
+                # A value ending right at the buffer boundary may be truncated
+                if end < len(self.buf) or self.eof:
+                    self.pos = end
+                    return item
+            except ValueError:
+                if self.eof:
+                    raise
+            self.fill()
+
+    def __iter__(self):
+        self.seek_array()
+        first = True
+        while True:
+            char = self.peek()
+            if char is None:
+                raise ValueError("Unterminated `{}` array".format(self.json_key))
+            if char == "]":
+                return
+            if not first:
+                if char != ",":
+                    raise ValueError("Expected `,` in `{}` array".format(self.json_key))
+                self.pos += 1
+                self.peek()
+            first = False
+            yield self.decode_item()
+
+
+def next_page_url(res, url):
+    match = NEXT_PAGE_REGEX.search(res.info().get("Link") or "")
+    # Link targets may be relative to the page they were sent with
+    return urljoin(url, match.group(1)) if match else None
+
+
+def iter_items(http_client, base_url, json_key):
+    """Yields every item of a collection, following Samson's pagination links."""
+    url = entity_url(base_url)
+    while url:
+        res = http_client.get(url)
+        url = next_page_url(res, url)
+        for item in JsonArrayStream(res, json_key):
+            yield item
+
+
+def find_item(
+    http_client, base_url, json_key, condition
+):  # pylint: disable=unused-variable
+    listing = _listings.get(entity_url(base_url))
+    if listing is not None:
+        return listing.find(condition)
+
+    # Stream the collection and stop as soon as we have a match
+    for item in iter_items(http_client, base_url, json_key):
+        if condition(item):
+            return item
+    return None
+
+
+def find_item_by(
+    http_client, base_url, json_key, key, value
+):  # pylint: disable=unused-variable
+    listing = fetch_listing(http_client, base_url, json_key)
+    return getattr(listing, "by_" + key).get(value)
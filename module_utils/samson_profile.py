@@ -0,0 +1,176 @@
+# Timings of the requests a module run makes, collected with `samson_profile`.
+
+import json
+import os
+import sys
+import threading
+import time
+
+if sys.version_info.major == 3:
+    from urllib.parse import urlsplit  # pylint: disable=import-error
+else:
+    from urlparse import urlsplit  # pylint: disable=import-error
+
+try:
+    from ansible.module_utils import (  # pylint: disable=no-name-in-module
+        samson_connections,
+    )
+except ImportError:
+    # ENV=dev puts module_utils itself on the path
+    import samson_connections  # pylint: disable=import-error
+
+timer = samson_connections.timer
+
+
+class RequestTiming(object):
+    """Where the time of a single request went, in seconds.
+
+    `dns` and `connect` stay at zero when a pooled connection was reused,
+    `dns` also when an earlier connection already looked the host up.
+    `total` runs until the body was read completely, `json_decode` is the
+    part of it spent decoding the body.
+    """
+
+    def __init__(self, method, url, bytes_sent, start):
+        self.method = method
+        self.url = url_template(url)
+        self.status = None
+        self.reused = False
+        self.bytes_sent = bytes_sent
+        self.bytes_received = 0
+        # Seconds between the start of the module run and this request
+        self.start = start
+        self.started_at = timer()
+        self.dns = 0.0
+        self.connect = 0.0
+        self.ttfb = None
+        self.total = None
+        self.json_decode = 0.0
+
+    def first_byte(self, status):
+        self.status = status
+        self.ttfb = timer() - self.started_at
+
+    def finish(self):
+        if self.total is None:
+            self.total = timer() - self.started_at
+
+    def as_dict(self):
+        result = dict(
+            method=self.method,
+            url=self.url,
+            status=self.status,
+            reused=self.reused,
+            bytes_sent=self.bytes_sent,
+            bytes_received=self.bytes_received,
+        )
+        for key in TIMING_PHASES + ("start",):
+            value = getattr(self, key)
+            result[key] = None if value is None else round(value, 6)
+        return result
+
+
+TIMING_PHASES = ("dns", "connect", "ttfb", "total", "json_decode")
+
+
+def url_template(url):
+    """Returns the path of `url` with ids and permalinks replaced.
+
+    Samson's paths alternate between collections and the entities in them,
+    e.g. /projects/dotfiles/stages/3.json becomes
+    /projects/{permalink}/stages/{id}.json
+    """
+    segments = urlsplit(url).path.split("/")
+    for idx in range(2, len(segments), 2):
+        identifier, dot, suffix = segments[idx].partition(".")
+        if identifier:
+            placeholder = "{id}" if identifier.isdigit() else "{permalink}"
+            segments[idx] = placeholder + dot + suffix
+    return "/".join(segments)
+
+
+class Profile(object):  # pylint: disable=unused-variable
+    """The timings of every request made during a module run.
+
+    Enabled with the `samson_profile` option, see `report_timings`.
+    """
+
+    def __init__(self):
+        self.started_at = timer()
+        self.requests = []
+        self.lock = threading.Lock()
+
+    def start(self, method, url, data):
+        timing = RequestTiming(method, url, len(data or b""), timer() - self.started_at)
+        with self.lock:
+            self.requests.append(timing)
+        return timing
+
+    def timings(self):
+        with self.lock:
+            return [timing.as_dict() for timing in self.requests]
+
+    def aggregate(self):
+        """Sums up the requests per method, url template and status."""
+        groups = {}
+        for timing in self.timings():
+            key = (timing["method"], timing["url"], timing["status"])
+            group = groups.get(key)
+            if group is None:
+                group = groups[key] = dict(
+                    method=timing["method"],
+                    url=timing["url"],
+                    status=timing["status"],
+                    count=0,
+                    bytes_sent=0,
+                    bytes_received=0,
+                )
+                for phase in TIMING_PHASES:
+                    group[phase + "_sum"] = 0.0
+                    group[phase + "_max"] = 0.0
+            group["count"] += 1
+            group["bytes_sent"] += timing["bytes_sent"]
+            group["bytes_received"] += timing["bytes_received"]
+            for phase in TIMING_PHASES:
+                value = timing[phase] or 0.0
+                group[phase + "_sum"] = round(group[phase + "_sum"] + value, 6)
+                group[phase + "_max"] = max(group[phase + "_max"], value)
+        return [groups[key] for key in sorted(groups, key=str)]
+
+    def write_trace(self, path, module_name):
+        """Appends the aggregated timings to `path`, one JSON object a line."""
+        timestamp = time.time()
+        lines = []
+        for group in self.aggregate():
+            group.update(module=module_name, timestamp=timestamp)
+            lines.append(json.dumps(group, sort_keys=True) + "\n")
+
+        directory = os.path.dirname(os.path.abspath(path))
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        # A single write keeps lines of concurrent tasks from interleaving
+        with open(path, "a") as trace_file:
+            trace_file.write("".join(lines))
+
+
+def report_timings(module, profile):  # pylint: disable=unused-variable
+    """Adds the request timings to whatever result the module exits with.
+
+    The aggregated timings are also appended to `samson_profile_trace` when
+    it's set.
+    """
+
+    def wrap(report):
+        def report_with_timings(*args, **kwargs):
+            kwargs["timings"] = profile.timings()
+            trace_path = module.params.get("samson_profile_trace")
+            if trace_path:
+                profile.write_trace(
+                    trace_path, module._name  # pylint: disable=protected-access
+                )
+            report(*args, **kwargs)
+
+        return report_with_timings
+
+    module.exit_json = wrap(module.exit_json)
+    module.fail_json = wrap(module.fail_json)
@@ -0,0 +1,390 @@
+# Snapshots of a Samson instance, written by samson_facts and read by every
+# module given `samson_snapshot`.
+
+import hashlib
+import io
+import json
+import mmap
+import os
+import sys
+import threading
+import time
+
+if sys.version_info.major == 3:
+    from urllib.parse import urlsplit  # pylint: disable=import-error
+else:
+    from urlparse import urlsplit  # pylint: disable=import-error
+
+# Snapshots can optionally be written as msgpack
+try:
+    import msgpack  # pylint: disable=import-error
+except ImportError:
+    msgpack = None
+
+try:
+    from ansible.module_utils import (  # pylint: disable=no-name-in-module
+        samson_utils,
+    )
+except ImportError:
+    # ENV=dev puts module_utils itself on the path
+    import samson_utils  # pylint: disable=import-error
+
+HTTPStatusError = samson_utils.HTTPStatusError
+SamsonError = samson_utils.SamsonError
+SnapshotStale = samson_utils.SnapshotStale
+BufferedResponse = samson_utils.BufferedResponse
+Listing = samson_utils.Listing
+iter_items = samson_utils.iter_items
+listing_affected = samson_utils.listing_affected
+
+SNAPSHOT_VERSION = 1
+SNAPSHOT_FORMATS = ("jsonl", "msgpack")  # pylint: disable=unused-variable
+# The collection each kind of snapshot record was listed from
+SNAPSHOT_KIND_COLLECTIONS = dict(
+    project="projects",
+    stage="stages",
+    command="commands",
+    environment="environments",
+    deploy_group="deploy_groups",
+    webhook="webhooks",
+    outbound_webhook="webhooks",
+)
+SNAPSHOT_COLLECTIONS = ("projects", "commands", "environments", "deploy_groups")
+SNAPSHOT_NESTED_KINDS = dict(
+    stages="stage", webhooks="webhook", outbound_webhooks="outbound_webhook"
+)
+# Kinds that are also fetched one at a time through the JSON API
+SNAPSHOT_ENTITY_KINDS = ("project", "stage")
+
+
+class SnapshotWriter(object):  # pylint: disable=unused-variable
+    """Streams the entities of a Samson instance into a snapshot.
+
+    Every record is a `[kind, fields]` pair handed to `emit`, the first one
+    describes the snapshot itself. Entities are only written once per kind and
+    id. Commands refer to their text by `hash`, and each distinct text is
+    written once as a `command_text` record ahead of the first command using
+    it.
+    """
+
+    def __init__(self, emit, url, listed):
+        self.emit = emit
+        self.seen = set()
+        self.counts = {}
+        header = dict(
+            version=SNAPSHOT_VERSION,
+            url=url,
+            collections=sorted(listed),
+            created_at=int(time.time()),
+        )
+        emit(["snapshot", header])
+
+    def write(self, kind, item):
+        key = (kind, item.get("id"))
+        if key in self.seen:
+            return
+        self.seen.add(key)
+
+        if kind == "command":
+            item = dict(item)
+            text = item.pop("command")
+            item["hash"] = text_digest(text)
+            if ("command_text", item["hash"]) not in self.seen:
+                self.seen.add(("command_text", item["hash"]))
+                self.emit(["command_text", dict(hash=item["hash"], text=text)])
+        self.counts[kind] = self.counts.get(kind, 0) + 1
+        self.emit([kind, item])
+
+
+def text_digest(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def snapshot_encoder(snapshot_format):  # pylint: disable=unused-variable
+    """Returns a function turning a snapshot record into bytes."""
+    if snapshot_format == "msgpack":
+        return msgpack.Packer(use_bin_type=True).pack
+
+    def encode(record):
+        line = json.dumps(record, separators=(",", ":"), sort_keys=True)
+        return (line + "\n").encode("utf-8")
+
+    return encode
+
+
+class SnapshotDigest(object):  # pylint: disable=unused-variable
+    """Digest of the records of a snapshot, whatever order they're in.
+
+    Listings are crawled concurrently, so taking the same snapshot twice can
+    write its records in another order. When it was taken doesn't count.
+    """
+
+    def __init__(self):
+        self.digests = []
+
+    def add(self, record):
+        kind, fields = record
+        if kind == "snapshot":
+            fields = dict(
+                (key, value) for key, value in fields.items() if key != "created_at"
+            )
+        line = json.dumps([kind, fields], separators=(",", ":"), sort_keys=True)
+        self.digests.append(hashlib.sha256(line.encode("utf-8")).digest())
+
+    def hexdigest(self):
+        return hashlib.sha256(b"".join(sorted(self.digests))).hexdigest()
+
+
+class Snapshot(object):
+    """A snapshot written by samson_facts, read through mmap.
+
+    Opening it only locates the records of each kind, they're decoded the
+    first time a record of their kind is needed.
+    """
+
+    def __init__(self, path):
+        with open(path, "rb") as snapshot_file:
+            self.data = mmap.mmap(snapshot_file.fileno(), 0, access=mmap.ACCESS_READ)
+        # JSON Lines snapshots start with the `[` of their first record
+        self.msgpack = self.data[:1] != b"["
+        if self.msgpack and msgpack is None:
+            raise SamsonError("Reading {} needs the msgpack library".format(path))
+        self.offsets = self.scan_msgpack() if self.msgpack else self.scan_jsonl()
+        self.decoded = {}
+        self.listings = {}
+        self.lock = threading.RLock()
+
+        header = self.records("snapshot")
+        if not header or header[0].get("version") != SNAPSHOT_VERSION:
+            raise SamsonError("{} isn't a snapshot this role can read".format(path))
+        self.header = header[0]
+
+    def scan_jsonl(self):
+        offsets = {}
+        start = 0
+        while start < len(self.data):
+            end = self.data.find(b"\n", start)
+            if end == -1:
+                end = len(self.data)
+            # Every line starts with `["<kind>",`
+            kind = self.data[start + 2 : self.data.find(b'"', start + 2)]
+            offsets.setdefault(kind.decode("utf-8"), []).append((start, end))
+            start = end + 1
+        return offsets
+
+    def scan_msgpack(self):
+        offsets = {}
+        self.data.seek(0)
+        unpacker = msgpack.Unpacker(self.data, raw=False)
+        start = 0
+        while True:
+            try:
+                unpacker.read_array_header()
+            except msgpack.OutOfData:
+                return offsets
+            kind = unpacker.unpack()
+            unpacker.skip()
+            end = unpacker.tell()
+            offsets.setdefault(kind, []).append((start, end))
+            start = end
+
+    def digest(self):
+        digest = SnapshotDigest()
+        for kind, spans in self.offsets.items():
+            for span in spans:
+                digest.add([kind, self.decode(*span)])
+        return digest.hexdigest()
+
+    def decode(self, start, end):
+        if self.msgpack:
+            return msgpack.unpackb(self.data[start:end], raw=False)[1]
+        return json.loads(self.data[start:end].decode("utf-8"))[1]
+
+    def records(self, kind):
+        with self.lock:
+            if kind not in self.decoded:
+                records = [self.decode(*span) for span in self.offsets.get(kind, [])]
+                if kind == "command":
+                    texts = dict(
+                        (text["hash"], text["text"])
+                        for text in self.records("command_text")
+                    )
+                    for record in records:
+                        record["command"] = texts[record.pop("hash")]
+                self.decoded[kind] = records
+            return self.decoded[kind]
+
+    def covers(self, kind):
+        listed = self.header.get("collections", SNAPSHOT_KIND_COLLECTIONS.values())
+        return SNAPSHOT_KIND_COLLECTIONS.get(kind) in listed
+
+    def listing(self, kind, project_id=None):
+        """Returns the entities of `kind`, those of one project if it's given."""
+        with self.lock:
+            if (kind, project_id) not in self.listings:
+                if project_id is None:
+                    self.listings[(kind, None)] = Listing(self.records(kind))
+                else:
+                    # Group the entities of every project in one pass
+                    groups = {}
+                    for item in self.records(kind):
+                        groups.setdefault(item.get("project_id"), []).append(item)
+                    for group_project_id, items in groups.items():
+                        self.listings[(kind, group_project_id)] = Listing(items)
+                    self.listings.setdefault((kind, project_id), Listing([]))
+            return self.listings[(kind, project_id)]
+
+
+# Snapshots opened by this process by path, along with their size and mtime
+_snapshots = {}
+
+
+def open_snapshot(path):  # pylint: disable=unused-variable
+    try:
+        stat = os.stat(path)
+        version = (stat.st_size, stat.st_mtime)
+        if path not in _snapshots or _snapshots[path][0] != version:
+            _snapshots[path] = (version, Snapshot(path))
+    except (IOError, OSError, ValueError) as err:
+        raise SamsonError("Can't read snapshot {}: {}".format(path, err))
+    return _snapshots[path][1]
+
+
+def find_in_listing(listing, identifier):
+    # Entities are addressed by permalink, or by id when they have none
+    item = listing.by_permalink.get(identifier)
+    if item is None and identifier.isdigit():
+        item = listing.by_id.get(int(identifier))
+    return item
+
+
+def snapshot_json_key(kind):
+    # Inbound and outbound webhooks are both listed under `webhooks`
+    return "webhooks" if kind.endswith("webhook") else kind + "s"
+
+
+class SnapshotReads(object):  # pylint: disable=unused-variable
+    """Answers the GET requests of a module run from a snapshot.
+
+    Listings of the collections in the snapshot are answered without asking
+    Samson, and so are projects and stages fetched one at a time. Once the run
+    writes to a collection it's read from Samson again. Before the first write
+    to a collection the snapshot answered for, the collection is listed from
+    Samson. The write only goes ahead when the entity it changes is still the
+    way the snapshot recorded it, and a POST only when nothing was created in
+    the meantime.
+    """
+
+    def __init__(self, snapshot, url):
+        self.snapshot = snapshot
+        self.root = urlsplit(url).path.rstrip("/")
+        # Paths written to by this run
+        self.written = []
+        # Collections the snapshot answered for and the live listings they
+        # were checked against
+        self.served = set()
+        self.live = {}
+        self.lock = threading.Lock()
+
+    def locate(self, path):
+        """Splits the path of a collection or entity.
+
+        Returns the path of the collection, the kind of its entities, the
+        permalink of the project it's nested in and the entity's identifier.
+        Returns None for paths the snapshot knows nothing about.
+        """
+        if not path.startswith(self.root + "/"):
+            return None
+        parts = path[len(self.root) + 1 :].split("/")
+        if parts[0] in SNAPSHOT_COLLECTIONS and len(parts) <= 2:
+            kind, project, rest = parts[0][:-1], None, parts[1:]
+        elif (
+            len(parts) in (3, 4)
+            and parts[0] == "projects"
+            and parts[2] in SNAPSHOT_NESTED_KINDS
+        ):
+            kind, project, rest = SNAPSHOT_NESTED_KINDS[parts[2]], parts[1], parts[3:]
+        else:
+            return None
+        collection = "/".join([self.root] + parts[: len(parts) - len(rest)])
+        return collection, kind, project, rest[0] if rest else None
+
+    def listing(self, kind, project_permalink):
+        if project_permalink is None:
+            return self.snapshot.listing(kind)
+        project = find_in_listing(self.snapshot.listing("project"), project_permalink)
+        if project is None:
+            return None
+        return self.snapshot.listing(kind, project["id"])
+
+    def was_written(self, collection):
+        return any(
+            listing_affected(collection + ".json", path) for path in self.written
+        )
+
+    def response(self, url):
+        """Returns the response to a GET of `url`, or None to ask Samson."""
+        parts = urlsplit(url)
+        if parts.query or not parts.path.endswith(".json"):
+            return None
+        located = self.locate(parts.path[: -len(".json")])
+        if located is None:
+            return None
+        collection, kind, project_permalink, identifier = located
+        if not self.snapshot.covers(kind) or self.was_written(collection):
+            return None
+        if identifier is not None and kind not in SNAPSHOT_ENTITY_KINDS:
+            return None
+        listing = self.listing(kind, project_permalink)
+        if listing is None:
+            return None
+
+        self.served.add(collection)
+        if identifier is None:
+            body = {snapshot_json_key(kind): listing.items}
+        else:
+            item = find_in_listing(listing, identifier)
+            if item is None:
+                raise HTTPStatusError(url, 404, "Not Found", {}, io.BytesIO(b""))
+            body = {kind: item}
+        headers = {"Content-Type": "application/json"}
+        return BufferedResponse(url, 200, headers, json.dumps(body).encode("utf-8"))
+
+    def before_write(self, http_client, url):
+        parts = urlsplit(url)
+        path = parts.path
+        if path.endswith(".json"):
+            path = path[: -len(".json")]
+        located = self.locate(path)
+
+        with self.lock:
+            self.written.append(path)
+            if located is None or located[0] not in self.served:
+                return
+            collection, kind, project_permalink, identifier = located
+
+            recorded = self.listing(kind, project_permalink)
+            live = self.live.get(collection)
+            if live is None:
+                # The collection was just written to, so this lists it from
+                # Samson
+                base_url = "{}://{}{}".format(parts.scheme, parts.netloc, collection)
+                items = iter_items(http_client, base_url, snapshot_json_key(kind))
+                live = self.live[collection] = Listing(list(items))
+
+            if identifier is None:
+                known = set(item.get("id") for item in recorded.items)
+                stale = any(item.get("id") not in known for item in live.items)
+            else:
+                before = find_in_listing(recorded, identifier)
+                if before is None:
+                    # Created by this run
+                    return
+                current = find_in_listing(live, identifier)
+                stale = current is None or any(
+                    before.get(key) != value for key, value in current.items()
+                )
+
+        if stale:
+            msg = "{} changed since the snapshot was taken, take a new one".format(path)
+            raise SnapshotStale(msg)
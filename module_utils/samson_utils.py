@@ -1,102 +1,285 @@
+import io
+import random
+import socket
+import ssl
 import sys
 import re
 import json
+import threading
+import time
+from email.utils import mktime_tz, parsedate_tz
+
+from ansible.module_utils.parsing.convert_bool import boolean
 
 if sys.version_info.major == 3:
+    import http.client as httplib  # pylint: disable=import-error
     from urllib.error import URLError as HTTPError  # pylint: disable=import-error
+    from urllib.error import (  # pylint: disable=import-error
+        HTTPError as HTTPStatusError,
+        URLError,
+    )
+    from urllib.parse import urljoin, urlsplit  # pylint: disable=import-error
+    from urllib.request import (  # pylint: disable=import-error
+        getproxies,
+        proxy_bypass,
+    )
 else:
+    from urllib import (  # pylint: disable=import-error, no-name-in-module
+        getproxies,
+        proxy_bypass,
+    )
     from urllib2 import HTTPError  # pylint: disable=import-error
-
+    from urllib2 import (  # pylint: disable=import-error
+        HTTPError as HTTPStatusError,
+        URLError,
+    )
+    from urlparse import urljoin, urlsplit  # pylint: disable=import-error
+    import httplib  # pylint: disable=import-error
+
+try:
+    from ansible.module_utils import (  # pylint: disable=no-name-in-module, ungrouped-imports
+        samson_cache,
+        samson_connections,
+        samson_listing,
+    )
+except ImportError:
+    # ENV=dev puts module_utils itself on the path
+    import samson_cache  # pylint: disable=import-error
+    import samson_connections  # pylint: disable=import-error
+    import samson_listing  # pylint: disable=import-error
+
+BufferedResponse = samson_connections.BufferedResponse
+CHUNK_SIZE = samson_connections.CHUNK_SIZE  # pylint: disable=unused-variable
+ConnectionPool = samson_connections.ConnectionPool
+PooledResponse = samson_connections.PooledResponse
+timed_connect = samson_connections.timed_connect
+timer = samson_connections.timer
+StateCache = samson_cache.StateCache
+ValidatorCache = samson_cache.ValidatorCache
+Listing = samson_listing.Listing  # pylint: disable=unused-variable
+cached_listing = samson_listing.cached_listing
+entity_url = samson_listing.entity_url
+fetch_listing = samson_listing.fetch_listing  # pylint: disable=unused-variable
+find_item = samson_listing.find_item  # pylint: disable=unused-variable
+find_item_by = samson_listing.find_item_by
+invalidate_listings = samson_listing.invalidate_listings
+iter_items = samson_listing.iter_items  # pylint: disable=unused-variable
+listing_affected = samson_listing.listing_affected  # pylint: disable=unused-variable
+reset_listings = samson_listing.reset_listings
 
 DISALLOWED_PROPS = ["id", "created_at", "updated_at", "deleted_at"]
+VALID_PERMALINK_REGEX = "^[A-Za-z0-9-]+$"
+MAX_VALIDATED_BODY = 1024 * 1024
+MAX_REDIRECTS = 10
+# Samson answers these while it's overloaded or restarting
+RETRY_STATUSES = (429, 502, 503, 504)
+# Repeating these has the same effect as sending them once
+IDEMPOTENT_METHODS = ("GET", "HEAD", "PUT", "PATCH", "DELETE")
+MAX_RETRY_DELAY = 60
+
+# Options shared by the modules that support the on-disk state cache
+CACHE_ARGUMENT_SPEC = dict(  # pylint: disable=unused-variable
+    cache_path=dict(type="path"),
+    cache_ttl=dict(type="int", default=3600),
+    cache_max_entries=dict(type="int", default=1000),
+)
+
+# Options every module takes to tune its HTTP client
+CLIENT_ARGUMENT_SPEC = dict(  # pylint: disable=unused-variable
+    samson_timeout=dict(type="int", default=30),
+    # Retries of requests that failed in transit or while Samson was busy
+    samson_retries=dict(type="int", default=3),
+    samson_retry_delay=dict(type="float", default=1.0),
+    # Requests per second, 0 doesn't limit them
+    samson_rate_limit=dict(type="float", default=0),
+    samson_rate_burst=dict(type="int", default=10),
+    # Report how long the requests took
+    samson_profile=dict(type="bool", default=False),
+    samson_profile_trace=dict(type="path"),
+    # Answer lookups from a snapshot written by samson_facts
+    samson_snapshot=dict(type="path"),
+)
+
+
+class SamsonError(Exception):
+    """Samson rejected a change, `msg` holds the errors it reported."""
+
+    def __init__(self, msg):
+        super(SamsonError, self).__init__(msg)
+        self.msg = msg
+
+
+def create_entity(
+    http_client, base_url, item_type, params, name=None
+):  # pylint: disable=unused-variable
+    """Creates an entity through the JSON API and returns it.
 
+    Samson answers with the new entity or redirects to it, in which case only
+    the permalink is known. When it does neither, the entity is looked up by
+    `name`. Without a name None is returned and the lookup is up to the caller.
+    """
 
-def create_using_html(module, http_client, base_url, ansible_params, item_type):
-    try:
-        url = entity_url(base_url, json_suffix=False)
-        res = http_client.post(url, data=json.dumps(ansible_params))
-        errors = extract_html_errors(res)
-        if errors:
-            module.fail_json(changed=False, msg=dict(errors=errors))
-
-        # The Samson API doesn't actually use the permalink we provided on
-        # creation. Instead it uses the name with whitespace replaced by dashes.
-        # We need to perform a creation post-update to ensure the permalink is
-        # the one the user provided.
-        by_name = lambda item: item["name"] == ansible_params["name"]
-        item = find_item(http_client, base_url, item_type + "s", by_name)
-        url = entity_url(base_url, item["permalink"], json_suffix=False)
-        http_client.patch(
-            url,
-            data=json.dumps(dict(permalink=ansible_params["permalink"])),
-            follow_redirects=True,
-        )
-
-        by_permalink = lambda item: item["permalink"] == ansible_params["permalink"]
-        item = find_item(http_client, base_url, item_type + "s", by_permalink)
-        result = {"changed": True, item_type: item}
-        module.exit_json(**result)
-    except HTTPError as err:
-        msg = err.msg
-        module.fail_json(changed=False, msg=msg)
-
+    def lookup():
+        return find_item_by(http_client, base_url, item_type + "s", "name", name)
 
-def update_using_html(module, http_client, base_url, item, ansible_params, item_type):
-    new = strip_disallowed_props(item, DISALLOWED_PROPS)
-    new.update(ansible_params)
-    old = strip_disallowed_props(item, DISALLOWED_PROPS)
+    item = create_with_relookup(
+        http_client,
+        lambda: post_entity(http_client, base_url, item_type, params),
+        lookup if name is not None else None,
+    )
+    if item is not None or name is None:
+        return item
+    item = lookup()
+    if item is None:
+        raise SamsonError("Created {} `{}` is missing".format(item_type, name))
+    return item
 
-    if new == old:
-        result = {"changed": False, item_type: item}
-        module.exit_json(**result)
 
+def post_entity(http_client, base_url, item_type, params):
+    url = entity_url(base_url)
     try:
-        url = entity_url(base_url, ansible_params["permalink"], json_suffix=False)
-        res = http_client.patch(
-            url, data=json.dumps({item_type: new}), follow_redirects=True
-        )
-        errors = extract_html_errors(res)
-        if errors:
-            module.fail_json(changed=False, msg=dict(errors=errors))
-
-        by_permalink = lambda env: env["permalink"] == ansible_params["permalink"]
-        item = find_item(http_client, base_url, item_type + "s", by_permalink)
-        result = {"changed": True, item_type: item}
-        module.exit_json(**result)
-    except HTTPError as err:
-        msg = err.msg
-        module.fail_json(changed=False, msg=msg)
+        res = http_client.post(url, data=json.dumps(params), follow_redirects=False)
+    except HTTPStatusError as err:
+        location = redirect_location(err)
+        if location is None:
+            raise
+        permalink = created_permalink(base_url, urljoin(url, location))
+        return None if permalink is None else dict(permalink=permalink)
 
-
-def upsert_using_html(
-    module, http_client, base_url, ansible_params, item_type
-):  # pylint: disable=unused-variable
     try:
-        by_permalink = lambda dg: dg["permalink"] == ansible_params["permalink"]
-        item = find_item(http_client, base_url, item_type + "s", by_permalink)
-
-        if item:
-            update_using_html(
-                module, http_client, base_url, item, ansible_params, item_type
-            )
-        else:
-            create_using_html(module, http_client, base_url, ansible_params, item_type)
-
-    except HTTPError as err:
-        module.fail_json(changed=False, msg=err.msg)
-
-
-def entity_url(base_url, identifier="", json_suffix=True):
-    parts = [base_url]
-    if identifier:
-        parts.append(identifier)
-
-    url = format("/".join(parts))
+        return load_json(res).get(item_type) or None
+    except ValueError:
+        return None
+
+
+def create_with_relookup(http_client, create, lookup=None):
+    """Runs `create`, repeating it after failures that may be transient.
+
+    A POST that failed in transit may have created the entity all the same,
+    so it's only repeated once `lookup` doesn't find the entity. Without a
+    lookup it isn't repeated at all. Returns what `create` or `lookup`
+    returned.
+    """
+    attempt = 0
+    while True:
+        try:
+            return create()
+        except URLError as err:
+            if lookup is None:
+                raise
+            delay = http_client.retry_policy.backoff(err, attempt)
+            if delay is None:
+                raise
+
+        time.sleep(delay)
+        attempt += 1
+        found = lookup()
+        if found is not None:
+            return found
+
+
+def rename_entity(
+    http_client, base_url, item, permalink, item_type
+):  # pylint: disable=unused-variable
+    """Gives a newly created entity the permalink we asked for.
+
+    Samson derives the permalink from the name on creation. Returns the
+    entity as Samson holds it afterwards.
+    """
+    if item["permalink"] != permalink:
+        url = entity_url(base_url, item["permalink"])
+        res = http_client.patch(url, data=json.dumps({"permalink": permalink}))
+    elif "id" in item:
+        return item
+    else:
+        res = http_client.get(entity_url(base_url, permalink))
+    return load_json(res)[item_type]
+
+
+def redirect_location(err):
+    if not 300 <= err.code < 400:
+        return None
+    return err.info().get("Location")
+
+
+def created_permalink(base_url, location):
+    """Returns the permalink of the entity a redirect points to.
+
+    Returns None when it points somewhere other than an entity of the
+    collection at `base_url`.
+    """
+    if not location:
+        return None
+    collection = urlsplit(base_url).path.rstrip("/") + "/"
+    path = urlsplit(location).path
+    if not path.startswith(collection):
+        return None
+    permalink = path[len(collection) :].split("/")[0]
+    if permalink.endswith(".json"):
+        permalink = permalink[: -len(".json")]
+    return permalink or None
+
+
+def strip_none_props(d):  # pylint: disable=unused-variable
+    return {k: v for k, v in d.items() if v is not None}
+
+
+# Id lists whose order Samson keeps. The others are compared as sets.
+ORDERED_ID_FIELDS = ("command_ids",)
+
+
+def normalize_field(key, value):
+    # Samson's forms submit blank strings for unset fields and blank entries
+    # in id lists. Ids coming from templated YAML are often strings while
+    # Samson returns integers, so compare id lists by their integer values.
+    if value == "":
+        return None
+    if key.endswith("_ids") and value is not None:
+        ids = [int(v) if str(v).isdigit() else v for v in value if str(v).strip()]
+        return ids if key in ORDERED_ID_FIELDS else sorted(ids, key=str)
+    return value
+
+
+def field_changed(key, current, desired):
+    current = normalize_field(key, current)
+    desired = normalize_field(key, desired)
+    # Booleans may be given as "yes", "true" or 1 by untyped options
+    if None not in (current, desired) and isinstance(current, bool) != isinstance(
+        desired, bool
+    ):
+        try:
+            return boolean(current) != boolean(desired)
+        except TypeError:
+            return True
+    return current != desired
+
+
+def changed_fields(current, desired):  # pylint: disable=unused-variable
+    """Returns the fields of `desired` that differ from `current`.
+
+    Fields missing from the current entity can't be compared locally and are
+    always sent along, unless they're blank.
+    """
+    return dict(
+        (key, value)
+        for key, value in desired.items()
+        if (key not in current and normalize_field(key, value) is not None)
+        or (key in current and field_changed(key, current[key], value))
+    )
 
-    if json_suffix:
-        return url + ".json"
 
-    return url
+def error_message(err):  # pylint: disable=unused-variable
+    # Samson explains rejected writes in a JSON body
+    if getattr(err, "code", None) in (400, 422):
+        try:
+            return json.load(err)
+        except ValueError:
+            pass
+    if getattr(err, "msg", None):
+        return err.msg
+    # Errors raised before Samson answered, like a refused connection, only
+    # carry a reason, often an exception of its own
+    return str(getattr(err, "reason", None) or err)
 
 
 def strip_disallowed_props(old, disallowed_props):
@@ -110,10 +293,23 @@ def strip_disallowed_props(old, disallowed_props):
 def delete_entity(
     module, http_client, base_url, entity, json_suffix=True
 ):  # pylint: disable=unused-variable
+    _state_cache.forget(entity_url(base_url, entity["permalink"]))
+
+    before = None
+    if module.check_mode or module._diff:  # pylint: disable=protected-access
+        json_key = base_url.rsplit("/", 1)[-1]
+        before = find_item_by(
+            http_client, base_url, json_key, "permalink", entity["permalink"]
+        )
+        if module.check_mode:
+            module.exit_json(
+                changed=before is not None, **diff_result(module, before, None)
+            )
+
     try:
         url = entity_url(base_url, entity["permalink"], json_suffix=json_suffix)
         http_client.delete(url, follow_redirects=True)
-        module.exit_json(changed=True)
+        module.exit_json(changed=True, **diff_result(module, before, None))
     except HTTPError as err:
         if err.code == 404:
             module.exit_json(changed=False)
@@ -121,52 +317,630 @@ def delete_entity(
         raise err
 
 
-def find_item(http_client, base_url, json_key, condition):
-    url = entity_url(base_url)
-    res = http_client.get(url)
-    items = json.load(res)[json_key]
-    for item in items:
-        if condition(item):
-            return item
-    return None
+def planned_entity(current, params):  # pylint: disable=unused-variable
+    """Returns the entity we expect once `params` are applied to `current`."""
+    planned = dict(current or {})
+    planned.update(params)
+    return planned
+
+
+def entity_diff(before, after):
+    return dict(
+        before=strip_disallowed_props(before or {}, DISALLOWED_PROPS),
+        after=strip_disallowed_props(after or {}, DISALLOWED_PROPS),
+    )
+
+
+def diff_result(module, before, after):
+    """Returns the `diff` to add to a result when running with --diff."""
+    if not module._diff:  # pylint: disable=protected-access
+        return {}
+    return dict(diff=entity_diff(before, after))
+
+
+def entities_diff(results, key, header=None):  # pylint: disable=unused-variable
+    """Returns the --diff of the changed results of a batch.
+
+    Results hold their entity under `key` and the entity as it was under
+    `before`, which is popped. `header` names the entity of a result, by
+    default `<key> <permalink>`.
+    """
+    diff = []
+    for result in results:
+        before = result.pop("before")
+        if not result["changed"]:
+            continue
+        after = result.get(key) if result.get("action") != "deleted" else None
+        if header is None:
+            name = "{} {}".format(key, result["permalink"])
+        else:
+            name = header(result, after or before)
+        diff.append(
+            dict(entity_diff(before, after), before_header=name, after_header=name)
+        )
+    return diff
+
+
+def delete_entities(
+    http_client, base_url, entities, key, check_mode=False, json_suffix=True
+):  # pylint: disable=unused-variable
+    """Deletes the entities of a batch, addressed by their `key` field.
+
+    Entities someone else deleted in the meantime count as deleted too.
+    """
+    if not check_mode:
+        for entity in entities:
+            url = entity_url(base_url, str(entity[key]), json_suffix=json_suffix)
+            try:
+                http_client.delete(url, follow_redirects=True)
+            except HTTPError as err:
+                if getattr(err, "code", None) != 404:
+                    raise
+    return dict(action="deleted", changed=True)
+
+
+class SnapshotStale(URLError):
+    """Samson changed an entity since the snapshot lookups used was taken."""
+
+    code = None
+
+    def __init__(self, msg):
+        super(SnapshotStale, self).__init__(msg)
+        self.msg = msg
+
+
+# Idle connections are kept for the whole process, samson_client sets the
+# caches up again for every task
+_connections = ConnectionPool()
+_state_cache = StateCache()
+_validators = ValidatorCache()
+
+
+def exit_if_cached(
+    module, base_url, params, item_type
+):  # pylint: disable=unused-variable
+    item = _state_cache.lookup(entity_url(base_url, params["permalink"]), params)
+    if item is not None:
+        module.exit_json(**{"changed": False, item_type: item})
+
+
+def exit_with_state(
+    module, base_url, params, item_type, item, changed, before=None
+):  # pylint: disable=unused-variable
+    # A planned change hasn't happened yet, so there's no state to remember
+    if not (module.check_mode and changed):
+        _state_cache.store(entity_url(base_url, params["permalink"]), params, item)
+
+    result = {"changed": changed, item_type: item}
+    result.update(diff_result(module, before, item))
+    module.exit_json(**result)
+
+
+def load_json(res):
+    """Decodes a JSON response, counting the time towards its request timing."""
+    timing = getattr(res, "timing", None)
+    if timing is None:
+        return json.load(res)
+    body = res.read()
+    start = timer()
+    data = json.loads(body.decode("utf-8"))
+    timing.json_decode += timer() - start
+    return data
+
+
+class RetryPolicy(object):
+    """Decides whether a failed request is worth repeating and when.
+
+    Requests that got no answer at all and answers saying Samson is busy are
+    retried up to `retries` times. Unless Samson asks for a delay through
+    Retry-After, the delays grow exponentially from `delay` with full jitter
+    so forks that failed together don't come back together.
+    """
+
+    def __init__(self, retries=3, delay=1.0, max_delay=MAX_RETRY_DELAY):
+        self.retries = retries
+        self.delay = delay
+        self.max_delay = max_delay
+
+    def backoff(self, err, attempt):
+        """Returns the seconds to wait before the next attempt, or None."""
+        if attempt >= self.retries or not is_transient(err):
+            return None
+        requested = retry_after(err)
+        if requested is not None:
+            return min(requested, self.max_delay)
+        return random.uniform(0, min(self.max_delay, self.delay * 2**attempt))
+
+
+def is_transient(err):
+    if isinstance(err, SnapshotStale):
+        return False
+    code = getattr(err, "code", None)
+    if code is not None:
+        return code in RETRY_STATUSES
+    # Without a response the connection failed or timed out, unless TLS
+    # verification failed which won't fix itself
+    reason = getattr(err, "reason", None)
+    return not isinstance(reason, (ssl.SSLError, ssl.CertificateError))
+
+
+def retry_after(err):
+    """Returns the seconds a Retry-After header asks us to wait, or None."""
+    if getattr(err, "code", None) is None:
+        return None
+    value = (err.info().get("Retry-After") or "").strip()
+    if value.isdigit():
+        return int(value)
+    date = parsedate_tz(value) if value else None
+    if date is None:
+        return None
+    return max(0, mktime_tz(date) - time.time())
+
+
+class RateLimiter(object):
+    """A token bucket allowing `rate` requests a second on average.
+
+    Up to `burst` requests go out back to back after a quiet period. Every
+    thread sharing the client draws from the same bucket.
+    """
+
+    def __init__(self, rate, burst):
+        self.rate = float(rate)
+        self.capacity = max(1, burst)
+        self.tokens = float(self.capacity)
+        self.updated = timer()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        with self.lock:
+            now = timer()
+            elapsed = now - self.updated
+            self.tokens = min(self.capacity, self.tokens + elapsed * self.rate)
+            self.updated = now
+            # Take the token right away, going into debt if needed, and pay it
+            # off outside the lock so waiting threads are served in order
+            self.tokens -= 1
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0
+        if wait > 0:
+            time.sleep(wait)
+
+
+def redirect_method(policy, method, code):
+    """Mirrors Request's follow_redirects policies.
+
+    Returns the method to repeat the request with, or None when the redirect
+    shouldn't be followed.
+    """
+    if policy in ("no", "none", False):
+        return None
+    if policy in ("urllib2", "urllib"):
+        if method in ("GET", "HEAD") and code in (301, 302, 303, 307, 308):
+            return method
+        if method == "POST" and code in (301, 302, 303):
+            return "GET"
+        return None
+    if policy == "safe" and method not in ("GET", "HEAD"):
+        return None
+    if policy not in ("all", "yes", True, "safe"):
+        return None
+
+    if code in (307, 308) or method == "HEAD":
+        return method
+    if code in (302, 303) or (code == 301 and method == "POST"):
+        return "GET"
+    return method
+
+
+class SamsonRequest(object):
+    """An HTTP client that reuses keep-alive connections between calls.
+
+    Every module run issues several requests to the same Samson host. Plain
+    urllib opens a new TCP (and TLS) connection for each of them, while this
+    client keeps finished connections in a process wide pool. Requests that
+    need features the pool doesn't implement, such as proxies or client
+    certificates, fall back to Ansible's urls.Request, which takes the same
+    arguments. It's only imported then, as importing it is slow.
+
+    Writes also drop the cached listings they affect. Idempotent requests
+    that fail while Samson is busy are repeated as the retry policy says.
+    """
+
+    retry_policy = RetryPolicy()
+    rate_limiter = None
+    # Set by samson_client when the module runs with `samson_profile`
+    profile = None
+    # Set by samson_client when the module runs with `samson_snapshot`
+    snapshot = None
+
+    def __init__(
+        self,
+        headers=None,
+        use_proxy=True,
+        timeout=10,
+        validate_certs=True,
+        url_username=None,
+        http_agent=None,
+        force_basic_auth=False,
+        follow_redirects="urllib2",
+        client_cert=None,
+        **kwargs
+    ):
+        self.headers = headers or {}
+        self.use_proxy = use_proxy
+        self.timeout = timeout
+        self.validate_certs = validate_certs
+        self.url_username = url_username
+        self.http_agent = http_agent
+        self.force_basic_auth = force_basic_auth
+        self.follow_redirects = follow_redirects
+        self.client_cert = client_cert
+        self.request_args = dict(
+            kwargs,
+            headers=headers,
+            use_proxy=use_proxy,
+            timeout=timeout,
+            validate_certs=validate_certs,
+            url_username=url_username,
+            http_agent=http_agent,
+            force_basic_auth=force_basic_auth,
+            follow_redirects=follow_redirects,
+            client_cert=client_cert,
+        )
+        self.fallback = None
+
+    def get(self, url, **kwargs):
+        return self.open("GET", url, **kwargs)
+
+    def post(self, url, data=None, **kwargs):
+        return self.open("POST", url, data=data, **kwargs)
+
+    def put(self, url, data=None, **kwargs):
+        return self.open("PUT", url, data=data, **kwargs)
+
+    def patch(self, url, data=None, **kwargs):
+        return self.open("PATCH", url, data=data, **kwargs)
+
+    def delete(self, url, **kwargs):
+        return self.open("DELETE", url, **kwargs)
+
+    def open(self, method, url, data=None, headers=None, **kwargs):
+        method = method.upper()
+        if method != "GET":
+            if self.snapshot is not None:
+                self.snapshot.before_write(self, url)
+            invalidate_listings(url)
+            forget_project_permalinks(url)
+            return self.open_pooled(method, url, data, headers, **kwargs)
+
+        if self.snapshot is not None:
+            res = self.snapshot.response(url)
+            if res is not None:
+                return res
+
+        # A part of a body can't stand in for the whole of it
+        if headers and "Range" in headers:
+            return self.open_pooled(method, url, data, headers, **kwargs)
+
+        validated = _validators.lookup(url)
+        if not validated:
+            res = self.open_pooled(method, url, data, headers, **kwargs)
+            return self.remember_validators(url, res)
+
+        headers = dict(headers or {})
+        if validated["headers"].get("ETag"):
+            headers["If-None-Match"] = validated["headers"]["ETag"]
+        if validated["headers"].get("Last-Modified"):
+            headers["If-Modified-Since"] = validated["headers"]["Last-Modified"]
+
+        try:
+            res = self.open_pooled(method, url, data, headers, **kwargs)
+        except HTTPStatusError as err:
+            if err.code != 304:
+                raise
+            body = validated["body"].encode("utf-8")
+            return BufferedResponse(url, 200, validated["headers"], body)
+        return self.remember_validators(url, res)
+
+    def remember_validators(self, url, res):
+        # Only small bodies are worth keeping. Large listings keep streaming.
+        length = int(res.headers.get("Content-Length") or MAX_VALIDATED_BODY + 1)
+        if not _validators.enabled or length > MAX_VALIDATED_BODY:
+            return res
+        if not (res.headers.get("ETag") or res.headers.get("Last-Modified")):
+            return res
+
+        body = res.read()
+        _validators.store(url, res, body)
+        return BufferedResponse(
+            url,
+            res.code,
+            dict(res.headers.items()),
+            body,
+            timing=getattr(res, "timing", None),
+        )
+
+    def open_pooled(self, method, url, data=None, headers=None, **kwargs):
+        attempt = 0
+        while True:
+            if self.rate_limiter is not None:
+                self.rate_limiter.acquire()
+            try:
+                return self.open_once(method, url, data, headers, **kwargs)
+            except URLError as err:
+                # POSTs are repeated by create_with_relookup, which first
+                # checks whether the failed one went through after all
+                if method not in IDEMPOTENT_METHODS:
+                    raise
+                delay = self.retry_policy.backoff(err, attempt)
+                if delay is None:
+                    raise
+            time.sleep(delay)
+            attempt += 1
+
+    def open_once(self, method, url, data=None, headers=None, **kwargs):
+        follow_redirects = kwargs.pop("follow_redirects", None)
+        timeout = kwargs.pop("timeout", None) or self.timeout
+        validate_certs = kwargs.pop("validate_certs", None)
+        if validate_certs is None:
+            validate_certs = self.validate_certs
+        if follow_redirects is None:
+            follow_redirects = self.follow_redirects
+
+        if any(v is not None for v in kwargs.values()) or self.needs_urllib(url):
+            return self.open_urllib(
+                method,
+                url,
+                data=data,
+                headers=headers,
+                follow_redirects=follow_redirects,
+                timeout=timeout,
+                validate_certs=validate_certs,
+                **kwargs
+            )
+
+        all_headers = {"User-Agent": self.http_agent or "ansible-httpget"}
+        all_headers.update(self.headers)
+        all_headers.update(headers or {})
+        if isinstance(data, str) and not isinstance(data, bytes):
+            data = data.encode("utf-8")
+
+        for _ in range(MAX_REDIRECTS + 1):
+            res = self.send(method, url, data, all_headers, timeout, validate_certs)
+            location = res.headers.get("Location")
+            if not 300 <= res.code < 400 or not location:
+                break
+
+            new_method = redirect_method(follow_redirects, method, res.code)
+            if new_method is None:
+                break
+            res.read()
+            url = urljoin(url, location)
+            if new_method != method:
+                data = None
+            method = new_method
+
+        if res.code >= 300:
+            body = res.read()
+            raise HTTPStatusError(url, res.code, res.msg, res.headers, io.BytesIO(body))
+
+        # Responses to writes are small and often ignored by the caller, so
+        # read them right away to hand the connection back to the pool
+        if method != "GET":
+            res.buffer()
+        return res
+
+    def open_urllib(self, method, url, data=None, **kwargs):
+        if self.fallback is None:
+            from ansible.module_utils.urls import (  # pylint: disable=import-outside-toplevel
+                Request,
+            )
+
+            self.fallback = Request(**self.request_args)
+
+        timing = self.profile.start(method, url, data) if self.profile else None
+        try:
+            res = self.fallback.open(method, url, data=data, **kwargs)
+        except HTTPStatusError as err:
+            if timing is not None:
+                timing.first_byte(err.code)
+                timing.finish()
+            raise
+        # urllib hides the connection, so only the time until the response
+        # headers arrived is known
+        if timing is not None:
+            timing.first_byte(res.code)
+            timing.finish()
+        return res
+
+    def needs_urllib(self, url):
+        if self.client_cert or self.url_username or self.force_basic_auth:
+            return True
+
+        parts = urlsplit(url)
+        if parts.scheme not in ("http", "https"):
+            return True
+        if not self.use_proxy:
+            return False
+        return parts.scheme in getproxies() and not proxy_bypass(parts.hostname)
+
+    def send(self, method, url, data, headers, timeout, validate_certs):
+        parts = urlsplit(url)
+        key = (parts.scheme, parts.netloc, validate_certs)
+        path = parts.path or "/"
+        if parts.query:
+            path += "?" + parts.query
+
+        timing = self.profile.start(method, url, data) if self.profile else None
+        while True:
+            conn, reused = _connections.acquire(key, timeout)
+            try:
+                if timing is not None:
+                    timing.reused = reused
+                    if not reused:
+                        timed_connect(conn, parts, timing)
+                conn.request(method, path, body=data, headers=headers)
+                res = conn.getresponse()
+                break
+            except (httplib.HTTPException, socket.error) as err:
+                conn.close()
+                # The server may have closed an idle keep-alive connection
+                # before it saw our request. Try again on a new connection.
+                if reused:
+                    continue
+                raise URLError(err)
+
+        if timing is not None:
+            timing.first_byte(res.status)
+
+        def release(reusable):
+            if reusable:
+                _connections.release(key, conn)
+            else:
+                conn.close()
+
+        return PooledResponse(res, url, release, timing)
+
+
+def samson_client(module, **kwargs):  # pylint: disable=unused-variable
+    # The action plugin runs every task of a batch in one process. Only the
+    # idle connections carry over, what a task listed or cached doesn't.
+    reset_listings()
+    _project_permalinks.clear()
+    cache_path = module.params.get("cache_path")
+    if cache_path:
+        _state_cache.configure(
+            cache_path, module.params["cache_ttl"], module.params["cache_max_entries"]
+        )
+        _validators.configure(
+            cache_path + ".responses", module.params["cache_max_entries"]
+        )
+    else:
+        _state_cache.configure(None, 0, 0)
+        _validators.configure(None, 0)
+
+    kwargs.setdefault("timeout", module.params["samson_timeout"])
+    http_client = SamsonRequest(
+        headers={
+            "Authorization": "Bearer {}".format(module.params["token"]),
+            "Content-Type": "application/json",
+        },
+        **kwargs
+    )
+    http_client.retry_policy = RetryPolicy(
+        module.params["samson_retries"], module.params["samson_retry_delay"]
+    )
+    if module.params["samson_rate_limit"] > 0:
+        http_client.rate_limiter = RateLimiter(
+            module.params["samson_rate_limit"], module.params["samson_rate_burst"]
+        )
+    if module.params["samson_profile"]:
+        http_client.profile = request_profile(module)
+    if module.params["samson_snapshot"]:
+        http_client.snapshot = snapshot_reads(module)
+    return http_client
+
+
+def request_profile(module):
+    # Only profiled tasks load the code timing their requests
+    try:
+        from ansible.module_utils import (  # pylint: disable=import-outside-toplevel
+            samson_profile,
+        )
+    except ImportError:
+        import samson_profile  # pylint: disable=import-outside-toplevel, import-error
+
+    profile = samson_profile.Profile()
+    samson_profile.report_timings(module, profile)
+    return profile
+
+
+def snapshot_reads(module):
+    # Only tasks that are given a snapshot load the code reading it
+    try:
+        from ansible.module_utils import (  # pylint: disable=import-outside-toplevel
+            samson_snapshot,
+        )
+    except ImportError:
+        import samson_snapshot  # pylint: disable=import-outside-toplevel, import-error
+
+    path = module.params["samson_snapshot"]
+    try:
+        snapshot = samson_snapshot.open_snapshot(path)
+    except SamsonError as err:
+        module.fail_json(changed=False, msg=err.msg)
+    if snapshot.header.get("url", "").rstrip("/") != module.params["url"].rstrip("/"):
+        msg = "Snapshot {} was taken of {}".format(path, snapshot.header.get("url"))
+        module.fail_json(changed=False, msg=msg)
+    return samson_snapshot.SnapshotReads(snapshot, module.params["url"])
 
 
 def find_project_by_id(
     http_client, base_url, project_id
 ):  # pylint: disable=unused-variable
+    """Returns the project with `project_id`, or None if there's none.
+
+    Samson finds projects by id as well as by permalink, so this is a single
+    request rather than a scan of every project.
+    """
     base_url = "/".join([base_url, "projects"])
-    condition = lambda project: project["id"] == project_id
-    return find_item(http_client, base_url, "projects", condition)
+    listing = cached_listing(base_url)
+    if listing is not None:
+        return listing.by_id.get(project_id)
+
+    try:
+        res = http_client.get(entity_url(base_url, str(project_id)))
+    except HTTPError as err:
+        if getattr(err, "code", None) == 404:
+            return None
+        raise
+    return load_json(res)["project"]
+
+
+# Permalinks of the projects looked up by id, they rarely change
+_project_permalinks = {}
+PROJECT_URL_REGEX = re.compile(r"/projects(/[^/]+)?(\.json)?$")
+
+
+def find_project_permalink(http_client, base_url, project_id):
+    permalink = _project_permalinks.get(project_id)
+    if permalink is None:
+        project = find_project_by_id(http_client, base_url, project_id)
+        if project is None:
+            return None
+        permalink = _project_permalinks[project_id] = project["permalink"]
+    return permalink
+
+
+def forget_project_permalinks(url):
+    # A project that's written to may have been given another permalink
+    if PROJECT_URL_REGEX.search(urlsplit(url).path):
+        _project_permalinks.clear()
+
+
+def project_permalink_param(module, http_client):  # pylint: disable=unused-variable
+    """Returns the permalink of the project a task names.
+
+    Tasks name it by `project_permalink` or by `project_id`.
+    """
+    if module.params.get("project_permalink"):
+        return module.params["project_permalink"]
+
+    project_id = module.params["project_id"]
+    permalink = find_project_permalink(http_client, module.params["url"], project_id)
+    if permalink is None:
+        module.fail_json(
+            changed=False, msg="Project {} doesn't exist".format(project_id)
+        )
+    return permalink
 
 
 # Samson sanitizes permalinks. It transforms spaces and underscores to dashes.
 # It's better to fail in this case as the permalink is the de-facto identifier.
 def validate_permalink(module):  # pylint: disable=unused-variable
-    VALID_PERMALINK_REGEX = "^[A-Za-z0-9-]+$"
-    if not bool(re.search(VALID_PERMALINK_REGEX, module.params["permalink"])):
+    if not is_valid_permalink(module.params["permalink"]):
         msg = "Permalink should match `{}`".format(VALID_PERMALINK_REGEX)
         module.exit_json(changed=False, msg=msg)
 
 
-def extract_html_errors(res):
-    html = res.read()
-    lines = html.split("\n")
-    err_line_idx = None
-    for idx, line in enumerate(lines):
-        if re.search("There was an error", line):
-            err_line_idx = idx
-
-    if not err_line_idx:
-        return []
-
-    err_line = lines[err_line_idx + 1]
-    errors = (
-        err_line.strip()
-        .replace("<ul>", "")
-        .replace("</ul>", "")
-        .replace("<li>", "")
-        .split("</li>")
-    )
-
-    # Filter out any whitespace entries
-    return [e for e in errors if e != ""]
+def is_valid_permalink(permalink):
+    return bool(re.search(VALID_PERMALINK_REGEX, permalink))